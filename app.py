@@ -116,7 +116,7 @@ def start_app():
         logger.info(f"GPIO habilitado: {Config.GPIO_ENABLED}")
         
         # Inicializar base de datos
-        db_manager.init_db()
+        db_manager.init_database()
         
         # Cargar configuración de máquina
         config_manager.load_config()
@@ -135,6 +135,8 @@ def start_app():
         logger.error(f"Error al iniciar la aplicación: {e}")
         raise
     finally:
+        # Vaciar logs pendientes y cerrar conexiones
+        db_manager.close()
         logger.info("Aplicación cerrada")
 
 if __name__ == '__main__':
@@ -12,6 +12,27 @@ class Config:
     
     # Base de datos
     DATABASE_PATH = 'database/vending_machine.db'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))  # Conexiones reutilizables (0 = sin pool)
+    DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT', 5.0))  # Segundos esperando un bloqueo
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 2))  # Conexiones de solo lectura para informes
+    DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+    DB_ASYNC_LOGS = os.environ.get('DB_ASYNC_LOGS', 'True').lower() == 'true'  # Logs en segundo plano
+    DB_LOG_QUEUE_SIZE = int(os.environ.get('DB_LOG_QUEUE_SIZE', 1000))
+    DB_LOG_FLUSH_MS = int(os.environ.get('DB_LOG_FLUSH_MS', 200))  # Commit agrupado cada N ms
+    DB_LOG_BATCH_SIZE = int(os.environ.get('DB_LOG_BATCH_SIZE', 100))  # ... o cada M filas
+    DB_CATALOG_CACHE = os.environ.get('DB_CATALOG_CACHE', 'True').lower() == 'true'  # Productos en memoria
+    DB_ARCHIVE_DIR = os.environ.get('DB_ARCHIVE_DIR', 'database/archive')  # Un fichero por mes archivado
+    DB_ARCHIVE_KEEP_MONTHS = int(os.environ.get('DB_ARCHIVE_KEEP_MONTHS', 3))  # Meses cerrados que quedan en la base principal
+    DB_ARCHIVE_CHUNK_SIZE = int(os.environ.get('DB_ARCHIVE_CHUNK_SIZE', 1000))  # Filas movidas por transacción
+    DB_BACKUP_DIR = os.environ.get('DB_BACKUP_DIR', 'database/backups')
+    DB_BACKUP_PAGES_PER_STEP = int(os.environ.get('DB_BACKUP_PAGES_PER_STEP', 256))  # Páginas copiadas por paso
+    DB_BACKUP_STEP_PAUSE_MS = int(os.environ.get('DB_BACKUP_STEP_PAUSE_MS', 10))  # Pausa entre pasos
+    DB_BACKUP_KEEP_FULL = int(os.environ.get('DB_BACKUP_KEEP_FULL', 3))  # Copias completas conservadas
+    DB_BACKUP_FULL_EVERY = int(os.environ.get('DB_BACKUP_FULL_EVERY', 6))  # Diferenciales antes de otra completa
+    DB_BACKUP_MAX_RESTARTS = int(os.environ.get('DB_BACKUP_MAX_RESTARTS', 3))  # Reinicios por escrituras antes de copiar en un paso
+    SALES_HISTORY_MAX_PAGE = int(os.environ.get('SALES_HISTORY_MAX_PAGE', 500))  # Ventas máximas por página del historial
+    COLUMNAR_EXPORT_DIR = os.environ.get('COLUMNAR_EXPORT_DIR', 'exports/columnar')  # Ventas en columnas NumPy por máquina y mes
+    MACHINE_ID = os.environ.get('MACHINE_ID', 'maquina-1')  # Identificador de la máquina en las exportaciones
     
     # Configuración de pagos
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
@@ -25,11 +46,22 @@ class Config:
     # Configuración del sistema
     PLATFORM = 'raspberry' # os.environ.get('PLATFORM', 'raspberry')
     GPIO_ENABLED = os.environ.get('GPIO_ENABLED', 'False').lower() == 'true'
+    HARDWARE_BACKEND = os.environ.get('HARDWARE_BACKEND', 'gpio')  # 'gpio' o 'simulated' (reloj virtual, sin hardware)
     SIMULATE_PAYMENTS = True  # Cambiar a False para usar TPV real
     TPV_ENABLED = os.environ.get('TPV_ENABLED', 'True').lower() == 'true'
+    CONFIG_FLUSH_MS = int(os.environ.get('CONFIG_FLUSH_MS', 500))  # Escritura agrupada de machine_config.json (0 = inmediata)
+    RELAY_MATRIX_RT_PRIORITY = int(os.environ.get('RELAY_MATRIX_RT_PRIORITY', 50))  # SCHED_FIFO del hilo de la matriz (0 = prioridad normal)
+    RELAY_MAX_CONCURRENT = int(os.environ.get('RELAY_MAX_CONCURRENT', 2))  # Relés que pueden activarse dentro de una ventana de inrush
+    RELAY_INRUSH_MS = int(os.environ.get('RELAY_INRUSH_MS', 100))  # Duración del pico de corriente al activar un relé
+    RELAY_MIN_SPACING_MS = int(os.environ.get('RELAY_MIN_SPACING_MS', 50))  # Separación mínima entre activaciones
+    HARDWARE_WORKERS = int(os.environ.get('HARDWARE_WORKERS', 4))  # Hilos compartidos por los actores de puerta
+    DOOR_AUTO_CLOSE = os.environ.get('DOOR_AUTO_CLOSE', 'True').lower() == 'true'  # El servidor desactiva el relé tras open_time
+    CONFIG_RELOAD_INTERVAL = float(os.environ.get('CONFIG_RELOAD_INTERVAL', 2.0))  # Segundos entre comprobaciones de cambios en disco (0 = nunca)
     
     # Configuración del servidor
     HOST = os.environ.get('HOST', '127.0.0.1')
     PORT = int(os.environ.get('PORT', 5000))
     WINDOW_WIDTH = int(os.environ.get('WINDOW_WIDTH', 1024))
     WINDOW_HEIGHT = int(os.environ.get('WINDOW_HEIGHT', 768))
+    API_RESPONSE_CACHE = os.environ.get('API_RESPONSE_CACHE', 'True').lower() == 'true'  # JSON ya serializado por versión
+    API_RESPONSE_CACHE_ENTRIES = int(os.environ.get('API_RESPONSE_CACHE_ENTRIES', 32))  # Respuestas guardadas como máximo
@@ -0,0 +1,122 @@
+"""
+Actores por puerta para los comandos de hardware
+
+Cada puerta tiene un buzón (deque) de comandos; un pool compartido de hilos
+procesa los buzones con la regla de que una puerta solo está en un hilo a la
+vez. Los comandos de una misma puerta se ejecutan estrictamente en orden de
+llegada y los de puertas distintas en paralelo. Tras cada comando la puerta
+vuelve al final de la cola del pool si le quedan comandos, de modo que una
+puerta con mucho trabajo no acapara los hilos.
+
+submit() devuelve un Future con el resultado. Si se llama desde el propio actor
+de la puerta (un comando que lanza otro de la misma puerta) o el pool no usa
+hilos (backend simulado), el comando se ejecuta en el acto.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class DoorActorPool:
+    """Buzones de comandos por puerta servidos por un pool compartido"""
+
+    def __init__(self, max_workers: int = 4, threaded: bool = True, name: str = 'door-actor'):
+        self.threaded = threaded
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=name) if threaded else None
+        self._mailboxes: Dict[str, Deque] = {}
+        self._scheduled: Set[str] = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'inline': 0, 'max_queue': 0}
+
+    def current_door(self) -> Optional[str]:
+        """Puerta cuyo actor está ejecutando el hilo actual (None fuera de un actor)"""
+        return getattr(self._local, 'door_id', None)
+
+    def submit(self, door_id: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Encolar fn(*args, **kwargs) en el buzón de una puerta"""
+        future = Future()
+        if not self.threaded or self.current_door() == door_id:
+            with self._lock:
+                self._stats['submitted'] += 1
+                self._stats['inline'] += 1
+            self._run(door_id, fn, args, kwargs, future)
+            return future
+
+        with self._lock:
+            self._stats['submitted'] += 1
+            mailbox = self._mailboxes.get(door_id)
+            if mailbox is None:
+                mailbox = self._mailboxes[door_id] = deque()
+            mailbox.append((fn, args, kwargs, future))
+            if len(mailbox) > self._stats['max_queue']:
+                self._stats['max_queue'] = len(mailbox)
+            if door_id in self._scheduled:
+                return future
+            self._scheduled.add(door_id)
+        self._executor.submit(self._drain, door_id)
+        return future
+
+    def call(self, door_id: str, fn: Callable[..., Any], *args, timeout: float = None, **kwargs) -> Any:
+        """submit() y esperar el resultado"""
+        return self.submit(door_id, fn, *args, **kwargs).result(timeout)
+
+    def _run(self, door_id: str, fn: Callable[..., Any], args, kwargs, future: Future):
+        if not future.set_running_or_notify_cancel():
+            return
+        previous = self.current_door()
+        self._local.door_id = door_id
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            logger.error(f"Error en comando de puerta {door_id}: {e}")
+            with self._lock:
+                self._stats['failed'] += 1
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._stats['completed'] += 1
+            future.set_result(result)
+        finally:
+            self._local.door_id = previous
+
+    def _drain(self, door_id: str):
+        """Ejecutar un comando de la puerta y devolverla al pool si le quedan más"""
+        with self._lock:
+            fn, args, kwargs, future = self._mailboxes[door_id].popleft()
+        self._run(door_id, fn, args, kwargs, future)
+        with self._lock:
+            if self._mailboxes[door_id]:
+                resubmit = True
+            else:
+                resubmit = False
+                self._scheduled.discard(door_id)
+                del self._mailboxes[door_id]
+        if resubmit:
+            self._executor.submit(self._drain, door_id)
+
+    def pending(self, door_id: str = None) -> int:
+        """Comandos en cola (de una puerta o de todas)"""
+        with self._lock:
+            if door_id is not None:
+                return len(self._mailboxes.get(door_id, ()))
+            return sum(len(mailbox) for mailbox in self._mailboxes.values())
+
+    def shutdown(self, wait: bool = False):
+        """Dejar de aceptar comandos (los ya encolados terminan)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Obtener métricas (comandos enviados, completados, fallidos, cola máxima)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = sum(len(mailbox) for mailbox in self._mailboxes.values())
+            stats['busy_doors'] = len(self._scheduled)
+        stats['workers'] = self.max_workers
+        return stats
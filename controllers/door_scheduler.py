@@ -0,0 +1,203 @@
+"""
+Planificador de cierres automáticos de puertas
+
+Un único hilo mantiene un montículo de plazos (deadline, secuencia, entrada) y
+duerme en una Condition hasta el plazo más próximo; al despertar ejecuta todos
+los que han vencido. Programar, ampliar o cancelar es O(log n) y no crea hilos
+por puerta. Las entradas canceladas o sustituidas se marcan y se descartan al
+llegar a la cima del montículo (borrado perezoso).
+
+Cada clave (door_id) tiene como mucho una entrada pendiente: volver a
+programarla sustituye la anterior.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledCall:
+    """Entrada del planificador; callback(entrada) se ejecuta al vencer el plazo"""
+
+    __slots__ = ('key', 'deadline', 'callback', 'cancelled', '_scheduler')
+
+    def __init__(self, scheduler: 'DoorScheduler', key: str, deadline: float,
+                 callback: Callable[['ScheduledCall'], None]):
+        self._scheduler = scheduler
+        self.key = key
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> bool:
+        """Cancelar esta entrada si sigue pendiente"""
+        return self._scheduler.cancel(self.key, self)
+
+    def remaining(self) -> float:
+        """Segundos hasta el plazo (0 si ya venció)"""
+        return max(0.0, self.deadline - self._scheduler.clock())
+
+    def __repr__(self):
+        return f"ScheduledCall({self.key!r}, deadline={self.deadline:.3f})"
+
+
+class DoorScheduler:
+    """Plazos por clave servidos por un único hilo"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, name: str = 'door-scheduler',
+                 threaded: bool = True):
+        self.clock = clock
+        self.name = name
+        # Sin hilo (reloj virtual) quien avanza el reloj llama a run_due()
+        self.threaded = threaded
+        self._heap: List = []
+        self._pending: Dict[str, ScheduledCall] = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._stats = {'scheduled': 0, 'fired': 0, 'cancelled': 0, 'max_lateness_ms': 0.0}
+
+    def _ensure_thread(self):
+        # Llamado con self._cond adquirido
+        if not self.threaded:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _push(self, entry: ScheduledCall):
+        # Llamado con self._cond adquirido
+        previous = self._pending.get(entry.key)
+        if previous is not None:
+            previous.cancelled = True
+        self._pending[entry.key] = entry
+        heapq.heappush(self._heap, (entry.deadline, next(self._counter), entry))
+        self._ensure_thread()
+        self._cond.notify()
+
+    def schedule(self, key: str, delay: float, callback: Callable[[ScheduledCall], None]) -> ScheduledCall:
+        """Programar callback dentro de delay segundos, sustituyendo lo pendiente para key"""
+        with self._cond:
+            entry = ScheduledCall(self, key, self.clock() + max(0.0, delay), callback)
+            self._push(entry)
+            self._stats['scheduled'] += 1
+            return entry
+
+    def extend(self, key: str, seconds: float) -> Optional[ScheduledCall]:
+        """Retrasar seconds segundos el plazo pendiente de key; None si no hay ninguno"""
+        with self._cond:
+            current = self._pending.get(key)
+            if current is None:
+                return None
+            entry = ScheduledCall(self, key, current.deadline + seconds, current.callback)
+            self._push(entry)
+            return entry
+
+    def cancel(self, key: str, entry: ScheduledCall = None) -> bool:
+        """Cancelar lo pendiente para key (solo si es entry, cuando se indica)"""
+        with self._cond:
+            current = self._pending.get(key)
+            if current is None or (entry is not None and current is not entry):
+                return False
+            current.cancelled = True
+            del self._pending[key]
+            self._stats['cancelled'] += 1
+            # No hace falta despertar al hilo: la entrada se descarta al llegar a la cima
+            return True
+
+    def cancel_all(self) -> List[str]:
+        """Cancelar todo lo pendiente; devuelve las claves canceladas"""
+        with self._cond:
+            keys = list(self._pending)
+            for entry in self._pending.values():
+                entry.cancelled = True
+            self._pending.clear()
+            self._heap.clear()
+            self._stats['cancelled'] += len(keys)
+            return keys
+
+    def get(self, key: str) -> Optional[ScheduledCall]:
+        """Entrada pendiente de key, o None"""
+        with self._cond:
+            return self._pending.get(key)
+
+    def remaining(self, key: str) -> Optional[float]:
+        """Segundos hasta el plazo de key, o None si no hay nada pendiente"""
+        entry = self.get(key)
+        return entry.remaining() if entry is not None else None
+
+    def _due(self) -> Optional[List[ScheduledCall]]:
+        """Esperar hasta que venza algún plazo; None al detenerse"""
+        with self._cond:
+            while not self._stopped:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                now = self.clock()
+                timeout = self._heap[0][0] - now
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+                return self._pop_due(now)
+            return None
+
+    def _pop_due(self, now: float) -> List[ScheduledCall]:
+        # Llamado con self._cond adquirido
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)[2]
+            if not entry.cancelled:
+                del self._pending[entry.key]
+                due.append(entry)
+                lateness = (now - entry.deadline) * 1000
+                if lateness > self._stats['max_lateness_ms']:
+                    self._stats['max_lateness_ms'] = lateness
+        self._stats['fired'] += len(due)
+        return due
+
+    def _fire(self, due: List[ScheduledCall]):
+        # Los callbacks se ejecutan sin el lock: pueden volver a programar
+        for entry in due:
+            try:
+                entry.callback(entry)
+            except Exception as e:
+                logger.error(f"Error en tarea programada de {entry.key}: {e}")
+
+    def run_due(self) -> int:
+        """Ejecutar ya lo vencido según self.clock (modo sin hilo); devuelve cuántas"""
+        with self._cond:
+            due = self._pop_due(self.clock())
+        self._fire(due)
+        return len(due)
+
+    def _run(self):
+        while True:
+            due = self._due()
+            if due is None:
+                return
+            self._fire(due)
+
+    def stop(self, timeout: float = 1.0):
+        """Detener el hilo descartando lo pendiente"""
+        self.cancel_all()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas (programadas, ejecutadas, canceladas, retraso máximo)"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
@@ -0,0 +1,234 @@
+"""
+Sensores de puerta por interrupciones
+
+Cada sensor se registra como un Button de gpiozero (o como fuente simulada si
+no hay GPIO) cuyos callbacks de flanco solo anotan (secuencia, instante, puerta,
+nivel) en un buffer circular y despiertan al hilo despachador. El buffer es un
+deque con maxlen: append y popleft son atómicos en CPython, así que los hilos de
+interrupción no toman ningún lock y, si el despachador se retrasa, se pierden
+los flancos más antiguos (se cuentan por los huecos en la secuencia).
+
+El antirrebote es de flanco inicial: el primer cambio se entrega en el acto y
+durante debounce_ms se ignoran los rebotes; al acabar la ventana, si el último
+nivel leído no coincide con el entregado se emite la corrección. Así la
+latencia de detección es la del despachador (milisegundos) y no la ventana.
+"""
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RING_SIZE = 256  # Flancos guardados como máximo sin despachar
+
+
+class DoorEdge(NamedTuple):
+    """Flanco de un sensor de puerta"""
+    seq: int
+    timestamp: float  # time.monotonic() al recibir la interrupción
+    door_id: str
+    is_open: bool
+
+
+class EdgeRingBuffer:
+    """Buffer circular de flancos sin locks (varios productores, un consumidor)"""
+
+    def __init__(self, capacity: int = DEFAULT_RING_SIZE):
+        self.capacity = capacity
+        self._edges = deque(maxlen=capacity)
+        self._seq = itertools.count()
+
+    def push(self, door_id: str, is_open: bool, timestamp: float = None) -> DoorEdge:
+        edge = DoorEdge(next(self._seq), time.monotonic() if timestamp is None else timestamp,
+                        door_id, is_open)
+        self._edges.append(edge)
+        return edge
+
+    def drain(self) -> List[DoorEdge]:
+        """Sacar todos los flancos disponibles, en orden de llegada"""
+        edges = []
+        while True:
+            try:
+                edges.append(self._edges.popleft())
+            except IndexError:
+                return edges
+
+    def __len__(self):
+        return len(self._edges)
+
+
+class SimulatedSensor:
+    """Fuente de flancos para desarrollo: set_open() hace de interrupción"""
+
+    def __init__(self, door_id: str, pin: int, on_edge: Callable[[bool], None], is_open: bool = False):
+        self.door_id = door_id
+        self.pin = pin
+        self.is_open = is_open
+        self._on_edge = on_edge
+
+    def set_open(self, is_open: bool):
+        self.is_open = is_open
+        self._on_edge(is_open)
+
+    def close(self):
+        pass
+
+
+def gpio_sensor(door_id: str, pin: int, on_edge: Callable[[bool], None], use_gpio: bool = True):
+    """Sensor gpiozero (Button) o, si no hay GPIO, SimulatedSensor; devuelve (sensor, is_open)"""
+    if use_gpio:
+        try:
+            from gpiozero import Button
+            # Contacto a GND con pull-up: pulsado = puerta cerrada
+            sensor = Button(pin, pull_up=True)
+            sensor.when_pressed = lambda: on_edge(False)
+            sensor.when_released = lambda: on_edge(True)
+            return sensor, not sensor.is_pressed
+        except Exception as e:
+            logger.warning(f"Sensor de puerta {door_id} en pin {pin} no disponible ({e}), usando simulación")
+    return SimulatedSensor(door_id, pin, on_edge), False
+
+
+class DoorSensorMonitor:
+    """Recoge flancos de los sensores y los reparte desde un único hilo"""
+
+    def __init__(self, debounce_ms: float = 200, capacity: int = DEFAULT_RING_SIZE,
+                 use_gpio: bool = True, clock: Callable[[], float] = time.monotonic,
+                 sensor_factory: Callable = None):
+        self.debounce = debounce_ms / 1000.0
+        self.use_gpio = use_gpio
+        self.clock = clock
+        # sensor_factory(door_id, pin, on_edge) -> (sensor, is_open); por defecto gpiozero
+        self.sensor_factory = sensor_factory or (
+            lambda door_id, pin, on_edge: gpio_sensor(door_id, pin, on_edge, self.use_gpio)
+        )
+        self.ring = EdgeRingBuffer(capacity)
+        self.sensors: Dict[str, object] = {}
+        self._state: Dict[str, bool] = {}       # Nivel entregado a los suscriptores
+        self._raw: Dict[str, bool] = {}         # Último nivel leído (aunque sea rebote)
+        self._quiet_until: Dict[str, float] = {}
+        self._subscribers: List[Callable[[str, bool, float], None]] = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_seq = 0
+        self._stats = {'edges': 0, 'delivered': 0, 'bounces': 0, 'dropped': 0, 'max_latency_ms': 0.0}
+
+    def attach(self, door_id: str, pin: int) -> bool:
+        """Registrar el sensor de una puerta; devuelve False si se usa la fuente simulada de desarrollo"""
+        def on_edge(is_open: bool):
+            self.ring.push(door_id, is_open, self.clock())
+            self._wakeup.set()
+
+        sensor, is_open = self.sensor_factory(door_id, pin, on_edge)
+        self.sensors[door_id] = sensor
+        self._state[door_id] = self._raw[door_id] = is_open
+        return not isinstance(sensor, SimulatedSensor)
+
+    def simulate_edge(self, door_id: str, is_open: bool) -> bool:
+        """Inyectar un flanco en un sensor simulado (SimulatedSensor o del backend simulado)"""
+        sensor = self.sensors.get(door_id)
+        if not hasattr(sensor, 'set_open'):
+            return False
+        sensor.set_open(is_open)
+        return True
+
+    def is_open(self, door_id: str) -> Optional[bool]:
+        """Último estado entregado de una puerta (None si no tiene sensor)"""
+        return self._state.get(door_id)
+
+    def subscribe(self, callback: Callable[[str, bool, float], None]):
+        """Registrar callback(door_id, is_open, timestamp) para cada cambio confirmado"""
+        self._subscribers.append(callback)
+
+    def start(self):
+        """Arrancar el hilo despachador"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='door-sensors', daemon=True)
+            self._thread.start()
+
+    def _deliver(self, door_id: str, is_open: bool, timestamp: float):
+        self._state[door_id] = is_open
+        self._stats['delivered'] += 1
+        latency = (self.clock() - timestamp) * 1000
+        if latency > self._stats['max_latency_ms']:
+            self._stats['max_latency_ms'] = latency
+        for callback in list(self._subscribers):
+            try:
+                callback(door_id, is_open, timestamp)
+            except Exception as e:
+                logger.error(f"Error en suscriptor de sensor de puerta {door_id}: {e}")
+
+    def _process(self, edges: List[DoorEdge]):
+        for edge in edges:
+            self._stats['edges'] += 1
+            if edge.seq > self._next_seq:
+                self._stats['dropped'] += edge.seq - self._next_seq
+            self._next_seq = edge.seq + 1
+
+            door_id = edge.door_id
+            self._raw[door_id] = edge.is_open
+            if edge.timestamp < self._quiet_until.get(door_id, 0.0):
+                self._stats['bounces'] += 1
+                continue
+            if edge.is_open == self._state.get(door_id):
+                continue
+            self._quiet_until[door_id] = edge.timestamp + self.debounce
+            self._deliver(door_id, edge.is_open, edge.timestamp)
+
+    def _settle(self, now: float) -> Optional[float]:
+        """Cerrar ventanas de rebote vencidas; devuelve el próximo vencimiento"""
+        next_deadline = None
+        for door_id, until in list(self._quiet_until.items()):
+            if until > now:
+                next_deadline = until if next_deadline is None else min(next_deadline, until)
+                continue
+            del self._quiet_until[door_id]
+            raw = self._raw.get(door_id)
+            if raw is not None and raw != self._state.get(door_id):
+                # El rebote terminó en el nivel contrario: se entrega la corrección
+                self._quiet_until[door_id] = now + self.debounce
+                self._deliver(door_id, raw, until)
+                next_deadline = now + self.debounce if next_deadline is None else min(next_deadline, now + self.debounce)
+        return next_deadline
+
+    def process_pending(self):
+        """Procesar lo que haya en el buffer (lo hace el hilo; útil en pruebas)"""
+        self._process(self.ring.drain())
+        return self._settle(self.clock())
+
+    def _run(self):
+        timeout = None
+        while not self._stop.is_set():
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            try:
+                next_deadline = self.process_pending()
+            except Exception as e:
+                logger.error(f"Error procesando flancos de sensores: {e}")
+                next_deadline = None
+            timeout = None if next_deadline is None else max(0.0, next_deadline - self.clock())
+
+    def stop(self, timeout: float = 1.0):
+        """Detener el despachador y liberar los sensores"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        for door_id, sensor in self.sensors.items():
+            try:
+                sensor.close()
+            except Exception as e:
+                logger.warning(f"Error cerrando sensor de puerta {door_id}: {e}")
+        self.sensors.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        """Obtener métricas (flancos, entregados, rebotes, perdidos, latencia máxima)"""
+        stats = dict(self._stats)
+        stats['buffered'] = len(self.ring)
+        stats['sensors'] = len(self.sensors)
+        return stats
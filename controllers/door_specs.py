@@ -0,0 +1,142 @@
+"""
+Especificaciones de puertas precompiladas
+
+La sección 'doors' de machine_config.json se compila una vez (al cargar o
+recargar la configuración) en objetos DoorSpec con __slots__, guardados en una
+lista indexada por un índice denso de puerta. Las rutas calientes del
+controlador de hardware leen atributos en lugar de recorrer los dicts
+anidados de la configuración, y la validación se hace solo al compilar.
+"""
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPEN_TIME = 3.0  # Segundos si no hay tiempo por puerta ni global
+MAX_RELAY_INDEX = 255    # El protocolo de matriz envía el índice en 8 bits
+
+
+class DoorSpec:
+    """Datos físicos ya validados de una puerta"""
+
+    __slots__ = ('index', 'door_id', 'gpio_pin', 'sensor_pin', 'relay_matrix',
+                 'relay_index', 'open_time', 'active_high')
+
+    def __init__(self, index: int, door_id: str, gpio_pin: Optional[int], sensor_pin: Optional[int],
+                 relay_matrix: bool, relay_index: int, open_time: float, active_high: bool):
+        self.index = index
+        self.door_id = door_id
+        self.gpio_pin = gpio_pin
+        self.sensor_pin = sensor_pin
+        self.relay_matrix = relay_matrix
+        self.relay_index = relay_index
+        self.open_time = open_time
+        self.active_high = active_high
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"DoorSpec({self.door_id!r}, gpio_pin={self.gpio_pin}, open_time={self.open_time})"
+
+
+class DoorSpecTable:
+    """Lista de DoorSpec indexada por índice denso, con mapa door_id -> índice"""
+
+    __slots__ = ('specs', 'index', 'default_open_time', 'min_open_time', 'max_open_time', 'errors')
+
+    def __init__(self, specs: List[DoorSpec], default_open_time: float,
+                 min_open_time: float, max_open_time: float, errors: List[str]):
+        self.specs = specs
+        self.index = {spec.door_id: spec.index for spec in specs}
+        self.default_open_time = default_open_time
+        self.min_open_time = min_open_time
+        self.max_open_time = max_open_time
+        self.errors = errors
+
+    def get(self, door_id: str) -> Optional[DoorSpec]:
+        """DoorSpec de una puerta, o None si no existe"""
+        index = self.index.get(door_id)
+        return self.specs[index] if index is not None else None
+
+    def __getitem__(self, index: int) -> DoorSpec:
+        return self.specs[index]
+
+    def __contains__(self, door_id: str) -> bool:
+        return door_id in self.index
+
+    def __iter__(self) -> Iterator[DoorSpec]:
+        return iter(self.specs)
+
+    def __len__(self):
+        return len(self.specs)
+
+
+def _optional_pin(value: Any, door_id: str, field: str, errors: List[str]) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    try:
+        pin = int(value)
+    except (TypeError, ValueError):
+        errors.append(f"Puerta {door_id}: {field} no válido ({value!r})")
+        return None
+    if pin < 0:
+        errors.append(f"Puerta {door_id}: {field} negativo ({pin})")
+        return None
+    return pin
+
+
+def compile_door_specs(config: Dict[str, Any], fallback_open_time: float = DEFAULT_OPEN_TIME) -> DoorSpecTable:
+    """
+    Compilar la configuración de puertas en una DoorSpecTable
+
+    El tiempo de apertura se resuelve aquí con la misma prioridad que antes:
+    open_time de la puerta > door_settings.default_open_time > fallback_open_time.
+    Los errores de validación se registran en el log y en table.errors; la
+    puerta se compila igualmente con el campo erróneo anulado.
+    """
+    door_settings = config.get('machine', {}).get('door_settings', {})
+    errors: List[str] = []
+
+    def seconds(value, label, default):
+        try:
+            return float(value) if value is not None else default
+        except (TypeError, ValueError):
+            errors.append(f"{label} no válido ({value!r})")
+            return default
+
+    min_time = seconds(door_settings.get('min_open_time'), 'min_open_time', 1.0)
+    max_time = seconds(door_settings.get('max_open_time'), 'max_open_time', 10.0)
+    default_time = seconds(door_settings.get('default_open_time'), 'default_open_time', fallback_open_time)
+
+    specs = []
+    for door_id, door_info in config.get('doors', {}).items():
+        gpio_pin = _optional_pin(door_info.get('gpio_pin'), door_id, 'gpio_pin', errors)
+        sensor_pin = _optional_pin(door_info.get('sensor_pin'), door_id, 'sensor_pin', errors)
+
+        relay_index = door_info.get('relay_index', 0) or 0
+        if not isinstance(relay_index, int) or not 0 <= relay_index <= MAX_RELAY_INDEX:
+            errors.append(f"Puerta {door_id}: relay_index fuera de rango ({relay_index!r})")
+            relay_index = 0
+
+        open_time = default_time
+        if door_info.get('open_time') is not None:
+            open_time = seconds(door_info.get('open_time'), f"Puerta {door_id}: open_time", default_time)
+        if open_time <= 0:
+            errors.append(f"Puerta {door_id}: open_time debe ser positivo ({open_time})")
+            open_time = default_time
+
+        specs.append(DoorSpec(
+            index=len(specs),
+            door_id=door_id,
+            gpio_pin=gpio_pin,
+            sensor_pin=sensor_pin,
+            relay_matrix=bool(door_info.get('relay_matrix', False)),
+            relay_index=relay_index,
+            open_time=open_time,
+            active_high=bool(door_info.get('active_high', False))
+        ))
+
+    for error in errors:
+        logger.warning(f"Configuración de puertas: {error}")
+    return DoorSpecTable(specs, default_time, min_time, max_time, errors)
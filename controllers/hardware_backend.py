@@ -0,0 +1,325 @@
+"""
+Backends de hardware del controlador de puertas
+
+HardwareController no habla directamente con gpiozero/RPi.GPIO sino con un
+backend que crea relés, sensores y botones, escribe pines y da el reloj:
+
+- GpioBackend: el hardware real (gpiozero + RPi.GPIO o su mock) con
+  time.monotonic y time.sleep; los componentes usan sus propios hilos.
+- SimulatedBackend: todo en memoria y determinista. El tiempo es un
+  VirtualClock que solo avanza con advance()/sleep(); los cambios de pin se
+  guardan en un PinTimeline y cada sensor es una máquina de estados
+  programable (guion de flancos o comportamiento ante el relé). No hay hilos:
+  el planificador de cierres y el despachador de sensores se ejecutan en cada
+  paso del reloj, así que miles de ciclos de puerta tardan milisegundos.
+"""
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class HardwareBackend:
+    """Interfaz de los backends de hardware"""
+
+    simulated = False
+    threaded = True      # Los componentes arrancan sus propios hilos
+    drives_pins = False  # output() llega a un pin (real o simulado)
+
+    def now(self) -> float:
+        """Reloj monótono en segundos"""
+        raise NotImplementedError
+
+    def sleep(self, seconds: float):
+        raise NotImplementedError
+
+    def output(self, pin: int, level: int):
+        """Escribir un nivel en un pin"""
+        raise NotImplementedError
+
+    def create_relay(self, door_id: str, pin: int, active_high: bool = False):
+        """Relé de una puerta (on(), off(), value, close())"""
+        raise NotImplementedError
+
+    def create_sensor(self, door_id: str, pin: int, on_edge: Callable[[bool], None]) -> Tuple[Any, bool]:
+        """Sensor de una puerta que llama on_edge(is_open) en cada flanco; devuelve (sensor, is_open)"""
+        raise NotImplementedError
+
+    def create_button(self, pin: int):
+        """Pulsador con pull-up (is_pressed, close())"""
+        raise NotImplementedError
+
+    def add_tick(self, callback: Callable[[], Any]):
+        """Trabajo a ejecutar en cada paso del reloj (solo backends sin hilos)"""
+
+    def cleanup(self):
+        """Liberar los pines antes de inicializar"""
+
+
+class GpioBackend(HardwareBackend):
+    """Hardware real a través de gpiozero y RPi.GPIO (o MockGPIO en desarrollo)"""
+
+    def __init__(self, gpio, gpio_available: bool, use_sensors: bool = True):
+        self.gpio = gpio
+        self.drives_pins = gpio_available
+        self.use_sensors = use_sensors
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def output(self, pin: int, level: int):
+        self.gpio.output(pin, level)
+
+    def create_relay(self, door_id: str, pin: int, active_high: bool = False):
+        from gpiozero import OutputDevice
+        return OutputDevice(pin, active_high=active_high, initial_value=False)
+
+    def create_sensor(self, door_id: str, pin: int, on_edge: Callable[[bool], None]) -> Tuple[Any, bool]:
+        from controllers.door_sensors import gpio_sensor
+        return gpio_sensor(door_id, pin, on_edge, self.use_sensors)
+
+    def create_button(self, pin: int):
+        from gpiozero import Button
+        return Button(pin, pull_up=True, bounce_time=0.1)
+
+    def cleanup(self):
+        self.gpio.cleanup()
+
+
+class VirtualClock:
+    """Reloj simulado con eventos programados; solo avanza al pedirlo"""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self._events: List = []
+        self._counter = itertools.count()
+        self._ticks: List[Callable[[], Any]] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def call_at(self, when: float, callback: Callable[[], Any]):
+        """Ejecutar callback cuando el reloj llegue a when"""
+        heapq.heappush(self._events, (when, next(self._counter), callback))
+
+    def call_later(self, delay: float, callback: Callable[[], Any]):
+        self.call_at(self.now + delay, callback)
+
+    def add_tick(self, callback: Callable[[], Any]):
+        """Ejecutar callback después de cada evento y al final de cada avance"""
+        self._ticks.append(callback)
+
+    def _tick(self):
+        for callback in self._ticks:
+            callback()
+
+    def advance(self, seconds: float):
+        """Avanzar el reloj ejecutando en orden los eventos que venzan"""
+        target = self.now + max(0.0, seconds)
+        while self._events and self._events[0][0] <= target:
+            when, _, callback = heapq.heappop(self._events)
+            self.now = max(self.now, when)
+            callback()
+            self._tick()
+        self.now = max(self.now, target)
+        self._tick()
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def next_event(self) -> Optional[float]:
+        """Instante del próximo evento programado"""
+        return self._events[0][0] if self._events else None
+
+
+class PinTimeline:
+    """Registro en memoria de los cambios de nivel de cada pin"""
+
+    def __init__(self):
+        self.events: List[Tuple[float, int, int]] = []
+        self._levels: Dict[int, int] = {}
+
+    def record(self, t: float, pin: int, level: int):
+        self.events.append((t, pin, level))
+        self._levels[pin] = level
+
+    def level(self, pin: int) -> int:
+        """Nivel actual de un pin (0 si nunca se escribió)"""
+        return self._levels.get(pin, 0)
+
+    def history(self, pin: int) -> List[Tuple[float, int]]:
+        """(instante, nivel) de todas las escrituras de un pin"""
+        return [(t, level) for t, p, level in self.events if p == pin]
+
+    def transitions(self, pin: int) -> List[Tuple[float, int]]:
+        """Solo las escrituras que cambian el nivel"""
+        result, previous = [], 0
+        for t, level in self.history(pin):
+            if level != previous:
+                result.append((t, level))
+                previous = level
+        return result
+
+    def clear(self):
+        self.events.clear()
+
+
+class SimulatedRelay:
+    """Relé en memoria que registra sus cambios y avisa al sensor de su puerta"""
+
+    def __init__(self, backend: 'SimulatedBackend', door_id: str, pin: int):
+        self.backend = backend
+        self.door_id = door_id
+        self.pin = pin
+        self.is_on = False
+
+    def on(self):
+        self._set(True)
+
+    def off(self):
+        self._set(False)
+
+    def _set(self, is_on: bool):
+        self.is_on = is_on
+        self.backend.output(self.pin, 1 if is_on else 0)
+        sensor = self.backend.sensors.get(self.door_id)
+        if sensor is not None:
+            sensor.relay_changed(is_on)
+
+    @property
+    def value(self) -> int:
+        return 1 if self.is_on else 0
+
+    def close(self):
+        pass
+
+
+class SimulatedDoorSensor:
+    """
+    Sensor de puerta como máquina de estados programable
+
+    Estados: 'closed' -> (relé activo) -> 'unlatched' -> 'open' -> 'closed'.
+    Con behave() la puerta se abre open_after segundos después de activarse el
+    relé y se cierra close_after segundos más tarde; con script() se programan
+    flancos concretos (incluidos rebotes).
+    """
+
+    def __init__(self, backend: 'SimulatedBackend', door_id: str, pin: int, on_edge: Callable[[bool], None]):
+        self.backend = backend
+        self.door_id = door_id
+        self.pin = pin
+        self.state = 'closed'
+        self.open_after: Optional[float] = None
+        self.close_after: Optional[float] = None
+        self.cycles = 0
+        self._on_edge = on_edge
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open'
+
+    def behave(self, open_after: Optional[float] = None, close_after: Optional[float] = None):
+        """Comportamiento del usuario ante cada apertura (None = no abre / no cierra)"""
+        self.open_after = open_after
+        self.close_after = close_after
+
+    def script(self, *steps: Tuple[float, bool]):
+        """Programar flancos (retraso desde ahora en segundos, is_open)"""
+        for delay, is_open in steps:
+            self.backend.clock.call_later(delay, lambda is_open=is_open: self.set_open(is_open))
+
+    def set_open(self, is_open: bool):
+        """Flanco inmediato del sensor"""
+        if is_open:
+            self.state = 'open'
+        else:
+            if self.state == 'open':
+                self.cycles += 1
+            self.state = 'closed'
+        self.backend.output(self.pin, 1 if is_open else 0)
+        self._on_edge(is_open)
+
+    def relay_changed(self, is_on: bool):
+        if is_on and self.state == 'closed':
+            self.state = 'unlatched'
+            if self.open_after is not None:
+                self.backend.clock.call_later(self.open_after, self._user_opens)
+        elif not is_on and self.state == 'unlatched':
+            self.state = 'closed'
+
+    def _user_opens(self):
+        if self.state == 'unlatched':
+            self.set_open(True)
+            if self.close_after is not None:
+                self.backend.clock.call_later(self.close_after, lambda: self.set_open(False))
+
+    def close(self):
+        pass
+
+
+class SimulatedButton:
+    """Pulsador en memoria"""
+
+    def __init__(self, pin: int):
+        self.pin = pin
+        self.is_pressed = False
+
+    def close(self):
+        pass
+
+
+class SimulatedBackend(HardwareBackend):
+    """Hardware simulado determinista sobre un VirtualClock"""
+
+    simulated = True
+    threaded = False
+    drives_pins = True
+
+    def __init__(self, clock: VirtualClock = None):
+        self.clock = clock or VirtualClock()
+        self.timeline = PinTimeline()
+        self.relays: Dict[str, SimulatedRelay] = {}
+        self.sensors: Dict[str, SimulatedDoorSensor] = {}
+        self.buttons: Dict[int, SimulatedButton] = {}
+
+    def now(self) -> float:
+        return self.clock.now
+
+    def sleep(self, seconds: float):
+        self.clock.sleep(seconds)
+
+    def advance(self, seconds: float):
+        self.clock.advance(seconds)
+
+    def output(self, pin: int, level: int):
+        self.timeline.record(self.clock.now, pin, level)
+
+    def create_relay(self, door_id: str, pin: int, active_high: bool = False) -> SimulatedRelay:
+        relay = self.relays[door_id] = SimulatedRelay(self, door_id, pin)
+        return relay
+
+    def create_sensor(self, door_id: str, pin: int, on_edge: Callable[[bool], None]) -> Tuple[Any, bool]:
+        sensor = self.sensors[door_id] = SimulatedDoorSensor(self, door_id, pin, on_edge)
+        return sensor, sensor.is_open
+
+    def create_button(self, pin: int) -> SimulatedButton:
+        button = self.buttons[pin] = SimulatedButton(pin)
+        return button
+
+    def add_tick(self, callback: Callable[[], Any]):
+        self.clock.add_tick(callback)
+
+
+def create_backend(name: str, gpio, gpio_available: bool, use_sensors: bool = True) -> HardwareBackend:
+    """Backend por nombre ('gpio' o 'simulated')"""
+    if name == 'simulated':
+        return SimulatedBackend()
+    if name != 'gpio':
+        logger.warning(f"Backend de hardware desconocido '{name}', usando gpio")
+    return GpioBackend(gpio, gpio_available, use_sensors)
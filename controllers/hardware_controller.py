@@ -7,9 +7,17 @@ import threading
 import logging
 logger = logging.getLogger(__name__)
 from typing import Dict, Optional, Callable
-import json
-from gpiozero import OutputDevice, Button
 import os
+from utils.config_store import get_config_store
+from controllers.door_specs import DoorSpecTable, compile_door_specs
+from controllers.door_scheduler import DoorScheduler, ScheduledCall
+from controllers.door_sensors import DoorSensorMonitor
+from controllers.relay_matrix import RelayMatrixDriver
+from controllers.relay_budget import RelayBudget
+from controllers.hardware_backend import HardwareBackend, create_backend
+from controllers.door_actors import DoorActorPool
+from concurrent.futures import Future
+from config import Config
 
 # Intentar importar RPi.GPIO, si no está disponible (desarrollo), usar mock
 try:
@@ -75,72 +83,98 @@ except ImportError:
 class HardwareController:
     
     
-    def __init__(self, config_path: str = "machine_config.json"):
+    def __init__(self, config_path: str = "machine_config.json", backend: HardwareBackend = None):
         self.config_path = config_path
-        self.config = self._load_config()
         self.logger = logging.getLogger(__name__)
+        # Relés, sensores, pines y reloj (GPIO real o simulación con reloj virtual)
+        self.backend = backend or create_backend(Config.HARDWARE_BACKEND, GPIO, GPIO_AVAILABLE, Config.GPIO_ENABLED)
+        # Configuración compartida con MachineConfigManager (mismo dict en memoria)
+        self.config_store = get_config_store(config_path)
         # Estados de las puertas
         self.door_states = {}
+        # Cierres automáticos pendientes (door_id -> ScheduledCall), servidos por un único hilo
         self.door_timers = {}
+        self.door_scheduler = DoorScheduler(clock=self.backend.now, threaded=self.backend.threaded)
+        self.backend.add_tick(self.door_scheduler.run_due)
+        # Comandos por puerta: en orden dentro de cada puerta, en paralelo entre puertas
+        self.door_actors = DoorActorPool(Config.HARDWARE_WORKERS, threaded=self.backend.threaded)
+        self.auto_close = Config.DOOR_AUTO_CLOSE
         self.door_callbacks = {}
         # Diccionario para OutputDevice por puerta
         self.door_relays = {}
         # Configuración de relés (valor por defecto, se puede sobrescribir por puerta)
         self.default_relay_duration = 3.0  # Segundos por defecto
         self.sensor_debounce = 200  # Milisegundos de rebote para sensores
+        self.door_sensors = None
+        # Trenes de pulsos de la matriz de relés, emitidos con temporización propia
+        self.relay_matrix_driver = None
+        # Escalonado de activaciones para limitar el pico de corriente
+        self.relay_budget = RelayBudget(
+            max_concurrent=Config.RELAY_MAX_CONCURRENT,
+            inrush_ms=Config.RELAY_INRUSH_MS,
+            min_spacing_ms=Config.RELAY_MIN_SPACING_MS,
+            clock=self.backend.now,
+            sleep=self.backend.sleep
+        )
         # Botón de restock
         self.restock_button = None
         # Estado de inicialización
         self.initialized = False
+        # Puertas compiladas (se recompilan al recargar la configuración)
+        self.door_specs = self._compile_door_specs()
+        self.config_store.subscribe(self._on_config_changed)
         # Inicializar GPIO y relés al crear la instancia
         self._initialize_gpio()
         
-    def _load_config(self) -> dict:
-        """Cargar configuración desde archivo JSON"""
-        try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            self.logger.error(f"Error cargando configuración: {e}")
-            return {}
+    @property
+    def config(self) -> dict:
+        """Configuración compartida en memoria"""
+        return self.config_store.data
     
-    def _save_config(self):
-        """Guardar configuración actual al archivo"""
-        try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            self.logger.error(f"Error guardando configuración: {e}")
+    def _compile_door_specs(self) -> DoorSpecTable:
+        """Compilar la configuración de puertas en DoorSpec"""
+        with self.config_store.section_lock('doors'):
+            return compile_door_specs(self.config, self.default_relay_duration)
+    
+    def _on_config_changed(self, section: str, version: int, key: str = None):
+        """
+        Recompilar las puertas al recargar la configuración o cambiar 'machine'.
+        Los cambios de 'doors' hechos en este proceso (door_open, estado, stock)
+        no afectan a las DoorSpec; open_time se actualiza en set_door_open_time.
+        """
+        if section in (None, 'machine'):
+            self.door_specs = self._compile_door_specs()
     
     def _initialize_gpio(self):
         """Inicializar configuración de GPIO y crear OutputDevice por puerta"""
         try:
             # Limpiar recursos GPIO antes de inicializar (evita 'GPIO busy' en reinicios)
             try:
-                GPIO.cleanup()
+                self.backend.cleanup()
                 self.logger.info("GPIO cleanup ejecutado antes de inicializar relés")
             except Exception as e:
                 self.logger.warning(f"Error en GPIO cleanup previo: {e}")
 
-            doors_config = self.config.get('doors', {})
-            self.logger.info(f"Puertas cargadas desde config: {list(doors_config.keys())}")
-            for door_id, door_info in doors_config.items():
-                self.logger.info(f"Puerta {door_id} -> gpio_pin: {door_info.get('gpio_pin')}")
+            specs = self.door_specs
+            self.logger.info(f"Puertas cargadas desde config: {[spec.door_id for spec in specs]}")
+            for spec in specs:
+                self.logger.info(f"Puerta {spec.door_id} -> gpio_pin: {spec.gpio_pin}")
             # Inicializar estados de puertas y relés
-            for door_id, door_info in doors_config.items():
+            for spec in specs:
+                door_id = spec.door_id
                 self.door_states[door_id] = {
                     'is_open': False,
                     'relay_active': False,
                     'last_opened': None,
                     'last_closed': None
                 }
-                gpio_pin = door_info.get('gpio_pin')
+                gpio_pin = spec.gpio_pin
                 # Permitir configurar active_high por puerta, por defecto False (relé desactivado al iniciar)
-                active_high = door_info.get('active_high', False)
+                active_high = spec.active_high
                 if gpio_pin is not None:
                     try:
                         self.logger.info(f"Creando OutputDevice para puerta {door_id} en pin {gpio_pin} (active_high={active_high})")
-                        self.door_relays[door_id] = OutputDevice(gpio_pin, active_high=active_high, initial_value=False)
+                        self.door_relays[door_id] = self.backend.create_relay(door_id, gpio_pin, active_high)
                         self.door_relays[door_id].off()
                         self.logger.info(f"OutputDevice creado y apagado para puerta {door_id} en pin {gpio_pin}")
                     except Exception as e:
@@ -155,6 +189,9 @@ class HardwareController:
                 else:
                     self.logger.warning(f"Puerta {door_id} no tiene gpio_pin configurado, no se crea OutputDevice")
          
+            # Sensores de puerta por flancos
+            self._initialize_sensors()
+
             # Inicializar botón de restock si está configurado
             self._initialize_restock_button()
             
@@ -174,7 +211,7 @@ class HardwareController:
                     self.logger.info(f"Inicializando botón de restock en pin {gpio_pin}")
                     try:
                         # Crear botón con pull-up interno (botón conectado a GND)
-                        self.restock_button = Button(gpio_pin, pull_up=True, bounce_time=0.1)
+                        self.restock_button = self.backend.create_button(gpio_pin)
                         self.logger.info(f"Botón de restock inicializado en pin {gpio_pin}")
                     except Exception as e:
                         self.logger.error(f"Error creando botón de restock en pin {gpio_pin}: {e}")
@@ -246,50 +283,53 @@ class HardwareController:
     
     
     
-    def _sensor_callback(self, door_id: str, channel: int):
-        """Callback para eventos de sensores de puerta"""
+    def _initialize_sensors(self):
+        """Registrar los sensores de puerta como fuentes de flancos (interrupciones)"""
+        self.door_sensors = DoorSensorMonitor(debounce_ms=self.sensor_debounce, clock=self.backend.now,
+                                              sensor_factory=self.backend.create_sensor)
+        for spec in self.door_specs:
+            if spec.sensor_pin is not None:
+                self.door_sensors.attach(spec.door_id, spec.sensor_pin)
+                self.door_states[spec.door_id]['is_open'] = bool(self.door_sensors.is_open(spec.door_id))
+        self.door_sensors.subscribe(self._on_sensor_edge)
+        if self.backend.threaded:
+            self.door_sensors.start()
+        else:
+            self.backend.add_tick(self.door_sensors.process_pending)
+        self.logger.info(f"Sensores de puerta registrados: {list(self.door_sensors.sensors)}")
+
+    def _on_sensor_edge(self, door_id: str, is_open: bool, timestamp: float):
+        """Cambio confirmado de un sensor de puerta (hilo despachador): se encola en el actor de la puerta"""
+        self.door_actors.submit(door_id, self._apply_sensor_edge, door_id, is_open)
+
+    def _apply_sensor_edge(self, door_id: str, is_open: bool):
+        """Aplicar un cambio de sensor (en el actor de la puerta)"""
         try:
-            doors_config = self.config.get('doors', {})
-            door_info = doors_config.get(door_id, {})
-            sensor_pin = door_info.get('sensor_pin')
-            
-            if not sensor_pin:
+            state = self.door_states.get(door_id)
+            if state is None:
                 return
-                
-            # Leer estado del sensor (LOW = puerta cerrada, HIGH = puerta abierta)
-            sensor_state = GPIO.input(sensor_pin) if GPIO_AVAILABLE else 0
-            is_open = sensor_state == GPIO.HIGH if GPIO_AVAILABLE else False
-            
-            previous_state = self.door_states.get(door_id, {}).get('is_open', False)
-            
-            # Solo procesar si hay cambio de estado
-            if is_open != previous_state:
-                current_time = time.time()
-                
-                self.door_states[door_id]['is_open'] = is_open
-                
-                if is_open:
-                    self.door_states[door_id]['last_opened'] = current_time
-                    self.logger.info(f"Puerta {door_id} abierta")
-                else:
-                    self.door_states[door_id]['last_closed'] = current_time
-                    self.logger.info(f"Puerta {door_id} cerrada")
-                
-                # Actualizar configuración
-                self.config['doors'][door_id]['door_open'] = is_open
-                self._save_config()
-                
-                # Ejecutar callback si existe
-                if door_id in self.door_callbacks:
-                    callback = self.door_callbacks[door_id]
-                    threading.Thread(
-                        target=callback, 
-                        args=(door_id, is_open),
-                        daemon=True
-                    ).start()
-                    
+            state['is_open'] = is_open
+            if is_open:
+                state['last_opened'] = time.time()
+                self.logger.info(f"Puerta {door_id} abierta")
+            else:
+                state['last_closed'] = time.time()
+                self.logger.info(f"Puerta {door_id} cerrada")
+                if state.get('relay_active'):
+                    # La puerta ya se cerró: no hace falta esperar al cierre automático
+                    self._close_door(door_id)
+
+            # Actualizar configuración (la escritura a disco se agrupa en ConfigWriter)
+            with self.config_store.mutate('doors', door_id) as config:
+                config['doors'][door_id]['door_open'] = is_open
+
+            # Ejecutar callback si existe (en el actor de la puerta)
+            callback = self.door_callbacks.get(door_id)
+            if callback is not None:
+                callback(door_id, is_open)
+
         except Exception as e:
-            self.logger.error(f"Error en callback de sensor {door_id}: {e}")
+            self.logger.error(f"Error en evento de sensor {door_id}: {e}")
     
     def get_door_open_time(self, door_id: str) -> float:
         """
@@ -301,23 +341,10 @@ class HardwareController:
         Returns:
             float: Tiempo en segundos que la puerta debe permanecer abierta
         """
-        doors_config = self.config.get('doors', {})
-        door_info = doors_config.get(door_id, {})
-        
-        # Prioridad: tiempo específico de puerta > configuración global > valor por defecto
-        door_time = door_info.get('open_time')
-        if door_time is not None:
-            return float(door_time)
-        
-        # Si no hay tiempo específico, usar configuración global
-        machine_config = self.config.get('machine', {})
-        door_settings = machine_config.get('door_settings', {})
-        global_time = door_settings.get('default_open_time')
-        if global_time is not None:
-            return float(global_time)
-        
-        # Valor por defecto
-        return self.default_relay_duration
+        # Prioridad (resuelta al compilar): puerta > configuración global > valor por defecto
+        specs = self.door_specs
+        spec = specs.get(door_id)
+        return spec.open_time if spec is not None else specs.default_open_time
     
     def set_door_open_time(self, door_id: str, open_time: float) -> bool:
         """
@@ -330,25 +357,28 @@ class HardwareController:
         Returns:
             bool: True si se configuró correctamente
         """
+        return self.door_actors.call(door_id, self._set_door_open_time, door_id, open_time)
+
+    def _set_door_open_time(self, door_id: str, open_time: float) -> bool:
         try:
             # Validar límites
-            machine_config = self.config.get('machine', {})
-            door_settings = machine_config.get('door_settings', {})
-            min_time = door_settings.get('min_open_time', 1.0)
-            max_time = door_settings.get('max_open_time', 10.0)
+            specs = self.door_specs
+            min_time = specs.min_open_time
+            max_time = specs.max_open_time
             
             if not (min_time <= open_time <= max_time):
                 self.logger.error(f"Tiempo de apertura {open_time}s fuera del rango permitido ({min_time}-{max_time}s)")
                 return False
             
             # Actualizar configuración
-            doors_config = self.config.get('doors', {})
-            if door_id not in doors_config:
+            spec = specs.get(door_id)
+            if spec is None:
                 self.logger.error(f"Puerta {door_id} no encontrada")
                 return False
             
-            doors_config[door_id]['open_time'] = float(open_time)
-            self._save_config()
+            with self.config_store.mutate('doors', door_id) as config:
+                config['doors'][door_id]['open_time'] = float(open_time)
+                spec.open_time = float(open_time)
             
             self.logger.info(f"Tiempo de apertura para puerta {door_id} configurado a {open_time}s")
             return True
@@ -384,14 +414,20 @@ class HardwareController:
         """
         Activar relé para abrir una puerta específica y cerrarlo automáticamente tras el tiempo configurado
         """
+        return self.open_door_async(door_id).result()
+
+    def open_door_async(self, door_id: str) -> Future:
+        """Encolar la apertura en el actor de la puerta; el Future da True si se abrió"""
+        return self.door_actors.submit(door_id, self._open_door, door_id)
+
+    def _open_door(self, door_id: str) -> bool:
         try:
-            doors_config    = self.config.get('doors', {})
-            door_info       = doors_config.get(door_id)
-            if not door_info:
+            spec = self.door_specs.get(door_id)
+            if spec is None:
                 print(f"Puerta {door_id} no encontrada en configuración")
                 self.logger.error(f"Puerta {door_id} no encontrada en configuración")
                 return False
-            gpio_pin = door_info.get('gpio_pin')
+            gpio_pin = spec.gpio_pin
             if not gpio_pin:
                 print(f"Puerta {door_id} no tiene gpio_pin configurado")
                 self.logger.error(f"Puerta {door_id} no tiene gpio_pin configurado")
@@ -406,11 +442,17 @@ class HardwareController:
                 self.logger.error(f"Relé no encontrado para puerta {door_id}")
                 return False
 
-            # Activar relé
-            rele.on()
+            # Activar relé (esperando turno si otras bobinas acaban de activarse;
+            # en una matriz cada trama de selección consume su propio turno)
+            self.relay_budget.acquire()
+            if spec.relay_matrix:
+                if not self._activate_relay_matrix(gpio_pin, spec.relay_index, door_id):
+                    return False
+            else:
+                rele.on()
             print(f"Relé activado para puerta {door_id} (pin {gpio_pin})")
             self.logger.info(f"Relé activado para puerta {door_id} (pin {gpio_pin})")
-
+            self._mark_relay_on(spec)
 
             return True
         except Exception as e:
@@ -418,27 +460,68 @@ class HardwareController:
             self.logger.error(f"Error abriendo puerta {door_id}: {e}")
             return False
 
+    def _mark_relay_on(self, spec):
+        """Anotar el relé como activo y programar su cierre automático"""
+        state = self.door_states.setdefault(spec.door_id, {'is_open': False, 'last_closed': None})
+        state['relay_active'] = True
+        state['last_opened'] = time.time()
+
+        # El servidor desactiva el relé aunque el navegador no llegue a pedir el cierre
+        if self.auto_close:
+            self.door_timers[spec.door_id] = self.door_scheduler.schedule(
+                spec.door_id, spec.open_time, self._auto_close_door
+            )
+
+    def open_doors(self, door_ids) -> Dict[str, bool]:
+        """
+        Abrir varias puertas escalonando las activaciones según el presupuesto de relés
+        
+        Cada puerta se abre en su actor, así que van en paralelo salvo por el
+        turno que piden a RelayBudget. Las puertas de matriz siguen el mismo
+        camino que open_door: cada trama de selección es una activación con su
+        turno, de modo que dos tramas del mismo pin quedan separadas al menos
+        RELAY_MIN_SPACING_MS.
+        
+        Args:
+            door_ids: IDs de las puertas, en el orden deseado
+            
+        Returns:
+            Dict door_id -> True si se abrió
+        """
+        futures = {door_id: self.open_door_async(door_id) for door_id in dict.fromkeys(door_ids)}
+        results = {door_id: future.result() for door_id, future in futures.items()}
+
+        opened = sum(1 for ok in results.values() if ok)
+        self.logger.info(f"Apertura en lote: {opened}/{len(results)} puertas abiertas")
+        return results
+
     def close_door(self, door_id: str) -> bool:
         """
         Cerrar una puerta específica, desactivando el relé y actualizando el estado
         """
-        if door_id not in self.door_relays:
+        return self.close_door_async(door_id).result()
+
+    def close_door_async(self, door_id: str) -> Future:
+        """Encolar el cierre en el actor de la puerta; el Future da True si se cerró"""
+        return self.door_actors.submit(door_id, self._close_door, door_id)
+
+    def _close_door(self, door_id: str) -> bool:
+        spec = self.door_specs.get(door_id)
+        if spec is None or door_id not in self.door_relays:
             self.logger.error(f"Puerta {door_id} no encontrada")
             return False
         
         try:
-            rele = self.door_relays[door_id]
-            rele.off()  # Desactivar relé
-            self.logger.info(f"Relé desactivado para puerta {door_id}")
+            self._cancel_auto_close(door_id)
+            # Relé simple o trama de desactivación en la matriz
+            self._deactivate_relay(door_id, spec.gpio_pin, spec.relay_index, spec.relay_matrix)
             
             # Actualizar estado
             self.door_states[door_id]['is_open'] = False
-            self.door_states[door_id]['relay_active'] = False
-            self.door_states[door_id]['last_closed'] = time.time()
             
             # Actualizar configuración
-            self.config['doors'][door_id]['door_open'] = False
-            self._save_config()
+            with self.config_store.mutate('doors', door_id) as config:
+                config['doors'][door_id]['door_open'] = False
             
             return True
             
@@ -446,32 +529,99 @@ class HardwareController:
             self.logger.error(f"Error cerrando puerta {door_id}: {e}")
             return False
     
+    def _auto_close_door(self, entry: ScheduledCall):
+        """Cierre automático al vencer el tiempo de apertura (hilo del planificador)"""
+        # Sin esperar: el planificador no se bloquea detrás de la cola de la puerta
+        self.door_actors.submit(entry.key, self._auto_close_command, entry)
+
+    def _auto_close_command(self, entry: ScheduledCall):
+        door_id = entry.key
+        # Si la puerta se volvió a abrir, door_timers ya apunta a otra entrada
+        if self.door_timers.get(door_id) is not entry:
+            return False
+        self.logger.info(f"Tiempo de apertura agotado, cerrando puerta {door_id}")
+        return self._close_door(door_id)
+
+    def extend_door_open(self, door_id: str, seconds: float) -> bool:
+        """
+        Retrasar el cierre automático de una puerta abierta
+        
+        Args:
+            door_id: ID de la puerta
+            seconds: Segundos adicionales
+            
+        Returns:
+            bool: True si había un cierre pendiente
+        """
+        return self.door_actors.call(door_id, self._extend_door_open, door_id, seconds)
+
+    def _extend_door_open(self, door_id: str, seconds: float) -> bool:
+        entry = self.door_scheduler.extend(door_id, seconds)
+        if entry is None:
+            return False
+        self.door_timers[door_id] = entry
+        self.logger.info(f"Cierre automático de puerta {door_id} retrasado {seconds}s")
+        return True
+
+    def cancel_auto_close(self, door_id: str) -> bool:
+        """Cancelar el cierre automático pendiente de una puerta (el relé sigue como esté)"""
+        return self.door_actors.call(door_id, self._cancel_auto_close, door_id)
+
+    def _cancel_auto_close(self, door_id: str) -> bool:
+        entry = self.door_timers.pop(door_id, None)
+        return entry is not None and entry.cancel()
+
+    def get_door_state(self, door_id: str) -> Dict:
+        """Obtener estado de hardware de una puerta, con los segundos hasta el cierre automático"""
+        spec = self.door_specs.get(door_id)
+        state = dict(self.door_states.get(door_id, {
+            'is_open': False, 'relay_active': False, 'last_opened': None, 'last_closed': None
+        }))
+        state['gpio_pin'] = spec.gpio_pin if spec is not None else None
+        state['sensor_pin'] = spec.sensor_pin if spec is not None else None
+        state['open_time'] = self.get_door_open_time(door_id)
+        state['auto_close_in'] = self.door_scheduler.remaining(door_id)
+        return state
+
+    def emergency_stop(self):
+        """Parada de emergencia: cancelar cierres pendientes y desactivar todos los relés (sin pasar por las colas)"""
+        self.door_scheduler.cancel_all()
+        self.door_timers.clear()
+        specs = self.door_specs
+        for door_id, rele in self.door_relays.items():
+            try:
+                spec = specs.get(door_id)
+                if spec is not None and spec.relay_matrix:
+                    if self.door_states.get(door_id, {}).get('relay_active'):
+                        self._deactivate_relay_matrix(spec.gpio_pin, spec.relay_index, door_id)
+                else:
+                    rele.off()
+            except Exception as e:
+                self.logger.error(f"Error desactivando relé de puerta {door_id} en parada de emergencia: {e}")
+            if door_id in self.door_states:
+                self.door_states[door_id]['relay_active'] = False
+        self.logger.warning("Parada de emergencia: todos los relés desactivados")
+
+    def _get_relay_matrix_driver(self) -> RelayMatrixDriver:
+        """Driver de la matriz de relés (se crea al primer uso)"""
+        if self.relay_matrix_driver is None:
+            virtual = not self.backend.threaded
+            self.relay_matrix_driver = RelayMatrixDriver(
+                self.backend.output, rt_priority=Config.RELAY_MATRIX_RT_PRIORITY,
+                clock=self.backend.now if virtual else None,
+                sleep=self.backend.sleep if virtual else None
+            )
+        return self.relay_matrix_driver
+
     def _activate_relay_matrix(self, gpio_pin: int, relay_index: int, door_id: str) -> bool:
         """
         Activar un relé específico en una matriz de relés
         Implementa protocolo de selección por índice
         """
         try:
-            if GPIO_AVAILABLE:
-                # Protocolo para matriz de relés:
-                # 1. Enviar pulso de selección (índice en binario)
-                # 2. Activar pin principal
-                # 3. Enviar pulso de confirmación
-                
-                # Convertir índice a binario (ejemplo: índice 3 = 011)
-                binary_index = format(relay_index, '08b')  # 8 bits
-                
-                # Enviar bits de selección
-                for bit in binary_index:
-                    GPIO.output(gpio_pin, GPIO.HIGH if bit == '1' else GPIO.LOW)
-                    time.sleep(0.001)  # 1ms por bit
-                
-                # Pulso final de activación
-                GPIO.output(gpio_pin, GPIO.HIGH)
-                time.sleep(0.005)  # 5ms de pulso de activación
-                GPIO.output(gpio_pin, GPIO.LOW)
-                time.sleep(0.001)  # Pausa
-                GPIO.output(gpio_pin, GPIO.HIGH)  # Mantener activo
+            if self.backend.drives_pins:
+                # Selección del índice en 8 bits + pulso de activación (tren precalculado)
+                return self._get_relay_matrix_driver().send(gpio_pin, relay_index, activate=True)
                 
             else:
                 print(f"SIMULACIÓN: Activando relé matriz puerta {door_id} en pin {gpio_pin}, índice {relay_index}")
@@ -514,8 +664,11 @@ class HardwareController:
     def _deactivate_relay_simple(self, gpio_pin: int, door_id: str):
         """Desactivar un relé simple"""
         try:
-            if GPIO_AVAILABLE:
-                GPIO.output(gpio_pin, GPIO.LOW)
+            rele = self.door_relays.get(door_id)
+            if rele is not None:
+                rele.off()
+            elif self.backend.drives_pins:
+                self.backend.output(gpio_pin, GPIO.LOW)
             else:
                 print(f"SIMULACIÓN: Desactivando relé simple puerta {door_id} en pin {gpio_pin}")
         except Exception as e:
@@ -524,22 +677,9 @@ class HardwareController:
     def _deactivate_relay_matrix(self, gpio_pin: int, relay_index: int, door_id: str):
         """Desactivar un relé específico en matriz"""
         try:
-            if GPIO_AVAILABLE:
-                # Protocolo de desactivación para matriz
-                # Enviar comando de desactivación específico
-                binary_index = format(relay_index, '08b')
-                
-                # Enviar bits de selección
-                for bit in binary_index:
-                    GPIO.output(gpio_pin, GPIO.HIGH if bit == '1' else GPIO.LOW)
-                    time.sleep(0.001)
-                
-                # Pulso de desactivación
-                GPIO.output(gpio_pin, GPIO.LOW)
-                time.sleep(0.005)
-                GPIO.output(gpio_pin, GPIO.HIGH)
-                time.sleep(0.001)
-                GPIO.output(gpio_pin, GPIO.LOW)  # Estado final desactivado
+            if self.backend.drives_pins:
+                # Selección del índice en 8 bits + pulso de desactivación (tren precalculado)
+                self._get_relay_matrix_driver().send(gpio_pin, relay_index, activate=False)
                 
             else:
                 print(f"SIMULACIÓN: Desactivando relé matriz puerta {door_id} en pin {gpio_pin}, índice {relay_index}")
@@ -551,10 +691,8 @@ class HardwareController:
     def get_all_doors_state(self) -> Dict[str, Dict]:
         """Obtener estado de todas las puertas"""
         states = {}
-        doors_config = self.config.get('doors', {})
-        
-        for door_id in doors_config.keys():
-            states[door_id] = self.get_door_state(door_id)
+        for spec in self.door_specs:
+            states[spec.door_id] = self.get_door_state(spec.door_id)
             
         return states
     
@@ -585,25 +723,31 @@ class HardwareController:
         Returns:
             bool: True si la prueba fue exitosa
         """
+        return self.test_door_async(door_id).result()
+
+    def test_door_async(self, door_id: str) -> Future:
+        """Encolar la prueba en el actor de la puerta; el Future da True si fue exitosa"""
+        return self.door_actors.submit(door_id, self._test_door, door_id)
+
+    def _test_door(self, door_id: str) -> bool:
         try:
             self.logger.info(f"Iniciando prueba de puerta {door_id}")
             
             # Verificar configuración
-            door_info = self.config.get('doors', {}).get(door_id)
-            if not door_info:
+            spec = self.door_specs.get(door_id)
+            if spec is None:
                 self.logger.error(f"Puerta {door_id} no encontrada")
                 return False
             
             # Probar apertura
-            if not self.open_door(door_id):
+            if not self._open_door(door_id):
                 self.logger.error(f"Error en prueba de apertura de puerta {door_id}")
                 return False
             
             # Verificar estado del sensor
-            sensor_pin = door_info.get('sensor_pin')
-            if sensor_pin and GPIO_AVAILABLE:
-                sensor_state = GPIO.input(sensor_pin)
-                self.logger.info(f"Estado del sensor de puerta {door_id}: {sensor_state}")
+            if spec.sensor_pin is not None and self.door_sensors is not None:
+                sensor_open = self.door_sensors.is_open(door_id)
+                self.logger.info(f"Estado del sensor de puerta {door_id}: {'abierta' if sensor_open else 'cerrada'}")
             
             self.logger.info(f"Prueba de puerta {door_id} completada exitosamente")
             return True
@@ -659,6 +803,14 @@ class HardwareController:
                 except Exception as e:
                     self.logger.warning(f"Error cancelando timer: {e}")
             self.door_timers.clear()
+            self.door_scheduler.stop()
+            self.door_actors.shutdown()
+            if self.door_sensors is not None:
+                self.door_sensors.stop()
+                self.door_sensors = None
+            if self.relay_matrix_driver is not None:
+                self.relay_matrix_driver.close()
+                self.relay_matrix_driver = None
 
             # Cerrar todos los OutputDevice
             for rel in self.door_relays.values():
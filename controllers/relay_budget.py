@@ -0,0 +1,73 @@
+"""
+Presupuesto de activación de relés
+
+Al energizar una bobina hay un pico de corriente (inrush) durante unos
+milisegundos. Para no provocar caídas de tensión, RelayBudget limita cuántos
+relés pueden activarse dentro de una misma ventana de inrush y fija una
+separación mínima entre activaciones consecutivas. Todas las aperturas del
+controlador (sueltas o en lote) piden turno aquí antes de activar el relé.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+
+class RelayBudget:
+    """Escalonado de activaciones: máximo por ventana de inrush y separación mínima"""
+
+    def __init__(self, max_concurrent: int = 2, inrush_ms: float = 100, min_spacing_ms: float = 50,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.max_concurrent = max(1, max_concurrent)
+        self.inrush = inrush_ms / 1000.0
+        self.min_spacing = min_spacing_ms / 1000.0
+        self.clock = clock
+        self.sleep = sleep
+        self._starts = deque()  # Instantes de las activaciones aún dentro de su ventana
+        self._last_start = None
+        self._lock = threading.Lock()
+        self._stats = {'activations': 0, 'waits': 0, 'waited_ms': 0.0}
+
+    def _earliest(self, now: float, count: int) -> float:
+        """Primer instante en que caben count activaciones más (con el lock adquirido)"""
+        while self._starts and self._starts[0] + self.inrush <= now:
+            self._starts.popleft()
+        earliest = now
+        if self._last_start is not None:
+            earliest = max(earliest, self._last_start + self.min_spacing)
+        excess = len(self._starts) + count - self.max_concurrent
+        if excess > 0:
+            earliest = max(earliest, self._starts[excess - 1] + self.inrush)
+        return earliest
+
+    def acquire(self, count: int = 1) -> float:
+        """
+        Esperar turno para activar count relés a la vez
+
+        Returns:
+            float: Segundos esperados
+        """
+        count = min(max(1, count), self.max_concurrent)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                earliest = self._earliest(now, count)
+                if earliest <= now:
+                    self._starts.extend([now] * count)
+                    self._last_start = now
+                    self._stats['activations'] += count
+                    if waited:
+                        self._stats['waits'] += 1
+                        self._stats['waited_ms'] += waited * 1000
+                    return waited
+            delay = earliest - now
+            self.sleep(delay)
+            waited += delay
+
+    def get_stats(self) -> Dict[str, float]:
+        """Obtener métricas (activaciones, esperas y tiempo esperado)"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['max_concurrent'] = self.max_concurrent
+        return stats
@@ -0,0 +1,224 @@
+"""
+Driver de la matriz de relés
+
+El protocolo de selección envía el índice del relé en 8 bits (1 ms por bit,
+MSB primero) seguido de un pulso de activación o desactivación. El tren de
+pulsos de cada (índice, acción) se calcula una sola vez como una tupla de
+(nivel, duración en µs) y se emite:
+
+- con pigpio, como una onda cargada en el demonio (temporizada por DMA), si
+  el módulo está instalado y el demonio responde;
+- si no, desde un hilo dedicado que intenta ponerse en SCHED_FIFO y espera a
+  cada flanco con plazos absolutos (sleep hasta poco antes y espera activa el
+  resto), para que la deriva no se acumule bit a bit.
+
+Cada emisión mide el desfase real de cada flanco respecto a su plazo y las
+métricas (jitter medio y máximo por bit) quedan en get_stats(). Con el reloj
+virtual del backend simulado el tren se emite en el hilo que llama y sin
+esperas reales.
+"""
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BIT_US = 1000           # Duración de cada bit de selección
+PULSE_US = 5000         # Pulso de activación/desactivación
+GAP_US = 1000           # Pausa antes del nivel final
+INDEX_BITS = 8
+SPIN_US = 2000          # Margen final que se espera de forma activa (cubre el retraso de sleep)
+
+PulseTrain = Tuple[Tuple[int, int], ...]  # ((nivel, duración_us), ...); el último nivel se mantiene
+
+
+def build_pulse_train(relay_index: int, activate: bool = True) -> PulseTrain:
+    """Tren de pulsos del protocolo de matriz para un índice"""
+    if not 0 <= relay_index < (1 << INDEX_BITS):
+        raise ValueError(f"relay_index fuera de rango: {relay_index}")
+    steps = [(1 if bit == '1' else 0, BIT_US) for bit in format(relay_index, f'0{INDEX_BITS}b')]
+    if activate:
+        steps += [(1, PULSE_US), (0, GAP_US), (1, 0)]   # Queda activo
+    else:
+        steps += [(0, PULSE_US), (1, GAP_US), (0, 0)]   # Queda desactivado
+    return tuple(steps)
+
+
+def _load_pigpio():
+    """Conexión con el demonio pigpio, o None si no está disponible"""
+    try:
+        import pigpio
+    except ImportError:
+        return None
+    pi = pigpio.pi()
+    if not pi.connected:
+        return None
+    return pi
+
+
+class RelayMatrixDriver:
+    """Emisión temporizada de los trenes de pulsos de la matriz de relés"""
+
+    def __init__(self, output: Callable[[int, int], None], setup: Callable[[int], None] = None,
+                 rt_priority: int = 0, use_pigpio: bool = True,
+                 clock: Callable[[], float] = None, sleep: Callable[[float], None] = None):
+        self._output = output
+        self._setup = setup
+        self.rt_priority = rt_priority
+        # Con un reloj virtual (clock y sleep) los trenes se emiten en el hilo que llama
+        self._virtual = clock is not None and sleep is not None
+        self._clock_ns = (lambda: int(round(clock() * 1e9))) if self._virtual else time.perf_counter_ns
+        self._sleep = sleep or time.sleep
+        if self._virtual:
+            use_pigpio = False
+        self._trains: Dict[Tuple[int, bool], PulseTrain] = {}
+        self._pi = _load_pigpio() if use_pigpio else None
+        self._waves: Dict[Tuple[int, int, bool], int] = {}
+        self._pins = set()
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {'backend': 'pigpio' if self._pi is not None else ('virtual' if self._virtual else 'thread'), 'realtime': False,
+                       'trains': 0, 'bits': 0, 'jitter_total_us': 0.0, 'jitter_max_us': 0.0,
+                       'last_duration_ms': 0.0}
+
+    def pulse_train(self, relay_index: int, activate: bool = True) -> PulseTrain:
+        """Tren precalculado (se construye la primera vez)"""
+        key = (relay_index, activate)
+        train = self._trains.get(key)
+        if train is None:
+            train = self._trains[key] = build_pulse_train(relay_index, activate)
+        return train
+
+    @staticmethod
+    def duration_ms(train: PulseTrain) -> float:
+        """Duración total acotada de un tren"""
+        return sum(duration for _, duration in train) / 1000.0
+
+    def send(self, gpio_pin: int, relay_index: int, activate: bool = True, timeout: float = 1.0) -> bool:
+        """Emitir el tren de un índice y esperar a que termine"""
+        train = self.pulse_train(relay_index, activate)
+        if self._pi is not None:
+            return self._send_wave(gpio_pin, relay_index, activate, train, timeout)
+        if self._virtual:
+            return self._emit(gpio_pin, train)
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((gpio_pin, (train,), future))
+        return future.result(timeout)
+
+    # --- pigpio ---
+
+    def _send_wave(self, gpio_pin: int, relay_index: int, activate: bool, train: PulseTrain, timeout: float) -> bool:
+        import pigpio
+        with self._lock:
+            key = (gpio_pin, relay_index, activate)
+            wave_id = self._waves.get(key)
+            if wave_id is None:
+                self._pi.set_mode(gpio_pin, pigpio.OUTPUT)
+                mask = 1 << gpio_pin
+                self._pi.wave_add_generic([
+                    pigpio.pulse(mask if level else 0, 0 if level else mask, duration)
+                    for level, duration in train
+                ])
+                wave_id = self._waves[key] = self._pi.wave_create()
+            started = time.perf_counter()
+            self._pi.wave_send_once(wave_id)
+            deadline = started + timeout
+            while self._pi.wave_tx_busy():
+                if time.perf_counter() > deadline:
+                    self._pi.wave_tx_stop()
+                    return False
+                time.sleep(0.001)
+            self._record(0.0, len(train), time.perf_counter() - started)
+            return True
+
+    # --- hilo dedicado ---
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='relay-matrix', daemon=True)
+                self._thread.start()
+
+    def _make_realtime(self):
+        if self.rt_priority <= 0 or not hasattr(os, 'sched_setscheduler'):
+            return
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.rt_priority))
+            self._stats['realtime'] = True
+        except (PermissionError, OSError) as e:
+            logger.info(f"SCHED_FIFO no permitido para la matriz de relés ({e}), se usa prioridad normal")
+
+    def _run(self):
+        self._make_realtime()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            gpio_pin, trains, future = item
+            try:
+                future.set_result(all([self._emit(gpio_pin, train) for train in trains]))
+            except Exception as e:
+                logger.error(f"Error emitiendo tren de la matriz en pin {gpio_pin}: {e}")
+                future.set_result(False)
+
+    def _emit(self, gpio_pin: int, train: PulseTrain) -> bool:
+        if gpio_pin not in self._pins and self._setup is not None:
+            self._setup(gpio_pin)
+        self._pins.add(gpio_pin)
+
+        output = self._output
+        clock = self._clock_ns
+        spin_ns = 0 if self._virtual else SPIN_US * 1000
+        start = clock()
+        target = start
+        worst = total = 0.0
+        for level, duration in train:
+            # Esperar al plazo absoluto del flanco
+            remaining = target - clock()
+            if remaining > spin_ns:
+                self._sleep((remaining - spin_ns) / 1e9)
+            while clock() < target and not self._virtual:
+                pass
+            jitter = max(0, clock() - target) / 1000.0
+            output(gpio_pin, level)
+            total += jitter
+            if jitter > worst:
+                worst = jitter
+            target += duration * 1000
+        self._record(total, len(train), (clock() - start) / 1e9, worst)
+        return True
+
+    def _record(self, jitter_total_us: float, bits: int, seconds: float, jitter_max_us: float = 0.0):
+        with self._lock:
+            self._stats['trains'] += 1
+            self._stats['bits'] += bits
+            self._stats['jitter_total_us'] += jitter_total_us
+            self._stats['jitter_max_us'] = max(self._stats['jitter_max_us'], jitter_max_us)
+            self._stats['last_duration_ms'] = seconds * 1000
+
+    def close(self):
+        """Detener el hilo y liberar las ondas de pigpio"""
+        if self._thread is not None:
+            self._queue.put(None)
+        if self._pi is not None:
+            try:
+                for wave_id in self._waves.values():
+                    self._pi.wave_delete(wave_id)
+                self._pi.stop()
+            except Exception as e:
+                logger.warning(f"Error liberando ondas de pigpio: {e}")
+            self._pi = None
+        self._waves.clear()
+
+    def get_stats(self) -> Dict:
+        """Obtener métricas (backend, tiempo real, trenes, jitter medio y máximo por flanco)"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['jitter_mean_us'] = stats['jitter_total_us'] / stats['bits'] if stats['bits'] else 0.0
+        return stats
@@ -1,67 +1,192 @@
 """
 Controlador para el historial de ventas y exportación de datos - VERSION CORREGIDA
 """
+import io
 import os
 import csv
 import json
+import zlib
+import base64
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 import psutil
-from database import db_manager
+from database import db_manager, date_bounds
+from config import Config
+from utils.db_archive import monthly_archiver
 
 logger = logging.getLogger(__name__)
 
+# Columnas del CSV de ventas
+EXPORT_CSV_FIELDS = [
+    'ID', 'Fecha', 'Hora', 'Puerta', 'Producto',
+    'Precio', 'Método Pago', 'ID Transacción', 'Estado'
+]
+EXPORT_FETCH_ROWS = 500  # Filas leídas del cursor por llamada
+EXPORT_CHUNK_BYTES = 64 * 1024  # Tamaño aproximado de cada trozo enviado
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Comprimir en gzip un flujo de trozos sin acumularlo en memoria"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 class SalesHistoryController:
     """Controlador para gestionar el historial de ventas y exportaciones"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
-    def get_sales_history(self, 
-                         start_date: Optional[str] = None, 
-                         end_date: Optional[str] = None,
-                         limit: int = 100) -> List[Dict]:
+    def _date_filter(self, column: str,
+                     start_date: Optional[str] = None,
+                     end_date: Optional[str] = None) -> Tuple[str, List]:
         """
-        Obtener historial de ventas filtrado por fechas
+        Construir el filtro de fechas como rango semiabierto sobre la columna
+        (sargable, usa idx_sales_created_at)
         """
-        try:
-            conn = db_manager.get_connection()
-            cursor = conn.cursor()
+        start, end = date_bounds(start_date, end_date)
+        clause = ""
+        params = []
+        
+        if start:
+            clause += f" AND {column} >= ?"
+            params.append(start)
             
-            query = """
-            SELECT 
-                s.id,
-                s.created_at as timestamp,
-                s.door_id,
-                s.amount,
-                s.payment_method,
-                s.payment_id as transaction_id,
-                s.status,
-                p.name as product_name,
-                s.amount as product_price,
-                p.description as category
+        if end:
+            clause += f" AND {column} < ?"
+            params.append(end)
+            
+        return clause, params
+    
+    def encode_cursor(self, created_at: str, sale_id: int) -> str:
+        """Cursor opaco con la clave (created_at, id) de la última venta de una página"""
+        raw = json.dumps([created_at, sale_id], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+    
+    def decode_cursor(self, cursor: str) -> Tuple[str, int]:
+        """Decodificar un cursor de página; ValueError si no es válido"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            created_at, sale_id = json.loads(raw)
+            return str(created_at), int(sale_id)
+        except Exception:
+            raise ValueError('Cursor de paginación no válido')
+    
+    def _keyset_filter(self, prefix: str, after: Optional[Tuple[str, int]]) -> Tuple[str, List]:
+        """
+        Filtro de paginación por clave: ventas anteriores a (created_at, id).
+        El primer término acota el rango del índice de created_at (que incluye
+        el rowid), así que cada página se lee sin recorrer las anteriores.
+        """
+        if not after:
+            return "", []
+        created_at, sale_id = after
+        clause = f" AND {prefix}created_at <= ? AND ({prefix}created_at < ? OR {prefix}id < ?)"
+        return clause, [created_at, created_at, sale_id]
+    
+    def _build_history_query(self,
+                             start_date: Optional[str] = None,
+                             end_date: Optional[str] = None,
+                             limit: int = 100,
+                             schemas: Optional[List[str]] = None,
+                             after: Optional[Tuple[str, int]] = None) -> Tuple[str, List]:
+        """
+        Construir la consulta del historial de ventas
+
+        Con `schemas` (p. ej. ['main', 'archive_2024_05']) se hace UNION ALL de
+        la tabla sales de cada base de datos adjunta; cada rama ya viene
+        ordenada y limitada por su índice de created_at. Con `after` se
+        devuelven solo las ventas posteriores a esa clave en el orden del
+        historial (paginación por cursor).
+        """
+        columns = """
+            s.id,
+            s.created_at as timestamp,
+            s.door_id,
+            s.amount,
+            s.payment_method,
+            s.payment_id as transaction_id,
+            s.status,
+            p.name as product_name,
+            s.amount as product_price,
+            p.description as category
+        """
+        
+        if not schemas or schemas == ['main']:
+            query = "SELECT" + columns + """
             FROM sales s
             LEFT JOIN products p ON s.door_id = p.door_id
             WHERE 1=1
             """
-            
+            clause, params = self._date_filter('s.created_at', start_date, end_date)
+            keyset_clause, keyset_params = self._keyset_filter('s.', after)
+            query += clause + keyset_clause
+            params += keyset_params
+        else:
+            branches = []
             params = []
+            for schema in schemas:
+                clause, branch_params = self._date_filter('created_at', start_date, end_date)
+                keyset_clause, keyset_params = self._keyset_filter('', after)
+                clause += keyset_clause
+                branch_params += keyset_params
+                branches.append(f"""
+                SELECT * FROM (
+                    SELECT id, created_at, door_id, amount, payment_method, payment_id, status
+                    FROM {schema}.sales
+                    WHERE 1=1{clause}
+                    ORDER BY created_at DESC, id DESC LIMIT ?
+                )""")
+                params.extend(branch_params)
+                params.append(limit)
+            query = "SELECT" + columns + """
+            FROM (""" + " UNION ALL ".join(branches) + """
+            ) s
+            LEFT JOIN products p ON s.door_id = p.door_id
+            """
+        
+        query += " ORDER BY s.created_at DESC, s.id DESC LIMIT ?"
+        params.append(limit)
+        
+        return query, params
+    
+    def get_sales_history(self, 
+                         start_date: Optional[str] = None, 
+                         end_date: Optional[str] = None,
+                         limit: int = 100,
+                         after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+        """
+        Obtener historial de ventas filtrado por fechas, incluidos los meses
+        archivados que toque el rango (con una conexión de solo lectura)
+        """
+        try:
+            conn = db_manager.get_read_connection()
+            cursor = conn.cursor()
             
-            if start_date:
-                query += " AND DATE(s.created_at) >= ?"
-                params.append(start_date)
-                
-            if end_date:
-                query += " AND DATE(s.created_at) <= ?"
-                params.append(end_date)
-                
-            query += " ORDER BY s.created_at DESC LIMIT ?"
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            result = cursor.fetchall()
-            conn.close()
+            # Los lotes van del más reciente al más antiguo y la base principal
+            # (que va con el primero) tiene siempre los meses más recientes.
+            # Cada lote se lee de una instantánea: una venta que entre a mitad
+            # de la consulta no descuadra la página
+            result = []
+            try:
+                batches = monthly_archiver.batches_for_range(start_date, end_date)
+                for index, months in enumerate(batches):
+                    with monthly_archiver.attached(conn, months) as schemas, db_manager.snapshot(conn):
+                        if index == 0:
+                            schemas = ['main'] + schemas
+                        query, params = self._build_history_query(
+                            start_date, end_date, limit - len(result), schemas, after)
+                        cursor.execute(query, params)
+                        result.extend(cursor.fetchall())
+                    if len(result) >= limit:
+                        break
+            finally:
+                conn.close()
             
             sales = []
             for row in result:
@@ -86,90 +211,144 @@ class SalesHistoryController:
             self.logger.error(f"Error al obtener historial de ventas: {e}")
             return []
     
+    def get_sales_history_page(self,
+                               start_date: Optional[str] = None,
+                               end_date: Optional[str] = None,
+                               limit: int = 100,
+                               cursor: Optional[str] = None) -> Dict:
+        """
+        Obtener una página del historial con paginación por cursor
+
+        El tamaño de página se limita a Config.SALES_HISTORY_MAX_PAGE. Se pide
+        una venta de más para saber si hay página siguiente sin contar filas.
+
+        Returns:
+            Dict con 'sales', 'next_cursor' (None en la última página) y 'limit'
+
+        Raises:
+            ValueError: si el cursor no es válido
+        """
+        limit = max(1, min(int(limit), Config.SALES_HISTORY_MAX_PAGE))
+        after = self.decode_cursor(cursor) if cursor else None
+        
+        sales = self.get_sales_history(start_date, end_date, limit + 1, after)
+        next_cursor = None
+        if len(sales) > limit:
+            sales = sales[:limit]
+            last = sales[-1]
+            next_cursor = self.encode_cursor(last['timestamp'], last['id'])
+        
+        return {'sales': sales, 'next_cursor': next_cursor, 'limit': limit}
+    
+    def _build_summary_queries(self,
+                               start_date: Optional[str] = None,
+                               end_date: Optional[str] = None,
+                               today: Optional[str] = None,
+                               use_rollup: bool = True) -> Dict[str, Tuple[str, List]]:
+        """
+        Construir las consultas del resumen de ventas completadas
+
+        Los días anteriores a hoy salen de sales_daily_rollup y solo el día
+        actual (UTC, como created_at) se agrega desde las filas de sales, así
+        que el coste no crece con el histórico. Con use_rollup=False (backfill
+        del rollup aún en curso) todo el rango se agrega desde sales.
+        Ambas consultas devuelven (door_id, payment_method, ventas, importe).
+        """
+        start, end = date_bounds(start_date, end_date)
+        today = today or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        queries = {}
+        
+        raw_start = start
+        if use_rollup:
+            rollup_end = min(end, today) if end else today
+            if not start or start < rollup_end:
+                query_rollup = """
+                SELECT 
+                    door_id,
+                    payment_method,
+                    SUM(sales_count),
+                    SUM(revenue)
+                FROM sales_daily_rollup
+                WHERE day < ?
+                """
+                params = [rollup_end]
+                if start:
+                    query_rollup += " AND day >= ?"
+                    params.append(start)
+                query_rollup += " GROUP BY door_id, payment_method"
+                queries['rollup'] = (query_rollup, params)
+            raw_start = max(start, today) if start else today
+        
+        if not end or not raw_start or raw_start < end:
+            # (el + unario evita que el planificador recorra entero
+            # idx_sales_door_created_at solo para agrupar por puerta)
+            query_raw = """
+            SELECT 
+                door_id,
+                payment_method,
+                COUNT(*),
+                SUM(amount)
+            FROM sales
+            WHERE status = 'completed'
+            """
+            params = []
+            if raw_start:
+                query_raw += " AND created_at >= ?"
+                params.append(raw_start)
+            if end:
+                query_raw += " AND created_at < ?"
+                params.append(end)
+            query_raw += " GROUP BY +door_id, payment_method"
+            queries['raw'] = (query_raw, params)
+        
+        return queries
+    
     def get_sales_summary(self, 
                          start_date: Optional[str] = None, 
                          end_date: Optional[str] = None) -> Dict:
         """
-        Obtener resumen de ventas
+        Obtener resumen de ventas completadas
         """
         try:
-            conn = db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # Consulta para totales
-            query_totals = """
-            SELECT 
-                COUNT(*) as total_sales,
-                SUM(amount) as total_revenue,
-                AVG(amount) as avg_sale
-            FROM sales 
-            WHERE 1=1
-            """
+            queries = self._build_summary_queries(
+                start_date, end_date, use_rollup=db_manager.is_rollup_ready())
             
-            params = []
-            
-            if start_date:
-                query_totals += " AND DATE(created_at) >= ?"
-                params.append(start_date)
+            # Rollup y ventas de hoy se leen de la misma instantánea: una venta
+            # que entre a mitad del resumen no se cuenta dos veces ni ninguna
+            with db_manager.read_snapshot() as conn:
+                cursor = conn.cursor()
                 
-            if end_date:
-                query_totals += " AND DATE(created_at) <= ?"
-                params.append(end_date)
-            
-            cursor.execute(query_totals, params)
-            totals = cursor.fetchall()
-            
-            # Consulta para ventas por método de pago
-            query_methods = """
-            SELECT 
-                payment_method,
-                COUNT(*) as count,
-                SUM(amount) as total
-            FROM sales 
-            WHERE 1=1
-            """
-            
-            if start_date or end_date:
-                if start_date:
-                    query_methods += " AND DATE(created_at) >= ?"
-                if end_date:
-                    query_methods += " AND DATE(created_at) <= ?"
-                    
-            query_methods += " GROUP BY payment_method"
-            
-            cursor.execute(query_methods, params)
-            methods = cursor.fetchall()
-            
-            # Consulta para productos más vendidos
-            query_products = """
-            SELECT 
-                s.door_id,
-                p.name,
-                COUNT(*) as sales_count,
-                SUM(s.amount) as total_revenue
-            FROM sales s
-            LEFT JOIN products p ON s.door_id = p.door_id
-            WHERE 1=1
-            """
-            
-            if start_date or end_date:
-                if start_date:
-                    query_products += " AND DATE(s.created_at) >= ?"
-                if end_date:
-                    query_products += " AND DATE(s.created_at) <= ?"
-                    
-            query_products += " GROUP BY s.door_id ORDER BY sales_count DESC LIMIT 10"
-            
-            cursor.execute(query_products, params)
-            products = cursor.fetchall()
-            
-            conn.close()
+                groups = []
+                for sql, params in queries.values():
+                    cursor.execute(sql, params)
+                    groups.extend(cursor.fetchall())
+                
+                cursor.execute("SELECT door_id, name FROM products")
+                names = dict(cursor.fetchall())
+            
+            # Combinar los grupos (puerta, método) en totales, métodos y productos
+            total_sales = 0
+            total_revenue = 0.0
+            methods = {}
+            products = {}
+            for door_id, method, count, revenue in groups:
+                revenue = float(revenue or 0.0)
+                total_sales += count
+                total_revenue += revenue
+                
+                method_totals = methods.setdefault(method, [0, 0.0])
+                method_totals[0] += count
+                method_totals[1] += revenue
+                
+                product_totals = products.setdefault(door_id, [0, 0.0])
+                product_totals[0] += count
+                product_totals[1] += revenue
             
             # Construir resumen
             summary = {
-                'total_sales': totals[0][0] if totals else 0,
-                'total_revenue': float(totals[0][1]) if totals and totals[0][1] else 0.0,
-                'average_sale': float(totals[0][2]) if totals and totals[0][2] else 0.0,
+                'total_sales': total_sales,
+                'total_revenue': total_revenue,
+                'average_sale': total_revenue / total_sales if total_sales else 0.0,
                 'payment_methods': [],
                 'top_products': [],
                 'period': {
@@ -179,20 +358,21 @@ class SalesHistoryController:
             }
             
             # Procesar métodos de pago
-            for method in methods:
+            for method, (count, total) in methods.items():
                 summary['payment_methods'].append({
-                    'method': method[0],
-                    'count': method[1],
-                    'total': float(method[2])
+                    'method': method,
+                    'count': count,
+                    'total': total
                 })
             
             # Procesar productos más vendidos
-            for product in products:
+            top = sorted(products.items(), key=lambda item: item[1][0], reverse=True)[:10]
+            for door_id, (count, total) in top:
                 summary['top_products'].append({
-                    'door_id': product[0],
-                    'product_name': product[1] or f'Puerta {product[0]}',
-                    'sales_count': product[2],
-                    'total_revenue': float(product[3])
+                    'door_id': door_id,
+                    'product_name': names.get(door_id) or f'Puerta {door_id}',
+                    'sales_count': count,
+                    'total_revenue': total
                 })
                 
             return summary
@@ -208,16 +388,130 @@ class SalesHistoryController:
                 'period': {'start_date': start_date, 'end_date': end_date}
             }
     
+    def _build_export_query(self,
+                            start_date: Optional[str] = None,
+                            end_date: Optional[str] = None,
+                            schema: str = 'main') -> Tuple[str, List]:
+        """Construir la consulta de exportación (orden cronológico) de una base de datos"""
+        query = f"""
+        SELECT 
+            s.id,
+            s.created_at,
+            s.door_id,
+            p.name,
+            s.amount,
+            s.payment_method,
+            s.payment_id,
+            s.status
+        FROM {schema}.sales s
+        LEFT JOIN main.products p ON s.door_id = p.door_id
+        WHERE 1=1
+        """
+        clause, params = self._date_filter('s.created_at', start_date, end_date)
+        query += clause + " ORDER BY s.created_at, s.id"
+        return query, params
+    
+    def iter_sales(self,
+                   start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> Iterator[tuple]:
+        """
+        Recorrer las ventas del rango en orden cronológico sin cargarlas en
+        memoria: primero los meses archivados y después la base principal,
+        leyendo del cursor de solo lectura por bloques. Cada lote de meses
+        adjuntos se lee de una instantánea y la base principal va en la del
+        lote más reciente, así una venta que entre durante la exportación no
+        aparece a medias
+        """
+        conn = db_manager.get_read_connection()
+        try:
+            batches = list(reversed(monthly_archiver.batches_for_range(start_date, end_date)))
+            for index, months in enumerate(batches):
+                with monthly_archiver.attached(conn, sorted(months)) as schemas, db_manager.snapshot(conn):
+                    if index == len(batches) - 1:
+                        schemas = schemas + ['main']
+                    for schema in schemas:
+                        query, params = self._build_export_query(start_date, end_date, schema)
+                        cursor = conn.execute(query, params)
+                        try:
+                            while True:
+                                rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+                                if not rows:
+                                    break
+                                yield from rows
+                        finally:
+                            cursor.close()
+        finally:
+            conn.close()
+    
+    def _export_record(self, row: tuple) -> Dict:
+        """Convertir una fila de iter_sales al formato de exportación"""
+        sale_id, created_at, door_id, name, amount, method, payment_id, status = row
+        return {
+            'id': sale_id,
+            'timestamp': created_at,
+            'door_id': door_id,
+            'product_name': name or f'Producto Puerta {door_id}',
+            'amount': amount,
+            'payment_method': method,
+            'transaction_id': payment_id or 'N/A',
+            'status': status
+        }
+    
+    def iter_sales_csv(self,
+                       start_date: Optional[str] = None,
+                       end_date: Optional[str] = None) -> Iterator[bytes]:
+        """Generar el CSV de ventas en trozos de ~EXPORT_CHUNK_BYTES"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_CSV_FIELDS)
+        
+        for row in self.iter_sales(start_date, end_date):
+            sale = self._export_record(row)
+            # created_at es 'YYYY-MM-DD HH:MM:SS': basta con cortar la cadena
+            timestamp = sale['timestamp'] or ''
+            writer.writerow([
+                sale['id'],
+                timestamp[:10],
+                timestamp[11:19],
+                sale['door_id'],
+                sale['product_name'],
+                f"€{sale['amount']:.2f}",
+                sale['payment_method'],
+                sale['transaction_id'],
+                sale['status']
+            ])
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        
+        yield buffer.getvalue().encode('utf-8')
+    
+    def iter_sales_ndjson(self,
+                          start_date: Optional[str] = None,
+                          end_date: Optional[str] = None) -> Iterator[bytes]:
+        """Generar las ventas como NDJSON (un objeto JSON por línea) en trozos"""
+        lines = []
+        size = 0
+        for row in self.iter_sales(start_date, end_date):
+            line = json.dumps(self._export_record(row), ensure_ascii=False) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield ''.join(lines).encode('utf-8')
+                lines = []
+                size = 0
+        
+        if lines:
+            yield ''.join(lines).encode('utf-8')
+    
     def export_sales_to_csv(self, 
                            start_date: Optional[str] = None, 
                            end_date: Optional[str] = None) -> str:
         """
-        Exportar ventas a archivo CSV
+        Exportar ventas a archivo CSV (sin límite de filas, escribiendo por trozos)
         """
         try:
-            # Obtener datos de ventas
-            sales = self.get_sales_history(start_date, end_date, limit=10000)
-            
             # Generar nombre de archivo
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"historial_ventas_{timestamp}.csv"
@@ -227,29 +521,9 @@ class SalesHistoryController:
             os.makedirs("exports", exist_ok=True)
             
             # Escribir archivo CSV
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = [
-                    'ID', 'Fecha', 'Hora', 'Puerta', 'Producto', 
-                    'Precio', 'Método Pago', 'ID Transacción', 'Estado'
-                ]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for sale in sales:
-                    # Parsear fecha y hora
-                    dt = datetime.fromisoformat(sale['timestamp'].replace('Z', ''))
-                    
-                    writer.writerow({
-                        'ID': sale['id'],
-                        'Fecha': dt.strftime('%Y-%m-%d'),
-                        'Hora': dt.strftime('%H:%M:%S'),
-                        'Puerta': sale['door_id'],
-                        'Producto': sale['product_name'],
-                        'Precio': f"€{sale['amount']:.2f}",
-                        'Método Pago': sale['payment_method'],
-                        'ID Transacción': sale['transaction_id'],
-                        'Estado': sale['status']
-                    })
+            with open(filepath, 'wb') as csvfile:
+                for chunk in self.iter_sales_csv(start_date, end_date):
+                    csvfile.write(chunk)
             
             self.logger.info(f"Archivo CSV exportado: {filepath}")
             return filepath
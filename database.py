@@ -1,121 +1,768 @@
 """
 Modelo de base de datos para la máquina expendedora
 """
+import os
 import sqlite3
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import queue
+import threading
+import time
+import atexit
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from datetime import datetime, timedelta, timezone
 from config import Config
+from utils.migrate_database import MigrationEngine, INDEXES, SALES_ROLLUP_VERSION
 
 logger = logging.getLogger(__name__)
 
+# Inserciones de auditoría que se pueden escribir en lote
+AUDIT_INSERTS = {
+    'system_logs': '''
+        INSERT INTO system_logs (level, message, module, door_id, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''',
+    'door_maintenance': '''
+        INSERT INTO door_maintenance (door_id, action, status, notes, operator, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+}
+
+# Sumar una venta completada a sales_daily_rollup. Las ventas anteriores a la
+# migración (id <= rollup_backfill_max_id) las agrega el backfill mientras su
+# bloque no se haya procesado; si se completan cuando el cursor del backfill
+# ya las ha dejado atrás (o el backfill terminó), las suma este camino.
+ROLLUP_ADD_SALE = f'''
+    INSERT INTO sales_daily_rollup (day, door_id, payment_method, sales_count, revenue)
+    SELECT substr(created_at, 1, 10), door_id, payment_method, 1, amount
+    FROM sales
+    WHERE id = ? AND (
+        id > (
+            SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) FROM settings
+            WHERE key = 'rollup_backfill_max_id'
+        )
+        OR EXISTS (
+            SELECT 1 FROM schema_version
+            WHERE version = {SALES_ROLLUP_VERSION}
+              AND (completed = 1 OR CAST(backfill_cursor AS INTEGER) >= sales.id)
+        )
+    )
+    ON CONFLICT (day, door_id, payment_method) DO UPDATE SET
+        sales_count = sales_count + excluded.sales_count,
+        revenue = revenue + excluded.revenue
+'''
+
+
+# Columnas de products que se devuelven como dict
+PRODUCT_COLUMNS = ('id', 'name', 'price', 'stock', 'door_id', 'image_url', 'description',
+                   'active', 'min_stock', 'max_stock')
+PRODUCT_SELECT = f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products"
+
+
+def product_from_row(row: tuple) -> Dict:
+    """Convertir una fila de PRODUCT_SELECT en dict"""
+    return dict(zip(PRODUCT_COLUMNS, row))
+
+
+def utc_timestamp() -> str:
+    """Timestamp UTC con el mismo formato que CURRENT_TIMESTAMP de SQLite"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def date_bounds(start_date: Optional[str] = None,
+                end_date: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Convertir un rango de días 'YYYY-MM-DD' (ambos incluidos) en límites
+    semiabiertos de timestamp [inicio, fin) comparables con created_at.
+    Así los filtros usan los índices en lugar de DATE(created_at), que obliga
+    a recorrer la tabla completa.
+    """
+    start = None
+    end = None
+    if start_date:
+        start = datetime.strptime(start_date[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+    if end_date:
+        end = (datetime.strptime(end_date[:10], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return start, end
+
+
+class PooledCursor:
+    """
+    Cursor de una conexión prestada por el pool.
+    Mantiene viva la PooledConnection mientras el cursor exista, así que
+    get_connection().cursor() o get_connection().execute(...) no devuelven
+    la conexión al pool mientras todavía se están leyendo filas.
+    """
+    __slots__ = ('_cursor', '_owner')
+
+    def __init__(self, cursor: sqlite3.Cursor, owner: 'PooledConnection'):
+        self._cursor = cursor
+        self._owner = owner
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, *args):
+        self._cursor.execute(*args)
+        return self
+
+    def executemany(self, *args):
+        self._cursor.executemany(*args)
+        return self
+
+    def executescript(self, *args):
+        self._cursor.executescript(*args)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, *args):
+        return self._cursor.fetchmany(*args)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._cursor)
+
+
+class PooledConnection:
+    """
+    Conexión prestada por el pool.
+    Se comporta como sqlite3.Connection pero close() la devuelve al pool
+    en lugar de cerrarla, de modo que el código existente
+    (get_connection() ... conn.close()) sigue funcionando sin cambios.
+    Los cursores que crea la mantienen viva (PooledCursor).
+    """
+    __slots__ = ('_conn', '_pool')
+
+    def __init__(self, conn: sqlite3.Connection, pool: 'ConnectionPool'):
+        self._conn = conn
+        self._pool = pool
+
+    def __getattr__(self, name):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
+    def _live(self) -> sqlite3.Connection:
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return conn
+
+    def cursor(self, *args):
+        return PooledCursor(self._live().cursor(*args), self)
+
+    def execute(self, *args):
+        return PooledCursor(self._live().execute(*args), self)
+
+    def executemany(self, *args):
+        return PooledCursor(self._live().executemany(*args), self)
+
+    def executescript(self, *args):
+        return PooledCursor(self._live().executescript(*args), self)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        """Devolver la conexión al pool"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Conexiones olvidadas sin close() vuelven igualmente al pool (solo
+        # cuando ya no queda ningún PooledCursor suyo leyendo filas)
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones SQLite de larga duración.
+    Las conexiones se abren una sola vez (WAL + busy timeout) y se reutilizan
+    entre los hilos de Flask. Si no hay ninguna libre se abre una nueva, así
+    que nunca se bloquea; al devolverla solo se conservan `size` conexiones.
+    Con size=0 se abre y cierra una conexión por llamada (comportamiento antiguo).
+    Con read_only=True las conexiones se abren con mode=ro y query_only.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, busy_timeout: float = 5.0,
+                 journal_mode: str = 'WAL', read_only: bool = False):
+        self.db_path = db_path
+        self.size = max(0, int(size))
+        self.busy_timeout = busy_timeout
+        self.journal_mode = journal_mode
+        self.read_only = read_only
+        self._idle = queue.LifoQueue(maxsize=self.size) if self.size else None
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._reused = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Abrir y configurar una conexión nueva"""
+        if self.read_only:
+            uri = 'file:' + pathname2url(os.path.abspath(self.db_path)) + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        if self.journal_mode and not self.read_only:
+            mode = conn.execute(f"PRAGMA journal_mode = {self.journal_mode}").fetchone()[0]
+            if mode.upper() == 'WAL':
+                # En WAL, synchronous=NORMAL es seguro y evita un fsync por commit
+                conn.execute("PRAGMA synchronous = NORMAL")
+        with self._lock:
+            self._opened += 1
+        return conn
+
+    def acquire(self):
+        """Obtener una conexión del pool (o una nueva si no hay libres)"""
+        if self._idle is None:
+            return self._connect()
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._reused += 1
+        except queue.Empty:
+            conn = self._connect()
+        return PooledConnection(conn, self)
+
+    def release(self, conn: sqlite3.Connection):
+        """Devolver una conexión al pool, descartando transacciones a medias"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Descartando conexión del pool: {e}")
+            conn.close()
+
+    def close_all(self):
+        """Cerrar todas las conexiones inactivas del pool"""
+        if self._idle is None:
+            return
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de uso del pool"""
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize() if self._idle is not None else 0,
+            'opened': self._opened,
+            'reused': self._reused,
+            'journal_mode': self.journal_mode,
+            'busy_timeout': self.busy_timeout,
+            'read_only': self.read_only
+        }
+
+
+class AuditLogWriter:
+    """
+    Escritor en segundo plano para system_logs y door_maintenance.
+    Los hilos de petición y los callbacks de sensores solo encolan la fila;
+    un hilo dedicado las agrupa y hace un único commit cada `flush_interval`
+    segundos o cada `batch_size` filas. La cola está acotada: si se llena se
+    espera como mucho `enqueue_timeout` y después la fila se descarta,
+    contabilizándolo en las métricas.
+    """
+
+    _STOP = object()
+
+    def __init__(self, write_batch: Callable[[List[Tuple[str, tuple]]], bool],
+                 max_queue: int = 1000, flush_interval: float = 0.2,
+                 batch_size: int = 100, enqueue_timeout: float = 0.05):
+        self._write_batch = write_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.enqueue_timeout = enqueue_timeout
+        self._thread = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._closed = False
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'backpressure_waits': 0,
+            'high_water': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0
+        }
+
+    def _ensure_started(self):
+        """Arrancar el hilo escritor la primera vez que se encola algo"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def submit(self, table: str, row: tuple) -> bool:
+        """Encolar una fila de auditoría sin esperar a que se escriba"""
+        self._ensure_started()
+        # La comprobación de cierre y el alta en _pending van juntas: close()
+        # marca _closed con el mismo lock, así ninguna fila entra en la cola
+        # después del _STOP sin estar contabilizada
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._pending += 1
+        if closed:
+            return self._write_batch([(table, row)])
+        try:
+            try:
+                self._queue.put_nowait((table, row))
+            except queue.Full:
+                with self._lock:
+                    self._stats['backpressure_waits'] += 1
+                self._queue.put((table, row), timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending -= 1
+                self._stats['dropped'] += 1
+                self._idle.notify_all()
+            logger.warning(f"Cola de logs llena, fila de {table} descartada")
+            return False
+
+        with self._lock:
+            self._stats['enqueued'] += 1
+            depth = self._queue.qsize()
+            if depth > self._stats['high_water']:
+                self._stats['high_water'] = depth
+        return True
+
+    def _run(self):
+        """Bucle del hilo escritor: agrupar filas y confirmarlas en lote"""
+        while True:
+            item = self._queue.get()
+            batch = []
+            stop = item is self._STOP
+            if not stop:
+                batch.append(item)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+
+            if batch:
+                started = time.perf_counter()
+                ok = self._write_batch(batch)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                with self._lock:
+                    self._stats['batches'] += 1
+                    self._stats['last_batch_size'] = len(batch)
+                    self._stats['last_flush_ms'] = round(elapsed_ms, 3)
+                    self._stats['written' if ok else 'failed'] += len(batch)
+                    self._pending -= len(batch)
+                    self._idle.notify_all()
+
+            if stop:
+                self._drain_after_stop()
+                break
+
+    def _drain_after_stop(self):
+        """Escribir en el acto las filas que llegaron a la cola detrás del _STOP"""
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP:
+                leftover.append(item)
+        if not leftover:
+            return
+        ok = self._write_batch(leftover)
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['last_batch_size'] = len(leftover)
+            self._stats['written' if ok else 'failed'] += len(leftover)
+            self._pending -= len(leftover)
+            self._idle.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Esperar a que todas las filas encoladas estén escritas"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Vaciar la cola y detener el hilo escritor (hook de apagado)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas del escritor (profundidad de cola, descartes, lotes...)"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+
+class ProductCatalogCache:
+    """
+    Caché en memoria de los productos activos, indexada por door_id.
+    Los métodos de escritura de DatabaseManager la actualizan en el momento
+    (write-through) y los cambios hechos por otras conexiones o procesos se
+    detectan con PRAGMA data_version sobre una conexión propia: si el valor
+    cambió desde la última carga, el catálogo se vuelve a leer entero y se
+    compara con el anterior (cualquier commit, p. ej. un log, cambia
+    data_version). `version` solo crece si algún producto cambió.
+    Los suscriptores reciben (door_id, producto) por cada producto cambiado
+    y (None, None) cuando el catálogo se invalida entero.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection],
+                 load: Callable[[sqlite3.Connection], List[Dict]]):
+        self._connect = connect
+        self._load = load
+        self._watch = None
+        self._data_version = None
+        self._products = None
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[Optional[str], Optional[Dict]], None]] = []
+        self.version = 0
+        self._stats = {'hits': 0, 'reloads': 0, 'unchanged_reloads': 0, 'writes': 0}
+
+    def _refresh(self) -> List[Tuple[Optional[str], Optional[Dict]]]:
+        """
+        Recargar el catálogo si es la primera vez o si otra conexión escribió
+
+        Returns:
+            Cambios (door_id, producto) para avisar a los suscriptores
+        """
+        if self._watch is None:
+            self._watch = self._connect()
+        data_version = self._watch.execute("PRAGMA data_version").fetchone()[0]
+        if self._products is not None and data_version == self._data_version:
+            return []
+        # data_version se lee antes de cargar: un commit intermedio provoca otra recarga
+        previous = self._products
+        self._products = {product['door_id']: product for product in self._load(self._watch)}
+        self._data_version = data_version
+        self._stats['reloads'] += 1
+
+        if previous is None:
+            # Nadie pudo leer un catálogo sin cargar: no hay nada que avisar
+            self.version += 1
+            return []
+        changes = []
+        for door_id in previous.keys() | self._products.keys():
+            product = self._products.get(door_id)
+            if product != previous.get(door_id):
+                changes.append((door_id, dict(product) if product is not None else None))
+        if changes:
+            self.version += 1
+        else:
+            self._stats['unchanged_reloads'] += 1
+        return changes
+
+    def get(self, door_id: str) -> Optional[Dict]:
+        """Obtener una copia del producto activo de una puerta"""
+        with self._lock:
+            changes = self._refresh()
+            self._stats['hits'] += 1
+            product = self._products.get(door_id)
+            product = dict(product) if product is not None else None
+        self._notify_all(changes)
+        return product
+
+    def get_all(self) -> List[Dict]:
+        """Obtener copias de todos los productos activos ordenados por door_id"""
+        with self._lock:
+            changes = self._refresh()
+            self._stats['hits'] += 1
+            products = [dict(self._products[door_id]) for door_id in sorted(self._products)]
+        self._notify_all(changes)
+        return products
+
+    def get_version(self) -> int:
+        """Versión actual del catálogo (comprobando antes cambios externos)"""
+        with self._lock:
+            changes = self._refresh()
+            version = self.version
+        self._notify_all(changes)
+        return version
+
+    def put(self, product: Optional[Dict], door_id: str = None, conn: sqlite3.Connection = None):
+        """
+        Guardar un producto tras escribirlo (None o inactivo lo quita)
+
+        Como en set_stock, si se pasa conn su transacción se confirma aquí
+        dentro del lock del catálogo.
+        """
+        door_id = door_id or product['door_id']
+        with self._lock:
+            if conn is not None:
+                conn.commit()
+            if self._products is None:
+                return
+            if product is not None and product['active']:
+                product = self._products[door_id] = dict(product)
+            else:
+                product = None
+                self._products.pop(door_id, None)
+            self._written()
+            product = dict(product) if product is not None else None
+        self._notify(door_id, product)
+
+    def set_stock(self, door_id: str, stock: int, conn: sqlite3.Connection = None):
+        """
+        Fijar el stock de un producto con el valor leído en la transacción
+
+        Si se pasa conn, su transacción se confirma aquí dentro del lock del
+        catálogo: ninguna lectura puede recargarlo entre el commit y la
+        escritura en la caché, y dos escrituras no se aplican en desorden.
+        """
+        with self._lock:
+            if conn is not None:
+                conn.commit()
+            product = self._products.get(door_id) if self._products is not None else None
+            if product is None:
+                return
+            product['stock'] = stock
+            self._written()
+            product = dict(product)
+        self._notify(door_id, product)
+
+    def subscribe(self, callback: Callable[[Optional[str], Optional[Dict]], None]):
+        """Registrar callback(door_id, producto) para cada cambio del catálogo"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _notify_all(self, changes: List[Tuple[Optional[str], Optional[Dict]]]):
+        for door_id, product in changes:
+            self._notify(door_id, product)
+
+    def _notify(self, door_id: Optional[str], product: Optional[Dict]):
+        # Fuera del lock del catálogo: los suscriptores pueden volver a leerlo
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(door_id, product)
+            except Exception as e:
+                logger.error(f"Error en aviso de cambio del catálogo: {e}")
+
+    def _written(self):
+        self.version += 1
+        self._stats['writes'] += 1
+
+    def invalidate(self):
+        """Descartar el catálogo; se recarga en la siguiente lectura"""
+        with self._lock:
+            self._products = None
+        self._notify(None, None)
+
+    def close(self):
+        """Cerrar la conexión de vigilancia"""
+        with self._lock:
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+            self._products = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas de la caché (aciertos, recargas, escrituras)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['version'] = self.version
+            stats['products'] = len(self._products) if self._products is not None else None
+        return stats
+
+
 class DatabaseManager:
-    def __init__(self):
-        self.db_path = Config.DATABASE_PATH
+    def __init__(self, db_path: str = None, pool_size: int = None,
+                 busy_timeout: float = None, journal_mode: str = None,
+                 async_logs: bool = None, read_pool_size: int = None,
+                 catalog_cache: bool = None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        busy_timeout = Config.DB_BUSY_TIMEOUT if busy_timeout is None else busy_timeout
+        self.pool = ConnectionPool(
+            self.db_path,
+            size=Config.DB_POOL_SIZE if pool_size is None else pool_size,
+            busy_timeout=busy_timeout,
+            journal_mode=Config.DB_JOURNAL_MODE if journal_mode is None else journal_mode
+        )
+        # Conexiones de solo lectura para informes y exportaciones
+        self.read_pool = ConnectionPool(
+            self.db_path,
+            size=Config.DB_READ_POOL_SIZE if read_pool_size is None else read_pool_size,
+            busy_timeout=busy_timeout,
+            read_only=True
+        )
+        self.log_writer = None
+        if Config.DB_ASYNC_LOGS if async_logs is None else async_logs:
+            self.log_writer = AuditLogWriter(
+                self._write_audit_rows,
+                max_queue=Config.DB_LOG_QUEUE_SIZE,
+                flush_interval=Config.DB_LOG_FLUSH_MS / 1000.0,
+                batch_size=Config.DB_LOG_BATCH_SIZE
+            )
+        self.migrations = MigrationEngine()
+        self._rollup_ready = False
         self.init_database()
+        # Catálogo en memoria para las lecturas de productos de cada petición
+        self.catalog = None
+        if Config.DB_CATALOG_CACHE if catalog_cache is None else catalog_cache:
+            self.catalog = ProductCatalogCache(self.read_pool._connect, self._fetch_active_products)
     
     def get_connection(self):
-        """Obtener conexión a la base de datos"""
-        return sqlite3.connect(self.db_path)
+        """Obtener conexión a la base de datos (prestada por el pool)"""
+        return self.pool.acquire()
+    
+    def get_read_connection(self):
+        """Obtener conexión de solo lectura (mode=ro, query_only) para informes"""
+        return self.read_pool.acquire()
+    
+    @contextmanager
+    def read_snapshot(self):
+        """
+        Conexión de solo lectura fijada a una instantánea WAL
+
+        Todas las consultas dentro del bloque ven el mismo estado de la base de
+        datos aunque entren ventas mientras tanto, y como en WAL los lectores
+        no bloquean a los escritores, un informe largo nunca retrasa el commit
+        de una venta.
+        """
+        conn = self.get_read_connection()
+        try:
+            with self.snapshot(conn):
+                yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def snapshot(self, conn):
+        """
+        Fijar una instantánea WAL sobre una conexión de lectura ya abierta
+
+        Sirve para adjuntar antes los meses archivados: SQLite no deja
+        desadjuntar una base leída dentro de la transacción, así que el
+        DETACH tiene que ir después de cerrar la instantánea.
+        """
+        try:
+            # La instantánea se fija con la primera lectura de la transacción
+            conn.execute('BEGIN')
+            conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            yield conn
+        finally:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+    
+    def flush_logs(self, timeout: float = 5.0) -> bool:
+        """Esperar a que se escriban los logs encolados"""
+        if self.log_writer is None:
+            return True
+        return self.log_writer.flush(timeout)
+    
+    def close(self):
+        """Vaciar los logs pendientes y cerrar las conexiones del pool"""
+        if self.log_writer is not None:
+            self.log_writer.close()
+        if self.catalog is not None:
+            self.catalog.close()
+        self.pool.close_all()
+        self.read_pool.close_all()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas del pool de conexiones, del escritor de logs y del catálogo"""
+        return {
+            'pool': self.pool.get_stats(),
+            'read_pool': self.read_pool.get_stats(),
+            'log_writer': self.log_writer.get_stats() if self.log_writer is not None else None,
+            'catalog': self.catalog.get_stats() if self.catalog is not None else None
+        }
+    
+    def is_rollup_ready(self) -> bool:
+        """Indicar si sales_daily_rollup ya incluye todas las ventas históricas"""
+        if self._rollup_ready:
+            return True
+        try:
+            conn = self.get_connection()
+            row = conn.execute(
+                "SELECT completed FROM schema_version WHERE version = ?", (SALES_ROLLUP_VERSION,)
+            ).fetchone()
+            conn.close()
+            self._rollup_ready = bool(row and row[0])
+        except Exception as e:
+            logger.error(f"Error al consultar el estado del rollup de ventas: {e}")
+        return self._rollup_ready
     
     def init_database(self):
-        """Inicializar la base de datos con las tablas necesarias"""
+        """
+        Inicializar la base de datos aplicando las migraciones pendientes.
+        Si el esquema ya está en la última versión solo se lee schema_version.
+        """
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Tabla de productos
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    price REAL NOT NULL,
-                    stock INTEGER NOT NULL DEFAULT 0,
-                    door_id TEXT UNIQUE NOT NULL,
-                    image_url TEXT,
-                    description TEXT,
-                    active BOOLEAN DEFAULT 1,
-                    min_stock INTEGER DEFAULT 0,
-                    max_stock INTEGER DEFAULT 10,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Tabla de ventas/transacciones
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sales (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER,
-                    door_id TEXT NOT NULL,
-                    payment_method TEXT NOT NULL,
-                    amount REAL NOT NULL,
-                    status TEXT NOT NULL,
-                    payment_id TEXT,
-                    quantity INTEGER DEFAULT 1,
-                    dispensed BOOLEAN DEFAULT 0,
-                    dispensed_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (product_id) REFERENCES products (id)
-                )
-            ''')
-            
-            # Tabla de reposiciones/stock
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS restocks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER,
-                    door_id TEXT NOT NULL,
-                    quantity_added INTEGER NOT NULL,
-                    previous_stock INTEGER,
-                    new_stock INTEGER,
-                    operator TEXT,
-                    notes TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (product_id) REFERENCES products (id)
-                )
-            ''')
-            
-            # Tabla de mantenimiento de puertas
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS door_maintenance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    door_id TEXT NOT NULL,
-                    action TEXT NOT NULL,
-                    status TEXT,
-                    notes TEXT,
-                    operator TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Tabla de logs del sistema
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS system_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    level TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    module TEXT,
-                    door_id TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Tabla de configuración
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT NOT NULL,
-                    description TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            try:
+                if self.migrations.is_up_to_date(conn):
+                    return
+                from_version = self.migrations.migrate(conn)
+            finally:
+                conn.close()
             
-            conn.commit()
-            conn.close()
+            # Insertar productos de ejemplo solo en bases de datos nuevas
+            if from_version == 0:
+                self._insert_sample_data()
             
-            # Insertar productos de ejemplo si no existen
-            self._insert_sample_data()
+            # Rellenar tablas grandes por bloques sin bloquear el arranque
+            self.migrations.start_backfills(self.get_connection)
             
             logger.info("Base de datos inicializada correctamente")
             
@@ -168,73 +815,71 @@ class DatabaseManager:
     
     # Métodos para productos
     def get_product_by_door(self, door_id: str) -> Optional[Dict]:
-        """Obtener producto por ID de puerta"""
+        """Obtener producto por ID de puerta (desde el catálogo en memoria si está activo)"""
+        if self.catalog is not None:
+            try:
+                return self.catalog.get(door_id)
+            except sqlite3.Error as e:
+                logger.warning(f"Catálogo en memoria no disponible, leyendo de la base de datos: {e}")
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT id, name, price, stock, door_id, image_url, description, active, min_stock, max_stock
-                FROM products WHERE door_id = ? AND active = 1
-            ''', (door_id,))
+            cursor.execute(f"{PRODUCT_SELECT} WHERE door_id = ? AND active = 1", (door_id,))
             
             result = cursor.fetchone()
             conn.close()
             
-            if result:
-                return {
-                    'id': result[0],
-                    'name': result[1],
-                    'price': result[2],
-                    'stock': result[3],
-                    'door_id': result[4],
-                    'image_url': result[5],
-                    'description': result[6],
-                    'active': result[7],
-                    'min_stock': result[8],
-                    'max_stock': result[9]
-                }
-            return None
+            return product_from_row(result) if result else None
             
         except Exception as e:
             logger.error(f"Error al obtener producto para puerta {door_id}: {e}")
             return None
     
     def get_all_products(self) -> List[Dict]:
-        """Obtener todos los productos activos"""
+        """Obtener todos los productos activos (desde el catálogo en memoria si está activo)"""
+        if self.catalog is not None:
+            try:
+                return self.catalog.get_all()
+            except sqlite3.Error as e:
+                logger.warning(f"Catálogo en memoria no disponible, leyendo de la base de datos: {e}")
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, name, price, stock, door_id, image_url, description, active, min_stock, max_stock
-                FROM products WHERE active = 1 ORDER BY door_id
-            ''')
-            
-            results = cursor.fetchall()
+            products = self._fetch_active_products(conn)
             conn.close()
             
-            products = []
-            for result in results:
-                products.append({
-                    'id': result[0],
-                    'name': result[1],
-                    'price': result[2],
-                    'stock': result[3],
-                    'door_id': result[4],
-                    'image_url': result[5],
-                    'description': result[6],
-                    'active': result[7],
-                    'min_stock': result[8],
-                    'max_stock': result[9]
-                })
-            
             return products
             
         except Exception as e:
             logger.error(f"Error al obtener productos: {e}")
             return []
     
+    def _fetch_active_products(self, conn) -> List[Dict]:
+        """Leer los productos activos ordenados por puerta"""
+        cursor = conn.execute(f"{PRODUCT_SELECT} WHERE active = 1 ORDER BY door_id")
+        return [product_from_row(result) for result in cursor.fetchall()]
+    
+    def subscribe_products(self, callback: Callable[[Optional[str], Optional[Dict]], None]) -> bool:
+        """
+        Recibir callback(door_id, producto) tras cada cambio de producto y
+        (None, None) cuando el catálogo se recarga entero. Devuelve False sin
+        catálogo en memoria (no hay avisos).
+        """
+        if self.catalog is None:
+            return False
+        self.catalog.subscribe(callback)
+        return True
+    
+    def get_catalog_version(self) -> Optional[int]:
+        """Versión del catálogo de productos (None sin caché en memoria)"""
+        if self.catalog is None:
+            return None
+        try:
+            return self.catalog.get_version()
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo comprobar la versión del catálogo: {e}")
+            return None
+    
     def update_product(self, door_id: str, **kwargs) -> bool:
         """Actualizar producto"""
         try:
@@ -260,11 +905,16 @@ class DatabaseManager:
             
             query = f"UPDATE products SET {', '.join(updates)} WHERE door_id = ?"
             cursor.execute(query, values)
+            updated = cursor.rowcount > 0
             
-            conn.commit()
+            if updated and self.catalog is not None:
+                result = conn.execute(f"{PRODUCT_SELECT} WHERE door_id = ?", (door_id,)).fetchone()
+                self.catalog.put(product_from_row(result) if result else None, door_id, conn)
+            else:
+                conn.commit()
             conn.close()
             
-            return cursor.rowcount > 0
+            return updated
             
         except Exception as e:
             logger.error(f"Error al actualizar producto {door_id}: {e}")
@@ -281,11 +931,18 @@ class DatabaseManager:
                 SET stock = stock - ?, updated_at = CURRENT_TIMESTAMP
                 WHERE door_id = ? AND stock >= ?
             ''', (quantity, door_id, quantity))
+            updated = cursor.rowcount > 0
             
-            conn.commit()
+            if updated and self.catalog is not None:
+                # Stock absoluto de esta misma transacción (no un delta que se
+                # restaría dos veces si otra lectura ya recargó el catálogo)
+                cursor.execute("SELECT stock FROM products WHERE door_id = ?", (door_id,))
+                self.catalog.set_stock(door_id, cursor.fetchone()[0], conn)
+            else:
+                conn.commit()
             conn.close()
             
-            return cursor.rowcount > 0
+            return updated
             
         except Exception as e:
             logger.error(f"Error al decrementar stock de {door_id}: {e}")
@@ -315,11 +972,15 @@ class DatabaseManager:
             return None
     
     def update_sale_status(self, sale_id: int, status: str, dispensed: bool = False) -> bool:
-        """Actualizar estado de venta"""
+        """Actualizar estado de venta (y el rollup diario si pasa a completada)"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-            
+            cursor.execute('BEGIN IMMEDIATE')
+
+            cursor.execute("SELECT status FROM sales WHERE id = ?", (sale_id,))
+            previous = cursor.fetchone()
+
             if dispensed:
                 cursor.execute('''
                     UPDATE sales 
@@ -332,38 +993,127 @@ class DatabaseManager:
                     SET status = ?
                     WHERE id = ?
                 ''', (status, sale_id))
-            
+            updated = cursor.rowcount > 0
+
+            if updated and status == 'completed' and previous[0] != 'completed':
+                cursor.execute(ROLLUP_ADD_SALE, (sale_id,))
+
             conn.commit()
             conn.close()
-            
-            return cursor.rowcount > 0
+
+            return updated
             
         except Exception as e:
             logger.error(f"Error al actualizar venta {sale_id}: {e}")
             return False
     
+    def complete_sale(self, door_id: str, payment_id: str, transaction_id: str = None,
+                      method: str = 'contactless') -> Optional[Dict]:
+        """
+        Completar una venta con pago aprobado en una única transacción
+
+        Consulta el producto, descuenta el stock solo si queda existencia e
+        inserta la venta ya como completada/dispensada dentro de un
+        BEGIN IMMEDIATE, con un solo commit; en la misma transacción suma la
+        venta a sales_daily_rollup. Si el payment_id ya tiene una
+        venta completada se devuelve esa venta sin volver a descontar stock.
+
+        Returns:
+            Dict con sale_id, producto y stock restante, o None si no hay
+            producto activo o no queda stock
+        """
+        conn = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+
+            cursor.execute(f"{PRODUCT_SELECT} WHERE door_id = ? AND active = 1", (door_id,))
+            result = cursor.fetchone()
+            if not result:
+                conn.rollback()
+                return None
+
+            product = product_from_row(result)
+
+            # Evitar descontar dos veces si el mismo pago se confirma de nuevo
+            if payment_id:
+                cursor.execute('''
+                    SELECT id FROM sales
+                    WHERE payment_id = ? AND door_id = ? AND status = 'completed'
+                ''', (payment_id, door_id))
+                existing = cursor.fetchone()
+                if existing:
+                    conn.rollback()
+                    return {
+                        'sale_id': existing[0],
+                        'product': product,
+                        'remaining_stock': product['stock'],
+                        'transaction_id': transaction_id,
+                        'duplicate': True
+                    }
+
+            cursor.execute('''
+                UPDATE products
+                SET stock = stock - 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND stock >= 1
+            ''', (product['id'],))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                logger.warning(f"Venta no completada: puerta {door_id} sin stock")
+                return None
+
+            cursor.execute('''
+                INSERT INTO sales (product_id, door_id, payment_method, amount, status, payment_id,
+                                   quantity, dispensed, dispensed_at)
+                VALUES (?, ?, ?, ?, 'completed', ?, 1, 1, CURRENT_TIMESTAMP)
+            ''', (product['id'], door_id, method, product['price'], payment_id))
+            sale_id = cursor.lastrowid
+            cursor.execute(ROLLUP_ADD_SALE, (sale_id,))
+
+            if self.catalog is not None:
+                self.catalog.set_stock(door_id, product['stock'] - 1, conn)
+            else:
+                conn.commit()
+
+            return {
+                'sale_id': sale_id,
+                'product': product,
+                'remaining_stock': product['stock'] - 1,
+                'transaction_id': transaction_id,
+                'duplicate': False
+            }
+
+        except Exception as e:
+            logger.error(f"Error al completar venta de {door_id} (pago {payment_id}): {e}")
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            return None
+        finally:
+            if conn is not None:
+                conn.close()
+
     def get_sales_by_date(self, date: str = None) -> List[Dict]:
         """Obtener ventas por fecha"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            if date:
-                cursor.execute('''
-                    SELECT s.*, p.name as product_name
-                    FROM sales s
-                    LEFT JOIN products p ON s.product_id = p.id
-                    WHERE DATE(s.created_at) = ?
-                    ORDER BY s.created_at DESC
-                ''', (date,))
-            else:
-                cursor.execute('''
-                    SELECT s.*, p.name as product_name
-                    FROM sales s
-                    LEFT JOIN products p ON s.product_id = p.id
-                    WHERE DATE(s.created_at) = DATE('now')
-                    ORDER BY s.created_at DESC
-                ''')
+            # created_at se guarda en UTC (CURRENT_TIMESTAMP), igual que DATE('now')
+            if not date:
+                date = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+            start, end = date_bounds(date, date)
+            
+            cursor.execute('''
+                SELECT s.*, p.name as product_name
+                FROM sales s
+                LEFT JOIN products p ON s.product_id = p.id
+                WHERE s.created_at >= ? AND s.created_at < ?
+                ORDER BY s.created_at DESC
+            ''', (start, end))
             
             results = cursor.fetchall()
             conn.close()
@@ -422,7 +1172,10 @@ class DatabaseManager:
                 WHERE door_id = ?
             ''', (new_stock, door_id))
             
-            conn.commit()
+            if self.catalog is not None:
+                self.catalog.set_stock(door_id, new_stock, conn)
+            else:
+                conn.commit()
             conn.close()
             
             return True
@@ -434,36 +1187,32 @@ class DatabaseManager:
     # Métodos para mantenimiento de puertas
     def log_door_maintenance(self, door_id: str, action: str, status: str = None, 
                            notes: str = None, operator: str = None) -> bool:
-        """Registrar mantenimiento de puerta"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO door_maintenance (door_id, action, status, notes, operator)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (door_id, action, status, notes, operator))
-            
-            conn.commit()
-            conn.close()
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error al registrar mantenimiento: {e}")
-            return False
+        """Registrar mantenimiento de puerta (en segundo plano si está habilitado)"""
+        row = (door_id, action, status, notes, operator, utc_timestamp())
+        if self.log_writer is not None:
+            return self.log_writer.submit('door_maintenance', row)
+        return self._write_audit_rows([('door_maintenance', row)])
     
     # Métodos para logs del sistema
     def log_system_event(self, level: str, message: str, module: str = None, door_id: str = None) -> bool:
-        """Registrar evento del sistema"""
+        """Registrar evento del sistema (en segundo plano si está habilitado)"""
+        row = (level, message, module, door_id, utc_timestamp())
+        if self.log_writer is not None:
+            return self.log_writer.submit('system_logs', row)
+        return self._write_audit_rows([('system_logs', row)])
+    
+    def _write_audit_rows(self, rows: List[Tuple[str, tuple]]) -> bool:
+        """Insertar filas de auditoría (tabla, valores) con un único commit"""
         try:
+            by_table = {}
+            for table, row in rows:
+                by_table.setdefault(table, []).append(row)
+            
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            cursor.execute('''
-                INSERT INTO system_logs (level, message, module, door_id)
-                VALUES (?, ?, ?, ?)
-            ''', (level, message, module, door_id))
+            for table, table_rows in by_table.items():
+                cursor.executemany(AUDIT_INSERTS[table], table_rows)
             
             conn.commit()
             conn.close()
@@ -471,7 +1220,7 @@ class DatabaseManager:
             return True
             
         except Exception as e:
-            logger.error(f"Error al registrar log del sistema: {e}")
+            logger.error(f"Error al registrar {len(rows)} filas de auditoría: {e}")
             return False
 
 
@@ -2,45 +2,188 @@
 Controlador de configuración de la máquina expendedora
 Maneja la carga y actualización de la configuración desde JSON
 """
-import json
 import logging
+import threading
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set
 from pathlib import Path
+from utils.config_store import ConfigStore, get_config_store
 
 logger = logging.getLogger(__name__)
 
+# Estados de puerta que mantiene DoorStatusIndex
+DOOR_STATUSES = ('available', 'low_stock', 'out_of_stock', 'door_open', 'disabled', 'no_product')
+# Estados con stock vendible
+SELLABLE_STATUSES = ('available', 'low_stock')
+# Estados que requieren reposición
+RESTOCK_STATUSES = ('out_of_stock', 'low_stock')
+
+
+def calculate_door_status(door_open: bool, product: Optional[Dict]) -> str:
+    """Calcular estado de una puerta a partir del sensor y de su producto"""
+    if not product:
+        return 'no_product'
+    
+    if not product.get('active', True):
+        return 'disabled'
+    
+    if door_open:
+        return 'door_open'
+    
+    stock = product.get('stock', 0)
+    min_stock = product.get('min_stock', 0)
+    
+    if stock <= 0:
+        return 'out_of_stock'
+    elif stock <= min_stock:
+        return 'low_stock'
+    else:
+        return 'available'
+
+
+class DoorStatusIndex:
+    """
+    Índice de estado de las puertas mantenido de forma incremental.
+    Guarda, por puerta, el estado del sensor y el producto, y por estado el
+    conjunto de puertas, así que contar o listar puertas por estado no recorre
+    la configuración. Se actualiza con cada cambio de stock (avisos del catálogo)
+    y de sensor (avisos del almacén de configuración); ante una recarga completa
+    se invalida y se reconstruye en la siguiente consulta.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._door_open: Dict[str, bool] = {}
+        self._products: Dict[str, Optional[Dict]] = {}
+        self._status: Dict[str, str] = {}
+        self._by_status: Dict[str, Set[str]] = {status: set() for status in DOOR_STATUSES}
+        self._changes = 0
+        self.ready = False
+
+    def begin_rebuild(self) -> int:
+        """Marca para rebuild(): si hay cambios entre medias, el índice no queda listo"""
+        with self._lock:
+            return self._changes
+
+    def rebuild(self, door_open: Dict[str, bool], products: Dict[str, Dict], token: int):
+        """Reconstruir el índice completo a partir de la configuración y los productos"""
+        with self._lock:
+            self._door_open = dict(door_open)
+            self._products = {door_id: products.get(door_id) for door_id in door_open}
+            self._status = {}
+            for members in self._by_status.values():
+                members.clear()
+            for door_id in self._door_open:
+                self._set_status(door_id)
+            self.ready = token == self._changes
+
+    def invalidate(self):
+        """Forzar la reconstrucción en la siguiente consulta"""
+        with self._lock:
+            self._changes += 1
+            self.ready = False
+
+    def update_door(self, door_id: str, door_config: Optional[Dict]):
+        """Aplicar un cambio de configuración de una puerta (sensor, alta o baja)"""
+        with self._lock:
+            self._changes += 1
+            if door_config is None:
+                self._door_open.pop(door_id, None)
+                self._products.pop(door_id, None)
+                self._set_status(door_id)
+                return
+            if door_id not in self._door_open:
+                # Puerta nueva: su producto no está en el índice
+                self.ready = False
+            self._door_open[door_id] = bool(door_config.get('door_open', False))
+            self._set_status(door_id)
+
+    def update_product(self, door_id: str, product: Optional[Dict]):
+        """Aplicar un cambio del producto de una puerta (stock, activo...)"""
+        with self._lock:
+            self._changes += 1
+            if door_id not in self._door_open:
+                return
+            self._products[door_id] = product
+            self._set_status(door_id)
+
+    def _set_status(self, door_id: str):
+        previous = self._status.pop(door_id, None)
+        if previous is not None:
+            self._by_status[previous].discard(door_id)
+        if door_id in self._door_open:
+            status = calculate_door_status(self._door_open[door_id], self._products.get(door_id))
+            self._status[door_id] = status
+            self._by_status[status].add(door_id)
+
+    def status_of(self, door_id: str) -> Optional[str]:
+        """Estado de una puerta, o None si no existe"""
+        return self._status.get(door_id)
+
+    def count(self, *statuses: str) -> int:
+        """Número de puertas en los estados indicados"""
+        return sum(len(self._by_status[status]) for status in statuses)
+
+    def doors(self, *statuses: str) -> Set[str]:
+        """Puertas en los estados indicados"""
+        with self._lock:
+            return set().union(*(self._by_status[status] for status in statuses))
+
+    def counts(self) -> Dict[str, int]:
+        """Número de puertas por estado"""
+        with self._lock:
+            return {status: len(members) for status, members in self._by_status.items()}
+
+    def __len__(self):
+        return len(self._status)
+
+
 class MachineConfigManager:
-    def __init__(self, config_path: str = "machine_config.json"):
+    def __init__(self, config_path: str = "machine_config.json", flush_ms: int = None,
+                 store: ConfigStore = None):
         self.config_path = Path(config_path)
-        self.config = {}
-        self.load_config()
+        # Configuración compartida con HardwareController (mismo dict en memoria)
+        self.store = store or get_config_store(str(self.config_path), flush_ms=flush_ms)
+        self._doors_view = None
+        # Estados de puerta precalculados (se construye en la primera consulta)
+        self.status_index = DoorStatusIndex()
+        self._product_events = None
+        self.store.subscribe(self._on_config_changed)
     
-    def load_config(self) -> bool:
-        """Cargar configuración desde archivo JSON"""
-        try:
-            if self.config_path.exists():
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    self.config = json.load(f)
-                logger.info("Configuración cargada correctamente")
-                return True
-            else:
-                logger.error(f"Archivo de configuración no encontrado: {self.config_path}")
-                return False
-        except Exception as e:
-            logger.error(f"Error al cargar configuración: {e}")
-            return False
+    @property
+    def config(self) -> Dict[str, Any]:
+        """Configuración compartida en memoria"""
+        return self.store.data
     
-    def save_config(self) -> bool:
-        """Guardar configuración al archivo JSON"""
-        try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-            logger.info("Configuración guardada correctamente")
+    @property
+    def config_version(self) -> int:
+        """Crece con cada carga o cambio de la configuración"""
+        return self.store.version
+    
+    @property
+    def writer(self):
+        """Escritor diferido del archivo JSON"""
+        return self.store.writer
+    
+    def load_config(self) -> bool:
+        """Volver a cargar la configuración desde el archivo JSON"""
+        if self.store.load():
+            logger.info("Configuración cargada correctamente")
             return True
-        except Exception as e:
-            logger.error(f"Error al guardar configuración: {e}")
-            return False
+        return False
+    
+    def save_config(self, section: str = None, key: str = None) -> bool:
+        """
+        Marcar la configuración para guardarla en el archivo JSON
+        
+        La escritura se agrupa con los demás cambios y se hace como mucho una
+        vez cada CONFIG_FLUSH_MS (con 0, en el momento); flush_config() la fuerza.
+        """
+        return self.store.changed(section, key)
+    
+    def flush_config(self) -> bool:
+        """Escribir ya los cambios pendientes de la configuración"""
+        return self.store.flush()
     
     def get_doors(self) -> Dict[str, Any]:
         """Obtener configuración de todas las puertas (solo info física)"""
@@ -60,57 +203,104 @@ class MachineConfigManager:
         if not door_config:
             return None
         
-        # Obtener producto desde base de datos
-        product = db_manager.get_product_by_door(door_id)
+        return self._merge_door(door_config, db_manager.get_product_by_door(door_id))
+    
+    def get_all_doors_with_products(self) -> Dict[str, Any]:
+        """
+        Obtener todas las puertas con información de productos
+        
+        Los productos activos se leen de una sola vez y se combinan con la
+        configuración en una pasada. La vista resultante se reutiliza mientras
+        no cambien ni la configuración ni la versión del catálogo, así que los
+        dicts devueltos son compartidos y no deben modificarse.
+        """
+        from database import db_manager
         
-        # Combinar información
+        catalog_version = db_manager.get_catalog_version()
+        key = (self.config_version, catalog_version)
+        view = self._doors_view
+        if catalog_version is not None and view is not None and view[0] == key:
+            return view[1]
+        
+        products = {product['door_id']: product for product in db_manager.get_all_products()}
+        doors = {door_id: self._merge_door(door_config, products.get(door_id))
+                 for door_id, door_config in self.get_doors().items()}
+        
+        self._doors_view = (key, doors)
+        return doors
+    
+    def _merge_door(self, door_config: Dict, product: Optional[Dict]) -> Dict[str, Any]:
+        """Combinar la configuración física de una puerta con su producto"""
         door_info = door_config.copy()
         door_info['product'] = product
         door_info['status'] = self._calculate_door_status(door_config, product)
-        
         return door_info
     
-    def get_all_doors_with_products(self) -> Dict[str, Any]:
-        """Obtener todas las puertas con información de productos"""
-        doors = {}
-        for door_id in self.get_doors().keys():
-            doors[door_id] = self.get_door_with_product(door_id)
-        return doors
-    
     def _calculate_door_status(self, door_config: Dict, product: Optional[Dict]) -> str:
         """Calcular estado de la puerta basado en configuración y producto"""
-        if not product:
-            return 'no_product'
-        
-        if not product.get('active', True):
-            return 'disabled'
+        return calculate_door_status(door_config.get('door_open', False), product)
+    
+    def _on_config_changed(self, section: Optional[str], version: int, key: Optional[str]):
+        """Mantener el índice de estados con los cambios de configuración"""
+        if section == 'doors' and key is not None:
+            self.status_index.update_door(key, self.get_door(key))
+        elif section in (None, 'doors'):
+            self.status_index.invalidate()
+    
+    def _on_product_changed(self, door_id: Optional[str], product: Optional[Dict]):
+        """Mantener el índice de estados con los cambios del catálogo"""
+        if door_id is None:
+            self.status_index.invalidate()
+        else:
+            self.status_index.update_product(door_id, product)
+    
+    def get_status_index(self) -> DoorStatusIndex:
+        """
+        Índice de estados de puerta, reconstruido solo si hace falta
         
-        if door_config.get('door_open', False):
-            return 'door_open'
+        Sin catálogo en memoria no hay avisos de stock, así que se reconstruye
+        en cada consulta (como antes, una sola lectura de productos). Con
+        catálogo, consultar su versión (un PRAGMA data_version) recarga los
+        cambios hechos por otros procesos y los avisa al índice antes de usarlo.
+        """
+        from database import db_manager
         
-        stock = product.get('stock', 0)
-        min_stock = product.get('min_stock', 0)
+        index = self.status_index
+        if self._product_events is None:
+            self._product_events = db_manager.subscribe_products(self._on_product_changed)
+        if index.ready and self._product_events and db_manager.get_catalog_version() is not None:
+            return index
         
-        if stock <= 0:
-            return 'out_of_stock'
-        elif stock <= min_stock:
-            return 'low_stock'
-        else:
-            return 'available'
+        token = index.begin_rebuild()
+        products = {product['door_id']: product for product in db_manager.get_all_products()}
+        with self.store.section_lock('doors'):
+            door_open = {door_id: bool(door.get('door_open', False))
+                         for door_id, door in self.get_doors().items()}
+        index.rebuild(door_open, products, token)
+        return index
+    
+    def get_door_status(self, door_id: str) -> Optional[str]:
+        """Estado actual de una puerta"""
+        return self.get_status_index().status_of(door_id)
+    
+    def get_status_counts(self) -> Dict[str, int]:
+        """Número de puertas por estado"""
+        return self.get_status_index().counts()
     
     def update_door_sensor(self, door_id: str, door_open: bool) -> bool:
         """Actualizar estado del sensor de puerta"""
         try:
             if door_id in self.config.get('doors', {}):
-                self.config['doors'][door_id]['door_open'] = door_open
-                self.config['doors'][door_id]['last_maintenance'] = datetime.now().isoformat()
+                with self.store.section_lock('doors'):
+                    self.config['doors'][door_id]['door_open'] = door_open
+                    self.config['doors'][door_id]['last_maintenance'] = datetime.now().isoformat()
                 
                 # Registrar evento en base de datos
                 from database import db_manager
                 action = 'door_opened' if door_open else 'door_closed'
                 db_manager.log_door_maintenance(door_id, action, 'sensor_update')
                 
-                self.save_config()
+                self.save_config('doors', door_id)
                 return True
             return False
         except Exception as e:
@@ -121,10 +311,11 @@ class MachineConfigManager:
         """Actualizar estado de una puerta"""
         try:
             if door_id in self.config.get('doors', {}):
-                self.config['doors'][door_id]['status'] = status
-                if status == 'dispensing':
-                    self.config['doors'][door_id]['last_dispensed'] = datetime.now().isoformat()
-                return self.save_config()
+                with self.store.section_lock('doors'):
+                    self.config['doors'][door_id]['status'] = status
+                    if status == 'dispensing':
+                        self.config['doors'][door_id]['last_dispensed'] = datetime.now().isoformat()
+                return self.save_config('doors', door_id)
             return False
         except Exception as e:
             logger.error(f"Error al actualizar estado de puerta {door_id}: {e}")
@@ -134,18 +325,19 @@ class MachineConfigManager:
         """Actualizar stock de una puerta"""
         try:
             if door_id in self.config.get('doors', {}):
-                door = self.config['doors'][door_id]
-                door['product']['stock'] = new_stock
-                
-                # Actualizar estado según stock
-                if new_stock <= 0:
-                    door['status'] = 'out_of_stock'
-                    door['requires_restock'] = True
-                elif door['status'] == 'out_of_stock' and new_stock > 0:
-                    door['status'] = 'available'
-                    door['requires_restock'] = False
+                with self.store.section_lock('doors'):
+                    door = self.config['doors'][door_id]
+                    door['product']['stock'] = new_stock
+                    
+                    # Actualizar estado según stock
+                    if new_stock <= 0:
+                        door['status'] = 'out_of_stock'
+                        door['requires_restock'] = True
+                    elif door['status'] == 'out_of_stock' and new_stock > 0:
+                        door['status'] = 'available'
+                        door['requires_restock'] = False
                 
-                return self.save_config()
+                return self.save_config('doors', door_id)
             return False
         except Exception as e:
             logger.error(f"Error al actualizar stock de puerta {door_id}: {e}")
@@ -160,10 +352,10 @@ class MachineConfigManager:
         return self.update_door_status(door_id, 'available')
     
     def get_available_doors(self) -> Dict[str, Any]:
-        """Obtener solo las puertas disponibles"""
+        """Obtener solo las puertas con stock vendible (según el índice de estados)"""
         doors = self.get_doors()
-        return {door_id: door for door_id, door in doors.items() 
-                if door.get('status') == 'available' and door.get('product', {}).get('stock', 0) > 0}
+        return {door_id: doors[door_id] for door_id in sorted(self.get_status_index().doors(*SELLABLE_STATUSES))
+                if door_id in doors}
     
     def get_machine_settings(self) -> Dict[str, Any]:
         """Obtener configuración general de la máquina"""
@@ -184,10 +376,9 @@ class MachineConfigManager:
     def set_maintenance_mode(self, enabled: bool) -> bool:
         """Activar/desactivar modo mantenimiento"""
         try:
-            if 'security' not in self.config:
-                self.config['security'] = {}
-            self.config['security']['maintenance_mode'] = enabled
-            return self.save_config()
+            with self.store.section_lock('security'):
+                self.config.setdefault('security', {})['maintenance_mode'] = enabled
+            return self.save_config('security')
         except Exception as e:
             logger.error(f"Error al cambiar modo mantenimiento: {e}")
             return False
@@ -255,10 +446,10 @@ class MachineConfigManager:
             return False
     
     def get_doors_needing_restock(self) -> Dict[str, Any]:
-        """Obtener puertas que necesitan reabastecimiento"""
+        """Obtener puertas sin stock o por debajo de su stock mínimo (stock de la base de datos)"""
         doors = self.get_doors()
-        return {door_id: door for door_id, door in doors.items() 
-                if door.get('requires_restock', False) or door.get('product', {}).get('stock', 0) <= 2}
+        return {door_id: doors[door_id] for door_id in sorted(self.get_status_index().doors(*RESTOCK_STATUSES))
+                if door_id in doors}
     
     def get_secret_sequence_config(self) -> Dict[str, Any]:
         """Obtener configuración de la secuencia secreta"""
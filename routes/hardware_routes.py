@@ -65,6 +65,38 @@ def close_door_hardware(door_id):
             'error': str(e)
         }), 500
 
+@hardware_bp.route('/api/hardware/doors/open', methods=['POST'])
+def open_doors_hardware():
+    """Abrir varias puertas escalonando la activación de los relés"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('door_ids'), list) or not data['door_ids']:
+            return jsonify({
+                'success': False,
+                'error': 'Campo door_ids requerido'
+            }), 400
+        if not all(isinstance(door_id, str) for door_id in data['door_ids']):
+            return jsonify({
+                'success': False,
+                'error': 'door_ids debe ser una lista de identificadores de puerta'
+            }), 400
+        
+        results = hardware_controller.open_doors(data['door_ids'])
+        opened = sum(1 for result in results.values() if result)
+        logger.info(f"Apertura en lote via hardware: {opened}/{len(results)} puertas")
+        return jsonify({
+            'success': opened == len(results),
+            'results': results,
+            'opened': opened
+        })
+        
+    except Exception as e:
+        logger.error(f"Error abriendo puertas en lote: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @hardware_bp.route('/api/hardware/door/<door_id>/state', methods=['GET'])
 def get_door_hardware_state(door_id):
     """Obtener estado de hardware de una puerta"""
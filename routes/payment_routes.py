@@ -34,33 +34,25 @@ def process_payment():
             # Procesar respuesta completa si el pago fue aprobado
             if response.get('success') and response.get('status') == 'approved' and door_id:
                 try:
-                    product = db_manager.get_product_by_door(door_id)
-                    if product:
-                        # Registrar transacción en base de datos
-                        transaction_id = response.get('transaction_id', f"TXN_{door_id}_{int(time.time())}")
-                        sale_id = db_manager.create_sale(
-                            door_id=door_id,
-                            payment_method='contactless',
-                            amount=product['price'],
-                            product_id=product['id'],
-                            payment_id=payment_id
-                        )
-                        
-                        if sale_id:
-                            # Actualizar estado de la venta a completada
-                            db_manager.update_sale_status(sale_id, 'completed', dispensed=True)
-                        
-                        # Actualizar stock
-                        db_manager.decrease_stock(door_id, 1)
-                        
+                    # Registrar venta y descontar stock en una sola transacción
+                    transaction_id = response.get('transaction_id', f"TXN_{door_id}_{int(time.time())}")
+                    sale = db_manager.complete_sale(door_id, payment_id, transaction_id, 'contactless')
+                    if sale:
                         response.update({
                             'message': 'Pago aprobado - producto a dispensar',
                             'transaction_id': transaction_id,
-                            'amount': product['price'],
+                            'amount': sale['product']['price'],
                             'door_id': door_id,
                             'hardware_success': True,
                             'redirected_from': 'process_payment'
                         })
+                    else:
+                        logger.error(f"Pago {payment_id} aprobado pero no se pudo registrar la venta de {door_id}")
+                        response.update({
+                            'success': False,
+                            'error': 'Pago aprobado pero no se pudo registrar la venta (producto no disponible)',
+                            'processing_error': True
+                        })
                 except Exception as e:
                     logger.error(f"Error procesando transacción completada: {e}")
                     response.update({
@@ -159,34 +151,30 @@ def check_payment_status():
                 
                 # Obtener información del producto para completar la transacción
                 if door_id:
-                    product = db_manager.get_product_by_door(door_id)
-                    if product:
-                        # Registrar transacción en base de datos
-                        transaction_id = response.get('transaction_id', f"TXN_{door_id}_{int(time.time())}")
-                        sale_id = db_manager.create_sale(
-                            door_id=door_id,
-                            payment_method='contactless',
-                            amount=product['price'],
-                            product_id=product['id'],
-                            payment_id=payment_id
-                        )
-                        
-                        if sale_id:
-                            # Actualizar estado de la venta a completada
-                            db_manager.update_sale_status(sale_id, 'completed', dispensed=True)
-                        
-                        # Actualizar stock
-                        db_manager.decrease_stock(door_id, 1)
-                        
+                    # Registrar venta y descontar stock en una sola transacción
+                    transaction_id = response.get('transaction_id', f"TXN_{door_id}_{int(time.time())}")
+                    sale = db_manager.complete_sale(door_id, payment_id, transaction_id, 'contactless')
+                    if sale:
                         return jsonify({
                             'success': True,
                             'status': 'approved',
                             'message': 'Pago aprobado - producto a dispensar',
                             'transaction_id': transaction_id,
-                            'amount': product['price'],
+                            'amount': sale['product']['price'],
                             'door_id': door_id,
                             'hardware_success': True
                         })
+                    
+                    logger.error(f"Pago {payment_id} aprobado pero no se pudo registrar la venta de {door_id}")
+                    return jsonify({
+                        'success': False,
+                        'status': 'approved',
+                        'error': 'Pago aprobado pero no se pudo registrar la venta (producto no disponible)',
+                        'processing_error': True,
+                        'transaction_id': transaction_id,
+                        'payment_id': payment_id,
+                        'door_id': door_id
+                    })
                 
                 return jsonify({
                     'success': True,
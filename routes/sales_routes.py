@@ -2,9 +2,10 @@
 Rutas relacionadas con ventas, historial y exportación
 """
 import logging
-from flask import Blueprint, request, jsonify
-from database import db_manager
-from controllers.sales_history_controller import sales_history_controller
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from database import db_manager, date_bounds
+from controllers.sales_history_controller import sales_history_controller, gzip_chunks
 
 # Crear blueprint
 sales_bp = Blueprint('sales', __name__)
@@ -30,14 +31,26 @@ def get_today_sales():
 
 @sales_bp.route('/api/sales/history')
 def get_sales_history():
-    """Obtener historial de ventas con filtros opcionales"""
+    """
+    Obtener historial de ventas con filtros opcionales, paginado por cursor.
+    La respuesta incluye next_cursor; se pasa como ?cursor= para la página
+    siguiente (null en la última).
+    """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    limit = int(request.args.get('limit', 100))
+    cursor = request.args.get('cursor')
     
     try:
-        sales = sales_history_controller.get_sales_history(start_date, end_date, limit)
-        return jsonify({'success': True, 'sales': sales})
+        limit = int(request.args.get('limit', 100))
+        page = sales_history_controller.get_sales_history_page(start_date, end_date, limit, cursor)
+        return jsonify({
+            'success': True,
+            'sales': page['sales'],
+            'next_cursor': page['next_cursor'],
+            'limit': page['limit']
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error al obtener historial de ventas: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -72,6 +85,49 @@ def export_sales_csv():
         logger.error(f"Error al exportar CSV: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@sales_bp.route('/api/sales/export/stream')
+def stream_sales_export():
+    """
+    Descargar el historial de ventas en streaming, sin límite de filas
+
+    Parámetros: start_date, end_date, format=csv|ndjson, gzip=1
+    """
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    export_format = request.args.get('format', 'csv').lower()
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    
+    # Los generadores son perezosos: una fecha inválida fallaría ya con el
+    # 200 y la cabecera del adjunto enviados, así que se valida antes
+    try:
+        date_bounds(start_date, end_date)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if export_format == 'csv':
+        chunks = sales_history_controller.iter_sales_csv(start_date, end_date)
+        mimetype = 'text/csv; charset=utf-8'
+    elif export_format == 'ndjson':
+        chunks = sales_history_controller.iter_sales_ndjson(start_date, end_date)
+        mimetype = 'application/x-ndjson'
+    else:
+        return jsonify({'success': False, 'error': f'Formato no soportado: {export_format}'}), 400
+    
+    filename = f"historial_ventas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Cache-Control': 'no-store'
+        }
+    )
+
 @sales_bp.route('/api/sales/export/json')
 def export_sales_json():
     """Exportar resumen de ventas a JSON"""
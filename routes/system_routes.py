@@ -7,16 +7,33 @@ from config import Config
 from database import db_manager
 from controllers.payment_system import payment_processor
 from controllers.hardware_controller import hardware_controller
-from machine_config import config_manager
+from machine_config import config_manager, SELLABLE_STATUSES, RESTOCK_STATUSES
+from utils.http_cache import response_cache
 
 # Crear blueprint
 system_bp = Blueprint('system', __name__)
 logger = logging.getLogger(__name__)
 
+
+def _catalog_versions():
+    """(versión del catálogo,) o None si la caché de productos está desactivada"""
+    catalog_version = db_manager.get_catalog_version()
+    return None if catalog_version is None else (catalog_version,)
+
+
+def _doors_versions():
+    """Versiones de las que depende la vista de puertas (catálogo y configuración)"""
+    catalog = _catalog_versions()
+    return None if catalog is None else catalog + (config_manager.config_version,)
+
+
 @system_bp.route('/api/doors')
 def get_doors():
     """API para obtener todas las puertas con productos"""
-    return jsonify({'success': True, 'doors': config_manager.get_all_doors_with_products()})
+    return response_cache.respond(
+        'doors', _doors_versions,
+        lambda: {'success': True, 'doors': config_manager.get_all_doors_with_products()}
+    )
 
 @system_bp.route('/api/door/<door_id>')
 def get_door(door_id):
@@ -31,8 +48,10 @@ def get_door(door_id):
 def get_all_products():
     """Obtener todos los productos"""
     try:
-        products = db_manager.get_all_products()
-        return jsonify({'success': True, 'products': products})
+        return response_cache.respond(
+            'products', _catalog_versions,
+            lambda: {'success': True, 'products': db_manager.get_all_products()}
+        )
         
     except Exception as e:
         logger.error(f"Error al obtener productos: {e}")
@@ -51,11 +70,10 @@ def get_development_config():
 def get_machine_config():
     """Obtener configuración completa de la máquina"""
     try:
-        config = config_manager.get_config()
-        return jsonify({
-            'success': True,
-            'config': config
-        })
+        return response_cache.respond(
+            'config', lambda: (config_manager.config_version,),
+            lambda: {'success': True, 'config': config_manager.config}
+        )
     except Exception as e:
         logger.error(f"Error al obtener configuración: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -95,31 +113,21 @@ def get_door_info(door_id):
 
 @system_bp.route('/api/machine/status', methods=['GET'])
 def get_machine_status():
-    """Obtener estado general de la máquina"""
+    """Obtener estado general de la máquina (contadores del índice de estados de puerta)"""
     try:
-        config = config_manager.get_config()
-        doors_summary = {}
-        available_count = 0
-        
-        for door_id in config_manager.get_door_ids():
-            door = config_manager.get_door(door_id)
-            doors_summary[door_id] = {
-                'status': door['status'],
-                'stock': door['product']['stock'],
-                'product_name': door['product']['name']
-            }
-            if door['status'] == 'available' and door['product']['stock'] > 0:
-                available_count += 1
+        config = config_manager.config
+        index = config_manager.get_status_index()
         
         return jsonify({
             'success': True,
-            'system_status': 'maintenance' if config.get('maintenance_mode', False) else 'operational',
-            'doors_summary': doors_summary,
-            'available_doors': available_count,
-            'total_doors': len(doors_summary),
+            'system_status': 'maintenance' if config_manager.is_maintenance_mode() else 'operational',
+            'status_counts': index.counts(),
+            'available_doors': index.count(*SELLABLE_STATUSES),
+            'doors_needing_restock': index.count(*RESTOCK_STATUSES),
+            'total_doors': len(index),
             'display_config': config.get('display', {}),
             'payment_methods': config.get('payment_methods', {}),
-            'last_updated': config.get('last_updated', 'unknown')
+            'config_version': config_manager.config_version
         })
     except Exception as e:
         logger.error(f"Error al obtener estado de máquina: {e}")
@@ -135,6 +143,7 @@ def system_status():
         'success': True,
         'gpio': gpio_status,
         'payments': payment_methods,
+        'database': db_manager.get_stats(),
         'platform': Config.PLATFORM
     })
 
@@ -0,0 +1,93 @@
+"""
+Pruebas de la exportación columnar de ventas
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+np = pytest.importorskip('numpy')
+
+from database import DatabaseManager
+from utils.db_archive import MonthlyArchiver
+from utils.columnar_sales import ColumnarSalesStore, aggregate
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base de datos temporal con ventas de marzo (archivado) y abril de 2024"""
+    manager = DatabaseManager(db_path=str(tmp_path / 'test.db'))
+    manager.migrations.wait_for_backfills(5)
+    conn = manager.get_connection()
+    conn.executemany('''
+        INSERT INTO sales (door_id, payment_method, amount, status, payment_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [('A1' if i % 2 else 'B2', 'cash' if i % 3 else 'stripe', 12.5 if i % 2 else 35.0,
+           'failed' if i % 10 == 0 else 'completed', f'PAY_{i}',
+           f'2024-0{3 + i // 100}-{1 + i % 28:02d} 10:00:00')
+          for i in range(200)])
+    conn.commit()
+    conn.close()
+    yield manager
+    manager.close()
+
+
+def _stores(db, tmp_path, machines):
+    archiver = MonthlyArchiver(db, archive_dir=str(tmp_path / 'archive'), keep_months=0)
+    archiver.archive_month('2024-03')
+    return [ColumnarSalesStore(db, base_dir=str(tmp_path / 'columnar'), machine_id=machine, archiver=archiver)
+            for machine in machines]
+
+
+def test_exporta_columnas_y_carga_con_memory_map(db, tmp_path):
+    """Cada columna es un .npy con su tipo y se abre con memory-map"""
+    store = _stores(db, tmp_path, ['m1'])[0]
+    meta = store.export_month('2024-03')
+    month = store.load_month(store.month_path('2024-03'))
+
+    assert meta['rows'] == 100
+    assert isinstance(month.ts, np.memmap)
+    assert month.door.dtype == np.uint16
+    assert month.amount.dtype == np.int32
+    assert month.amount[0] == 3500
+    assert str(np.datetime64(int(month.ts[0]), 's')) == '2024-03-01T10:00:00'
+    assert sorted(month.meta['doors']) == ['A1', 'B2']
+
+
+def test_agrega_varias_maquinas_y_meses(db, tmp_path):
+    """La agregación combina meses y máquinas y coincide con SQL"""
+    for store in _stores(db, tmp_path, ['m1', 'm2']):
+        assert store.export_month('2024-03')['rows'] == 100
+        assert store.export_month('2024-04')['rows'] == 100
+
+    months = store.load()
+    by_door = aggregate(months, by='door')
+    by_day = aggregate(store.load(machines=['m1'], start_month='2024-04'), by='day')
+
+    conn = db.get_read_connection()
+    conn.execute("ATTACH DATABASE ? AS march", (str(tmp_path / 'archive' / 'vending_2024_03.db'),))
+    expected = dict((row[0], (row[1] * 2, row[2] * 2)) for row in conn.execute('''
+        SELECT door_id, COUNT(*), SUM(amount) FROM (
+            SELECT door_id, amount FROM sales WHERE status = 'completed'
+            UNION ALL SELECT door_id, amount FROM march.sales WHERE status = 'completed')
+        GROUP BY door_id'''))
+    conn.close()
+
+    assert len(months) == 4
+    assert by_door == expected
+    assert sum(count for count, _ in by_day.values()) == 90
+    assert min(by_day) == '2024-04-01'
+    assert aggregate(months, by='method', status='failed')['stripe'][0] == 14
+
+
+def test_agregacion_por_bloques_igual_que_de_una_vez(db, tmp_path, monkeypatch):
+    """Partir el mes en bloques pequeños no cambia los totales"""
+    store = _stores(db, tmp_path, ['m1'])[0]
+    store.export_month('2024-04')
+    months = store.load()
+    expected = {by: aggregate(months, by=by) for by in ('door', 'method', 'day')}
+
+    monkeypatch.setattr('utils.columnar_sales.AGGREGATE_ROWS', 7)
+    for by, totals in expected.items():
+        assert aggregate(months, by=by) == totals
+    assert sum(count for count, _ in aggregate(months, by='door', status=None).values()) == 100
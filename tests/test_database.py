@@ -0,0 +1,639 @@
+"""
+Pruebas de la capa de base de datos (DatabaseManager)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import pytest
+from database import DatabaseManager, INDEXES, date_bounds
+from controllers.sales_history_controller import SalesHistoryController
+from config import Config
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base de datos temporal con los productos de ejemplo"""
+    manager = DatabaseManager(db_path=str(tmp_path / 'test.db'))
+    manager.migrations.wait_for_backfills(5)
+    yield manager
+    manager.close()
+
+
+def _query_plan(conn, sql, params=()):
+    """Obtener los pasos de EXPLAIN QUERY PLAN de una consulta"""
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def _assert_index_search(plan, index_name):
+    """La consulta debe buscar por el índice indicado, sin recorrer tablas completas"""
+    assert any(step.startswith('SEARCH') and index_name in step for step in plan), plan
+    assert not any(step.startswith('SCAN') for step in plan), plan
+
+
+def _traced_selects(db, fn, *args):
+    """Ejecutar fn y capturar los SELECT (con parámetros expandidos) que lanza"""
+    statements = []
+    conn = db.get_connection()
+    conn.set_trace_callback(statements.append)
+    conn.close()
+    try:
+        fn(*args)
+    finally:
+        conn = db.get_connection()
+        conn.set_trace_callback(None)
+        conn.close()
+    return [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+
+def test_pool_reutiliza_conexiones(db):
+    """Las conexiones cerradas vuelven al pool y se reutilizan"""
+    conn = db.get_connection()
+    raw = conn._conn
+    conn.close()
+
+    conn = db.get_connection()
+    assert conn._conn is raw
+    conn.close()
+    assert db.pool.get_stats()['reused'] >= 1
+
+
+def test_pool_usa_wal(db):
+    """Las conexiones del pool trabajan en modo WAL"""
+    conn = db.get_connection()
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.close()
+    assert mode.lower() == 'wal'
+
+
+def test_pool_descarta_transacciones_abiertas(db):
+    """Una conexión devuelta con cambios sin confirmar no los persiste"""
+    conn = db.get_connection()
+    conn.execute("UPDATE products SET stock = 99 WHERE door_id = 'A1'")
+    conn.close()
+
+    assert db.get_product_by_door('A1')['stock'] == 1
+
+
+def test_cursor_de_conexion_temporal_no_la_devuelve_al_pool(db):
+    """get_connection().cursor() sin guardar la conexión no la comparte mientras se lee"""
+    cursor = db.get_connection().cursor()
+    cursor.execute("SELECT door_id FROM products ORDER BY door_id")
+    rows = db.get_connection().execute("SELECT door_id FROM products ORDER BY door_id")
+
+    other = db.get_connection()
+    assert other._conn is not cursor.connection
+    assert other._conn is not rows.connection
+    other.close()
+    assert [row[0] for row in cursor] == [row[0] for row in rows.fetchall()]
+
+    raw = cursor.connection
+    del cursor
+    conn = db.get_connection()
+    assert conn._conn is raw
+    conn.close()
+
+
+def test_sin_pool_abre_conexion_por_llamada(tmp_path):
+    """Con pool_size=0 se mantiene el comportamiento de conexión por llamada"""
+    manager = DatabaseManager(db_path=str(tmp_path / 'legacy.db'), pool_size=0)
+    assert manager.get_product_by_door('A1') is not None
+    assert manager.pool.get_stats()['reused'] == 0
+
+
+def test_complete_sale_descuenta_stock_y_registra_venta(db):
+    """complete_sale inserta la venta completada y descuenta el stock a la vez"""
+    sale = db.complete_sale('A1', 'PAY_1', 'TXN_1', 'contactless')
+
+    assert sale is not None
+    assert sale['remaining_stock'] == 0
+    assert db.get_product_by_door('A1')['stock'] == 0
+
+    conn = db.get_connection()
+    row = conn.execute(
+        "SELECT status, dispensed, dispensed_at, payment_id FROM sales WHERE id = ?",
+        (sale['sale_id'],)
+    ).fetchone()
+    conn.close()
+    assert row[0] == 'completed'
+    assert row[1] == 1
+    assert row[2] is not None
+    assert row[3] == 'PAY_1'
+
+
+def test_complete_sale_sin_stock_no_registra_venta(db):
+    """Sin stock no se inserta venta ni se deja el stock en negativo"""
+    assert db.complete_sale('A1', 'PAY_1', 'TXN_1') is not None
+    assert db.complete_sale('A1', 'PAY_2', 'TXN_2') is None
+
+    conn = db.get_connection()
+    count = conn.execute("SELECT COUNT(*) FROM sales WHERE door_id = 'A1'").fetchone()[0]
+    conn.close()
+    assert count == 1
+    assert db.get_product_by_door('A1')['stock'] == 0
+
+
+def test_complete_sale_es_idempotente_por_pago(db):
+    """Confirmar dos veces el mismo pago no vende dos veces"""
+    db.update_product('A1', stock=5)
+    first = db.complete_sale('A1', 'PAY_1', 'TXN_1')
+    second = db.complete_sale('A1', 'PAY_1', 'TXN_1')
+
+    assert second['sale_id'] == first['sale_id']
+    assert second['duplicate'] is True
+    assert db.get_product_by_door('A1')['stock'] == 4
+
+
+def test_date_bounds_rango_semiabierto():
+    """Los días se convierten en límites [inicio, fin) de timestamp"""
+    assert date_bounds('2025-03-01', '2025-03-31') == ('2025-03-01', '2025-04-01')
+    assert date_bounds(None, '2025-12-31') == (None, '2026-01-01')
+    assert date_bounds() == (None, None)
+
+
+def test_migracion_crea_indices(db):
+    """La migración de índices crea todos los índices secundarios"""
+    conn = db.get_connection()
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    assert {name for name, _, _ in INDEXES} <= existing
+
+
+def test_ventas_por_fecha_usa_indice(db):
+    """get_sales_by_date filtra por rango usando idx_sales_created_at"""
+    selects = _traced_selects(db, db.get_sales_by_date, '2025-03-01')
+    assert selects
+
+    conn = db.get_connection()
+    plan = _query_plan(conn, selects[0])
+    conn.close()
+    _assert_index_search(plan, 'idx_sales_created_at')
+
+
+def test_historial_y_resumen_usan_indice(db):
+    """Las consultas del historial y del resumen con fechas no recorren tablas enteras"""
+    controller = SalesHistoryController()
+    conn = db.get_connection()
+
+    sql, params = controller._build_history_query('2025-01-01', '2025-01-31', 100)
+    _assert_index_search(_query_plan(conn, sql, params), 'idx_sales_created_at')
+
+    ranges = [('2025-01-01', '2025-01-31'), ('2025-01-01', None), (None, '2025-01-31'), ('2025-01-10', '2025-01-20')]
+    for start, end in ranges:
+        queries = controller._build_summary_queries(start, end, today='2025-01-15')
+        for name, (sql, params) in queries.items():
+            index = 'PRIMARY KEY' if name == 'rollup' else 'idx_sales_created_at'
+            _assert_index_search(_query_plan(conn, sql, params), index)
+
+    # Mientras el backfill del rollup no termina se agrega desde sales
+    queries = controller._build_summary_queries('2025-01-01', '2025-01-31', use_rollup=False)
+    assert list(queries) == ['raw']
+    _assert_index_search(_query_plan(conn, *queries['raw']), 'idx_sales_created_at')
+
+    conn.close()
+
+
+def test_complete_sale_busca_pago_por_indice(db):
+    """La comprobación de pago duplicado usa idx_sales_payment_id"""
+    selects = _traced_selects(db, db.complete_sale, 'A1', 'PAY_1', 'TXN_1')
+    payment_lookup = [sql for sql in selects if 'payment_id' in sql]
+    assert payment_lookup
+
+    conn = db.get_connection()
+    plan = _query_plan(conn, payment_lookup[0])
+    conn.close()
+    _assert_index_search(plan, 'idx_sales_payment_id')
+
+
+def test_logs_en_segundo_plano_se_escriben_en_lote(db):
+    """Los logs se encolan y el escritor los confirma en un único lote"""
+    for i in range(10):
+        assert db.log_system_event('INFO', f'evento {i}', 'tests')
+    assert db.log_door_maintenance('A1', 'door_opened', 'sensor_update')
+    assert db.flush_logs()
+
+    conn = db.get_connection()
+    logs = conn.execute("SELECT COUNT(*) FROM system_logs WHERE module = 'tests'").fetchone()[0]
+    maintenance = conn.execute("SELECT COUNT(*) FROM door_maintenance WHERE door_id = 'A1'").fetchone()[0]
+    conn.close()
+
+    stats = db.get_stats()['log_writer']
+    assert logs == 10
+    assert maintenance == 1
+    assert stats['written'] == 11
+    assert stats['batches'] < 11
+
+
+def test_cola_de_logs_llena_descarta_y_contabiliza(tmp_path):
+    """Con la cola llena las filas se descartan sin bloquear y se cuentan"""
+    from database import AuditLogWriter
+    import threading
+
+    release = threading.Event()
+
+    def slow_write(rows):
+        release.wait(5)
+        return True
+
+    writer = AuditLogWriter(slow_write, max_queue=2, flush_interval=0.01,
+                            batch_size=1, enqueue_timeout=0.01)
+    results = [writer.submit('system_logs', ('INFO', str(i), None, None, None)) for i in range(6)]
+    release.set()
+    writer.close()
+
+    stats = writer.get_stats()
+    assert False in results
+    assert stats['dropped'] == results.count(False)
+    assert stats['backpressure_waits'] >= stats['dropped']
+
+
+def test_cierre_con_envios_concurrentes_no_pierde_filas(tmp_path):
+    """Las filas que llegan mientras se cierra el escritor se escriben igualmente"""
+    from database import AuditLogWriter
+    import threading
+
+    written = []
+    lock = threading.Lock()
+
+    def write(rows):
+        with lock:
+            written.extend(rows)
+        return True
+
+    writer = AuditLogWriter(write, max_queue=10000, flush_interval=0.001, batch_size=5)
+    start = threading.Barrier(5)
+
+    def producer(n):
+        start.wait()
+        for i in range(200):
+            writer.submit('system_logs', ('INFO', f'{n}-{i}', None, None, None))
+
+    threads = [threading.Thread(target=producer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    writer.close()
+    for thread in threads:
+        thread.join()
+
+    assert len(written) == 800
+    assert writer.flush(timeout=1)
+    assert writer.get_stats()['dropped'] == 0
+
+
+def test_logs_sincronos_sin_escritor(tmp_path):
+    """Con async_logs=False el log se escribe antes de volver"""
+    manager = DatabaseManager(db_path=str(tmp_path / 'sync.db'), async_logs=False)
+    assert manager.log_writer is None
+    assert manager.log_system_event('INFO', 'sincrono')
+
+    conn = manager.get_connection()
+    count = conn.execute("SELECT COUNT(*) FROM system_logs").fetchone()[0]
+    conn.close()
+    manager.close()
+    assert count == 1
+
+
+def test_migraciones_registran_version(db):
+    """Una base de datos nueva queda en la última versión del esquema"""
+    conn = db.get_connection()
+    version, pending = db.migrations.get_state(conn)
+    conn.close()
+    assert version == db.migrations.latest_version
+    assert pending == 0
+
+
+def test_arranque_con_esquema_al_dia_no_ejecuta_ddl(db):
+    """Con el esquema al día init_database solo lee schema_version"""
+    statements = []
+    conn = db.get_connection()
+    conn.set_trace_callback(statements.append)
+    conn.close()
+
+    db.init_database()
+
+    conn = db.get_connection()
+    conn.set_trace_callback(None)
+    conn.close()
+    assert statements
+    assert not any('CREATE' in sql.upper() for sql in statements)
+    assert not any('products' in sql for sql in statements)
+
+
+def test_migracion_de_estructura_antigua(tmp_path):
+    """Las bases de datos con products.slot y transactions se migran a puertas y ventas"""
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, price REAL,
+                    stock INTEGER, slot TEXT, image_url TEXT, description TEXT, active BOOLEAN,
+                    created_at TIMESTAMP, updated_at TIMESTAMP)''')
+    conn.execute('''CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER,
+                    payment_method TEXT, amount REAL, status TEXT, payment_id TEXT, created_at TIMESTAMP)''')
+    conn.execute("INSERT INTO products VALUES (1, 'Agua', 1.0, 3, 'slot_2', NULL, NULL, 1, NULL, NULL)")
+    conn.execute("INSERT INTO transactions VALUES (1, 1, 'cash', 1.0, 'completed', NULL, '2024-01-01 10:00:00')")
+    conn.commit()
+    conn.close()
+
+    manager = DatabaseManager(db_path=path)
+    assert manager.get_product_by_door('A2')['name'] == 'Agua'
+    sales = manager.get_sales_by_date('2024-01-01')
+    manager.close()
+    assert len(sales) == 1
+    assert sales[0]['door_id'] == 'A2'
+
+
+def test_migracion_antigua_conserva_claves_foraneas(tmp_path):
+    """Tras migrar, sales y restocks siguen apuntando a products y se puede vender con FK activas"""
+    path = str(tmp_path / 'legacy_fk.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, price REAL,
+                    stock INTEGER, slot TEXT, image_url TEXT, description TEXT, active BOOLEAN,
+                    created_at TIMESTAMP, updated_at TIMESTAMP)''')
+    conn.execute("INSERT INTO products VALUES (1, 'Agua', 1.0, 3, 'slot_1', NULL, NULL, 1, NULL, NULL)")
+    conn.commit()
+    conn.close()
+
+    DatabaseManager(db_path=path).close()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    for table in ('sales', 'restocks'):
+        targets = {row[2] for row in conn.execute(f"PRAGMA foreign_key_list({table})")}
+        assert targets == {'products'}
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    conn.execute('''INSERT INTO sales (product_id, door_id, payment_method, amount, status)
+                    VALUES (1, 'A1', 'cash', 1.0, 'completed')''')
+    conn.commit()
+    conn.close()
+
+
+def test_backfill_online_por_bloques_y_reanudable(tmp_path):
+    """Los backfills se procesan por bloques y guardan el progreso"""
+    from utils.migrate_database import MigrationEngine, Migration
+
+    path = str(tmp_path / 'backfill.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value INTEGER, doubled INTEGER)")
+    conn.executemany("INSERT INTO items (id, value) VALUES (?, ?)", [(i, i) for i in range(1, 26)])
+    conn.commit()
+
+    def add_column(cursor):
+        pass
+
+    calls = []
+
+    def double_values(cursor, last_key, chunk_size):
+        calls.append(last_key)
+        if len(calls) == 2:
+            raise RuntimeError('corte de luz simulado')
+        last_id = int(last_key or 0)
+        cursor.execute("SELECT id FROM items WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return None
+        cursor.execute("UPDATE items SET doubled = value * 2 WHERE id BETWEEN ? AND ?", (ids[0], ids[-1]))
+        return str(ids[-1])
+
+    engine = MigrationEngine([Migration(1, 'Duplicar valores', add_column, double_values, chunk_size=10)])
+    engine.migrate(conn)
+    assert engine.get_state(conn) == (1, 1)
+
+    with pytest.raises(RuntimeError):
+        engine.run_backfills(lambda: sqlite3.connect(path))
+    assert conn.execute("SELECT backfill_cursor FROM schema_version").fetchone()[0] == '10'
+
+    # Se reanuda desde el último bloque confirmado
+    chunks = engine.run_backfills(lambda: sqlite3.connect(path))
+    assert calls[2] == '10'
+    assert chunks == 3  # 10 + 5 + bloque final vacío
+    assert engine.get_state(conn) == (1, 0)
+    assert conn.execute("SELECT COUNT(*) FROM items WHERE doubled = value * 2").fetchone()[0] == 25
+    conn.close()
+
+
+def _rollup_rows(db):
+    conn = db.get_connection()
+    rows = conn.execute('''
+        SELECT door_id, payment_method, sales_count, revenue FROM sales_daily_rollup
+        ORDER BY door_id, payment_method
+    ''').fetchall()
+    conn.close()
+    return rows
+
+
+def test_rollup_se_actualiza_con_cada_venta_completada(db):
+    """complete_sale y update_sale_status suman la venta al rollup una sola vez"""
+    db.update_product('A1', stock=5)
+    db.complete_sale('A1', 'PAY_1', 'TXN_1')
+    db.complete_sale('A1', 'PAY_1', 'TXN_1')  # duplicado: no suma
+    db.complete_sale('A1', 'PAY_2', 'TXN_2')
+
+    sale_id = db.create_sale('B1', 'cash', 32.0)
+    assert db.update_sale_status(sale_id, 'completed', dispensed=True)
+    assert db.update_sale_status(sale_id, 'completed')  # ya completada: no suma
+    pending_id = db.create_sale('B1', 'cash', 32.0)
+    db.update_sale_status(pending_id, 'failed')
+
+    assert _rollup_rows(db) == [('A1', 'contactless', 2, 70.0), ('B1', 'cash', 1, 32.0)]
+
+
+def test_rollup_cuenta_ventas_pendientes_que_se_completan_durante_el_backfill(db):
+    """Una venta pendiente al migrar se suma una vez, se complete antes o después de su bloque"""
+    from utils.migrate_database import _backfill_sales_rollup
+
+    conn = db.get_connection()
+    conn.execute("DELETE FROM sales_daily_rollup")
+    conn.executemany('''
+        INSERT INTO sales (id, door_id, payment_method, amount, status, created_at)
+        VALUES (?, 'A1', 'cash', 10.0, ?, '2024-05-01 10:00:00')
+    ''', [(1, 'completed'), (2, 'pending'), (3, 'pending'), (4, 'pending')])
+    conn.execute("UPDATE settings SET value = '4' WHERE key = 'rollup_backfill_max_id'")
+    conn.execute("UPDATE schema_version SET completed = 0, backfill_cursor = NULL WHERE version = 4")
+    conn.commit()
+
+    # Primer bloque del backfill: ventas 1 y 2
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    last_key = _backfill_sales_rollup(cursor, None, 2)
+    cursor.execute("UPDATE schema_version SET backfill_cursor = ? WHERE version = 4", (last_key,))
+    conn.commit()
+    conn.close()
+
+    db.update_sale_status(2, 'completed')  # bloque ya procesado: la suma el camino en vivo
+    db.update_sale_status(3, 'completed')  # bloque pendiente: la sumará el backfill
+    db.migrations.run_backfills(db.get_connection)
+    db.update_sale_status(4, 'completed')  # backfill terminado
+
+    assert _rollup_rows(db) == [('A1', 'cash', 4, 40.0)]
+
+
+def test_resumen_combina_rollup_historico_y_ventas_de_hoy(db, monkeypatch):
+    """El resumen suma los días cerrados del rollup (incluido el backfill) y las ventas de hoy"""
+    monkeypatch.setattr('controllers.sales_history_controller.db_manager', db)
+
+    # Ventas anteriores a la migración del rollup
+    conn = db.get_connection()
+    conn.executemany('''
+        INSERT INTO sales (door_id, payment_method, amount, status, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [
+        ('A1', 'cash', 35.0, 'completed', '2024-05-01 10:00:00'),
+        ('A1', 'cash', 35.0, 'completed', '2024-05-01 18:00:00'),
+        ('A2', 'contactless', 45.0, 'completed', '2024-05-02 09:00:00'),
+        ('A2', 'contactless', 45.0, 'failed', '2024-05-02 09:05:00'),
+    ])
+    conn.execute("UPDATE settings SET value = (SELECT MAX(id) FROM sales) WHERE key = 'rollup_backfill_max_id'")
+    conn.execute("UPDATE schema_version SET completed = 0, backfill_cursor = NULL WHERE version = 4")
+    conn.commit()
+    conn.close()
+    db._rollup_ready = False
+
+    assert not db.is_rollup_ready()
+    db.migrations.run_backfills(db.get_connection)
+    assert db.is_rollup_ready()
+
+    db.complete_sale('A1', 'PAY_HOY', 'TXN_HOY')
+
+    summary = SalesHistoryController().get_sales_summary('2024-01-01', '2099-12-31')
+    assert summary['total_sales'] == 4
+    assert summary['total_revenue'] == 150.0
+    assert {m['method']: m['count'] for m in summary['payment_methods']} == {'cash': 2, 'contactless': 2}
+    assert summary['top_products'][0] == {
+        'door_id': 'A1', 'product_name': 'Ramo Primavera', 'sales_count': 3, 'total_revenue': 105.0
+    }
+
+    # Solo los días cerrados
+    summary = SalesHistoryController().get_sales_summary('2024-05-02', '2024-05-02')
+    assert summary['total_sales'] == 1
+    assert summary['average_sale'] == 45.0
+
+
+def test_conexion_de_lectura_no_permite_escribir(db):
+    """Las conexiones de informes son de solo lectura"""
+    conn = db.get_read_connection()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("UPDATE products SET stock = 5")
+    finally:
+        conn.close()
+    assert db.get_stats()['read_pool']['read_only'] is True
+
+
+def test_instantanea_de_lectura_estable_y_sin_bloquear_ventas(db):
+    """Una venta se confirma durante un informe y el informe no la ve"""
+    db.update_product('A1', stock=5)
+    with db.read_snapshot() as conn:
+        before = conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+        assert db.complete_sale('A1', 'PAY_1', 'TXN_1') is not None
+        assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == before
+
+    conn = db.get_read_connection()
+    assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == before + 1
+    conn.close()
+
+
+def test_historial_paginado_por_cursor(db, monkeypatch):
+    """Las páginas se recorren con next_cursor sin repetir ni saltar ventas (también con empates)"""
+    monkeypatch.setattr('controllers.sales_history_controller.db_manager', db)
+    conn = db.get_connection()
+    conn.executemany('''
+        INSERT INTO sales (door_id, payment_method, amount, status, created_at)
+        VALUES ('A1', 'cash', 35.0, 'completed', ?)
+    ''', [(f'2025-02-{day:02d} 10:00:00',) for day in range(1, 11) for _ in range(3)])
+    conn.commit()
+    conn.close()
+
+    controller = SalesHistoryController()
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        page = controller.get_sales_history_page('2025-02-01', '2025-02-28', 7, cursor)
+        seen.extend(sale['id'] for sale in page['sales'])
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert pages == 5
+    assert len(seen) == 30 and len(set(seen)) == 30
+    assert controller.get_sales_history_page(limit=100000)['limit'] == Config.SALES_HISTORY_MAX_PAGE
+    with pytest.raises(ValueError):
+        controller.get_sales_history_page(cursor='no-es-un-cursor')
+
+
+def test_pagina_profunda_usa_indice_sin_ordenar(db):
+    """Cada página busca por idx_sales_created_at y no ordena en un B-tree temporal"""
+    controller = SalesHistoryController()
+    sql, params = controller._build_history_query(
+        '2025-01-01', '2025-12-31', 100, after=('2025-06-01 10:00:00', 1234))
+
+    conn = db.get_connection()
+    plan = _query_plan(conn, sql, params)
+    conn.close()
+    _assert_index_search(plan, 'idx_sales_created_at')
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+def test_catalogo_en_memoria_sin_consultas(db):
+    """Las lecturas repetidas de productos no lanzan SELECT a la base de datos"""
+    db.get_product_by_door('A1')
+    selects = _traced_selects(db, lambda: [db.get_product_by_door('A1') for _ in range(20)] + [db.get_all_products()])
+
+    assert selects == []
+    assert db.get_all_products()[0]['door_id'] == 'A1'
+    assert db.get_stats()['catalog']['reloads'] == 1
+
+
+def test_catalogo_write_through(db):
+    """update_product, decrease_stock, create_restock y complete_sale actualizan el catálogo"""
+    version = db.get_catalog_version()
+    db.update_product('A1', stock=5, name='Ramo Nuevo')
+    assert db.get_product_by_door('A1')['name'] == 'Ramo Nuevo'
+
+    db.decrease_stock('A1', 2)
+    assert db.get_product_by_door('A1')['stock'] == 3
+    db.complete_sale('A1', 'PAY_1')
+    assert db.get_product_by_door('A1')['stock'] == 2
+    db.create_restock('A1', 4)
+    assert db.get_product_by_door('A1')['stock'] == 6
+
+    db.update_product('A1', active=0)
+    assert db.get_product_by_door('A1') is None
+    assert db.get_catalog_version() > version
+
+
+def test_catalogo_lectura_concurrente_no_descuenta_dos_veces(db, monkeypatch):
+    """Una recarga del catálogo justo antes del write-through no duplica el descuento"""
+    db.update_product('A1', stock=5)
+    set_stock = db.catalog.set_stock
+
+    def reader_first(*args, **kwargs):
+        db.catalog.get_all()  # Otro hilo lee (y recarga si ve el commit) en ese momento
+        set_stock(*args, **kwargs)
+
+    monkeypatch.setattr(db.catalog, 'set_stock', reader_first)
+    assert db.decrease_stock('A1', 2)
+    assert db.get_product_by_door('A1')['stock'] == 3
+    assert db.get_product_by_door('A1')['stock'] == 3
+
+
+def test_catalogo_detecta_cambios_externos(db):
+    """Los cambios de otra conexión se detectan con PRAGMA data_version"""
+    assert db.get_product_by_door('B1')['price'] == 32.0
+    version = db.get_catalog_version()
+
+    conn = sqlite3.connect(db.db_path)
+    conn.execute("UPDATE products SET price = 10.0 WHERE door_id = 'B1'")
+    conn.commit()
+    conn.close()
+
+    assert db.get_product_by_door('B1')['price'] == 10.0
+    assert db.get_catalog_version() > version
+
+
+def test_catalogo_devuelve_copias(db):
+    """Modificar el dict devuelto no altera el catálogo"""
+    db.get_product_by_door('A1')['stock'] = 50
+    assert db.get_product_by_door('A1')['stock'] == 1
@@ -0,0 +1,99 @@
+"""
+Pruebas del archivo mensual de datos antiguos
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from datetime import datetime, timezone
+from database import DatabaseManager
+from utils.db_archive import MonthlyArchiver
+from controllers.sales_history_controller import SalesHistoryController
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base de datos temporal con los productos de ejemplo"""
+    manager = DatabaseManager(db_path=str(tmp_path / 'test.db'))
+    manager.migrations.wait_for_backfills(5)
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def archiver(db, tmp_path, monkeypatch):
+    """Archivador sobre la base temporal, usado también por el historial"""
+    archiver = MonthlyArchiver(db, archive_dir=str(tmp_path / 'archive'), keep_months=0, chunk_size=3)
+    monkeypatch.setattr('controllers.sales_history_controller.db_manager', db)
+    monkeypatch.setattr('controllers.sales_history_controller.monthly_archiver', archiver)
+    return archiver
+
+
+def _insert_sales(db, timestamps):
+    conn = db.get_connection()
+    conn.executemany('''
+        INSERT INTO sales (door_id, payment_method, amount, status, created_at)
+        VALUES ('A1', 'cash', 35.0, 'completed', ?)
+    ''', [(ts,) for ts in timestamps])
+    conn.execute("INSERT INTO restocks (door_id, quantity_added, created_at) VALUES ('A1', 2, ?)", (timestamps[0],))
+    conn.execute("INSERT INTO system_logs (level, message, created_at) VALUES ('INFO', 'x', ?)", (timestamps[0],))
+    conn.commit()
+    conn.close()
+
+
+def _count(db, table):
+    conn = db.get_connection()
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_archivar_mes_mueve_filas_y_el_historial_las_sigue_viendo(db, archiver):
+    """Las filas del mes salen de la base principal pero el historial las une"""
+    _insert_sales(db, [f'2024-05-{day:02d} 10:00:00' for day in range(1, 8)])
+    _insert_sales(db, ['2024-06-01 09:00:00'])
+
+    assert archiver.months_to_archive()[:2] == ['2024-05', '2024-06']
+    moved = archiver.archive_month('2024-05')
+
+    assert moved == {'sales': 7, 'restocks': 1, 'system_logs': 1}
+    assert os.path.exists(archiver.archive_path('2024-05'))
+    assert _count(db, 'sales') == 1
+    assert _count(db, 'restocks') == 1
+
+    # Archivar de nuevo no duplica nada
+    assert archiver.archive_month('2024-05') == {'sales': 0, 'restocks': 0, 'system_logs': 0}
+
+    controller = SalesHistoryController()
+    history = controller.get_sales_history('2024-05-01', '2024-06-30', limit=100)
+    assert len(history) == 8
+    assert history[0]['timestamp'] == '2024-06-01 09:00:00'
+    assert history[-1]['timestamp'] == '2024-05-01 10:00:00'
+    assert history[-1]['product_name'] == 'Ramo Primavera'
+
+    # Un rango que solo toca la base principal no adjunta archivos
+    assert archiver.archives_for_range('2024-06-01', '2024-06-30') == []
+    assert len(controller.get_sales_history('2024-06-01', '2024-06-30')) == 1
+
+
+def test_historial_con_mas_archivos_que_el_limite_de_attach(db, archiver):
+    """Con más meses archivados que bases adjuntables se consultan por lotes"""
+    months = [f'2023-{m:02d}' for m in range(1, 13)] + ['2024-01', '2024-02']
+    _insert_sales(db, [f'{month}-15 12:00:00' for month in months])
+    for month in months:
+        archiver.archive_month(month)
+
+    assert len(archiver.batches_for_range()) == 2
+    history = SalesHistoryController().get_sales_history(limit=100)
+    assert [sale['timestamp'][:7] for sale in history] == list(reversed(months))
+
+    # El límite se respeta sin recorrer los lotes más antiguos
+    assert len(SalesHistoryController().get_sales_history(limit=3)) == 3
+
+
+def test_no_se_archiva_el_mes_en_curso(db, archiver):
+    """El mes actual no está cerrado y no se archiva"""
+    month = datetime.now(timezone.utc).strftime('%Y-%m')
+    assert archiver.archive_month(month) is None
+    assert month not in archiver.months_to_archive()
@@ -0,0 +1,126 @@
+"""
+Pruebas de los backups en caliente con la API de backup de SQLite
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import pytest
+from database import DatabaseManager
+from utils.db_backup import BackupManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Base de datos temporal con los productos de ejemplo"""
+    manager = DatabaseManager(db_path=str(tmp_path / 'test.db'))
+    manager.migrations.wait_for_backfills(5)
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def backups(db, tmp_path):
+    return BackupManager(db.db_path, backup_dir=str(tmp_path / 'backups'),
+                         pages_per_step=2, step_pause=0, keep_full=2, full_every=3)
+
+
+def _add_sales(db, count):
+    db.update_product('A1', stock=count)
+    for i in range(count):
+        db.complete_sale('A1', f'PAY_{i}_{os.urandom(4).hex()}', None)
+
+
+def _restored_sales(backups, snapshot, tmp_path):
+    path = str(tmp_path / 'restored.db')
+    backups.restore_snapshot(snapshot, path)
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+    conn.close()
+    os.remove(path)
+    return count
+
+
+def test_backup_completo_por_pasos_y_verificado(db, backups):
+    """La copia se hace en varios pasos y la verificación en segundo plano la da por buena"""
+    _add_sales(db, 5)
+    result = backups.create_snapshot()
+
+    assert result['type'] == 'full'
+    assert result['steps'] > 1
+    verification = backups.wait_for_verification(5)
+    assert verification['path'] == result['path']
+    assert verification['ok'] is True
+
+
+def test_backup_termina_con_escrituras_concurrentes(db, backups, tmp_path):
+    """Si otra conexión no deja de escribir, la copia deja de reiniciarse y se hace en un paso"""
+    import threading
+    _add_sales(db, 50)
+    stop = threading.Event()
+    writes = []
+
+    def writer():
+        while not stop.is_set():
+            db.log_system_event('INFO', 'escritura concurrente')
+            conn = db.get_connection()
+            conn.execute("UPDATE products SET stock = stock + 1 WHERE door_id = 'A1'")
+            conn.commit()
+            conn.close()
+            writes.append(1)
+
+    backups.step_pause = 0.005
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        result = backups.backup(str(tmp_path / 'concurrente.db'))
+    finally:
+        stop.set()
+        thread.join()
+
+    assert writes
+    assert result['restarts'] > backups.max_restarts
+    assert result['single_step'] is True
+    conn = sqlite3.connect(result['path'])
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+    assert conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0] == 50
+    conn.close()
+
+
+def test_instantanea_diferencial_guarda_solo_paginas_cambiadas(db, backups, tmp_path):
+    """La diferencial ocupa menos que una completa y restaura el estado exacto"""
+    _add_sales(db, 5)
+    full = backups.create_snapshot(verify=False)
+    _add_sales(db, 3)
+    diff = backups.create_snapshot(differential=True)
+
+    assert diff['type'] == 'differential'
+    assert diff['base'] == full['path']
+    assert diff['changed_pages'] < diff['pages']
+    assert diff['size'] < os.path.getsize(full['path'])
+    assert backups.wait_for_verification(5)['ok'] is True
+    assert _restored_sales(backups, full['path'], tmp_path) == 5
+    assert _restored_sales(backups, diff['path'], tmp_path) == 8
+
+
+def test_retencion_elimina_completas_antiguas_y_sus_diferenciales(db, backups):
+    """Tras full_every diferenciales se hace otra completa y solo se conservan keep_full"""
+    types = [backups.create_snapshot(differential=True, verify=False)['type'] for _ in range(9)]
+
+    assert types == ['full', 'differential', 'differential', 'differential'] * 2 + ['full']
+    snapshots = backups.list_snapshots()
+    assert sum(path.endswith('.full.db') for path in snapshots) == 2
+    assert len(snapshots) == 5
+
+
+def test_verificacion_detecta_backup_corrupto(db, backups):
+    """Un fichero dañado no pasa la verificación"""
+    result = backups.create_snapshot(verify=False)
+    with open(result['path'], 'r+b') as f:
+        f.seek(0)
+        f.write(b'\x00' * 100)
+
+    verification = backups.verify(result['path'])
+    assert verification['ok'] is False
+    assert verification['errors']
@@ -0,0 +1,66 @@
+"""
+Pruebas de los actores por puerta (DoorActorPool)
+"""
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.door_actors import DoorActorPool
+
+
+def test_comandos_de_una_puerta_en_orden_y_sin_solaparse():
+    pool = DoorActorPool(max_workers=4)
+    order = []
+    inside = {'A1': 0}
+    overlaps = []
+
+    def command(i):
+        inside['A1'] += 1
+        if inside['A1'] > 1:
+            overlaps.append(i)
+        time.sleep(0.001)
+        order.append(i)
+        inside['A1'] -= 1
+        return i
+
+    futures = [pool.submit('A1', command, i) for i in range(50)]
+    assert [future.result(5) for future in futures] == list(range(50))
+    assert order == list(range(50))
+    assert overlaps == []
+    pool.shutdown(wait=True)
+
+
+def test_puertas_distintas_en_paralelo():
+    pool = DoorActorPool(max_workers=4)
+    barrier = threading.Barrier(3, timeout=2)
+    futures = [pool.submit(door_id, barrier.wait) for door_id in ('A1', 'A2', 'A3')]
+    # Si las puertas se ejecutaran en serie la barrera expiraría
+    assert sorted(future.result(5) for future in futures) == [0, 1, 2]
+    pool.shutdown(wait=True)
+
+
+def test_comando_anidado_de_la_misma_puerta_y_errores():
+    pool = DoorActorPool(max_workers=2)
+
+    def outer():
+        # Esperar a otro comando de la propia puerta no se bloquea
+        return pool.call('A1', lambda: 'inner') + '+outer'
+
+    assert pool.call('A1', outer, timeout=2) == 'inner+outer'
+
+    failing = pool.submit('A1', lambda: 1 / 0)
+    assert isinstance(failing.exception(2), ZeroDivisionError)
+    assert pool.call('A1', lambda: 'sigue', timeout=2) == 'sigue'
+    stats = pool.get_stats()
+    assert stats['failed'] == 1
+    assert stats['inline'] == 1
+    pool.shutdown(wait=True)
+
+
+def test_sin_hilos_se_ejecuta_en_el_acto():
+    pool = DoorActorPool(threaded=False)
+    future = pool.submit('A1', lambda: threading.current_thread())
+    assert future.done()
+    assert future.result() is threading.current_thread()
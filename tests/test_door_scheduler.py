@@ -0,0 +1,67 @@
+"""
+Pruebas del planificador de cierres automáticos (DoorScheduler)
+"""
+import sys
+import os
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.door_scheduler import DoorScheduler
+
+
+def _recorder():
+    fired = []
+    done = threading.Event()
+
+    def callback(entry):
+        fired.append((entry.key, time.monotonic() - entry.deadline))
+        done.set()
+
+    return fired, done, callback
+
+
+def test_plazos_se_ejecutan_en_orden_con_un_solo_hilo():
+    scheduler = DoorScheduler()
+    fired, _, callback = _recorder()
+    threads_before = threading.active_count()
+    for door_id in ['A3', 'A1', 'A2']:
+        scheduler.schedule(door_id, 0.05 + 0.02 * ('A1', 'A2', 'A3').index(door_id), callback)
+    assert threading.active_count() <= threads_before + 1
+    time.sleep(0.3)
+    assert [key for key, _ in fired] == ['A1', 'A2', 'A3']
+    assert all(lateness < 0.05 for _, lateness in fired)
+    assert scheduler.get_stats()['fired'] == 3
+    scheduler.stop()
+
+
+def test_cancelar_y_ampliar():
+    scheduler = DoorScheduler()
+    fired, done, callback = _recorder()
+    scheduler.schedule('A1', 0.05, callback)
+    scheduler.schedule('A2', 0.05, callback)
+    assert scheduler.cancel('A1')
+    assert not scheduler.cancel('A1')
+    assert scheduler.extend('A2', 0.1) is not None
+    assert scheduler.extend('A1', 0.1) is None
+
+    time.sleep(0.1)
+    assert fired == []
+    assert 0 < scheduler.remaining('A2') <= 0.1
+    assert done.wait(1)
+    assert [key for key, _ in fired] == ['A2']
+    assert scheduler.remaining('A2') is None
+    scheduler.stop()
+
+
+def test_reprogramar_sustituye_la_entrada_anterior():
+    scheduler = DoorScheduler()
+    fired, done, callback = _recorder()
+    first = scheduler.schedule('A1', 0.02, callback)
+    second = scheduler.schedule('A1', 0.08, callback)
+    assert first.cancelled and not second.cancelled
+    assert not first.cancel()
+    assert done.wait(1)
+    time.sleep(0.05)
+    assert len(fired) == 1
+    scheduler.stop()
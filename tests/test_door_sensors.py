@@ -0,0 +1,69 @@
+"""
+Pruebas de los sensores de puerta por flancos (DoorSensorMonitor)
+"""
+import sys
+import os
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.door_sensors import DoorSensorMonitor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _monitor(clock, **kwargs):
+    monitor = DoorSensorMonitor(debounce_ms=50, use_gpio=False, clock=clock, **kwargs)
+    monitor.attach('A1', 27)
+    events = []
+    monitor.subscribe(lambda door_id, is_open, ts: events.append((door_id, is_open)))
+    return monitor, events
+
+
+def test_rebotes_se_ignoran_y_se_corrige_el_nivel_final():
+    clock = FakeClock()
+    monitor, events = _monitor(clock)
+
+    for is_open in (True, False, True, False):  # Rebote que acaba en cerrado
+        monitor.simulate_edge('A1', is_open)
+        clock.now += 0.002
+    monitor.process_pending()
+    assert events == [('A1', True)]
+    assert monitor.get_stats()['bounces'] == 3
+
+    clock.now += 0.05
+    monitor.process_pending()
+    assert events == [('A1', True), ('A1', False)]
+    assert monitor.is_open('A1') is False
+
+
+def test_buffer_lleno_cuenta_flancos_perdidos():
+    clock = FakeClock()
+    monitor, events = _monitor(clock, capacity=4)
+    for i in range(10):
+        monitor.simulate_edge('A1', i % 2 == 0)
+        clock.now += 1
+    monitor.process_pending()
+    stats = monitor.get_stats()
+    assert stats['edges'] == 4
+    assert stats['dropped'] == 6
+    assert events[-1] == ('A1', False)
+
+
+def test_despachador_entrega_en_milisegundos():
+    monitor = DoorSensorMonitor(debounce_ms=20, use_gpio=False)
+    monitor.attach('A1', 27)
+    received = threading.Event()
+    monitor.subscribe(lambda door_id, is_open, ts: received.set())
+    monitor.start()
+    try:
+        monitor.simulate_edge('A1', True)
+        assert received.wait(1)
+        assert monitor.get_stats()['max_latency_ms'] < 50
+    finally:
+        monitor.stop()
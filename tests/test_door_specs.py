@@ -0,0 +1,43 @@
+"""
+Pruebas de la compilación de puertas en DoorSpec
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.door_specs import compile_door_specs
+
+
+CONFIG = {
+    'machine': {'door_settings': {'default_open_time': 30.0, 'min_open_time': 1.0, 'max_open_time': 30.0}},
+    'doors': {
+        'A1': {'gpio_pin': 17, 'sensor_pin': 27, 'open_time': 5, 'active_high': True},
+        'A2': {'gpio_pin': '18', 'relay_matrix': True, 'relay_index': 3},
+        'B1': {'gpio_pin': 'x', 'relay_index': 300, 'open_time': -1},
+    }
+}
+
+
+def test_compila_puertas_con_indice_denso():
+    """Cada puerta tiene un índice denso y los datos ya resueltos"""
+    table = compile_door_specs(CONFIG)
+
+    assert len(table) == 3
+    assert [spec.index for spec in table] == [0, 1, 2]
+    a1 = table.get('A1')
+    assert table[table.index['A1']] is a1
+    assert (a1.gpio_pin, a1.sensor_pin, a1.open_time, a1.active_high) == (17, 27, 5.0, True)
+    assert table.get('A2').gpio_pin == 18
+    assert table.get('A2').relay_matrix and table.get('A2').relay_index == 3
+    assert table.get('Z9') is None and 'Z9' not in table
+
+
+def test_tiempo_global_y_valores_invalidos():
+    """Sin tiempo propio se usa el global; los campos inválidos se anulan y se informan"""
+    table = compile_door_specs(CONFIG)
+
+    assert table.get('A2').open_time == 30.0
+    b1 = table.get('B1')
+    assert (b1.gpio_pin, b1.relay_index, b1.open_time) == (None, 0, 30.0)
+    assert len(table.errors) == 3
+    assert compile_door_specs({'doors': {'A1': {}}}, 3.0).get('A1').open_time == 3.0
@@ -0,0 +1,81 @@
+"""
+Pruebas de las respuestas con ETag por versión (VersionedResponseCache)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from utils.http_cache import VersionedResponseCache
+
+
+def _app(cache, state):
+    app = Flask(__name__)
+
+    def build():
+        state['builds'] += 1
+        return {'success': True, 'items': state['items']}
+
+    @app.route('/items')
+    def items():
+        versions = None if state['version'] is None else (state['version'],)
+        return cache.respond('items', lambda: versions, build)
+
+    return app
+
+
+def test_304_sin_reconstruir_y_cuerpo_reutilizado():
+    cache = VersionedResponseCache(epoch='e1')
+    state = {'version': 1, 'items': [1, 2], 'builds': 0}
+    client = _app(cache, state).test_client()
+
+    first = client.get('/items')
+    assert first.status_code == 200
+    assert first.headers['ETag'] == '"items-e1-1"'
+    assert first.get_json() == {'success': True, 'items': [1, 2]}
+
+    again = client.get('/items', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    # Otro cliente sin ETag recibe los bytes ya serializados
+    assert client.get('/items').data == first.data
+    assert state['builds'] == 1
+    assert cache.get_stats()['not_modified'] == 1
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_nueva_version_cambia_el_etag():
+    cache = VersionedResponseCache(epoch='e1')
+    state = {'version': 1, 'items': [1], 'builds': 0}
+    client = _app(cache, state).test_client()
+    etag = client.get('/items').headers['ETag']
+
+    state['version'], state['items'] = 2, [1, 3]
+    response = client.get('/items', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"items-e1-2"'
+    assert response.get_json()['items'] == [1, 3]
+
+
+def test_reinicio_invalida_los_etag_anteriores():
+    """Tras un reinicio los contadores vuelven a empezar pero el ETag antiguo ya no vale"""
+    state = {'version': 1, 'items': [1], 'builds': 0}
+    etag = _app(VersionedResponseCache(epoch='arranque1'), state).test_client().get('/items').headers['ETag']
+
+    state['items'] = [1, 2]  # Cambió antes del reinicio; la versión vuelve a ser 1
+    client = _app(VersionedResponseCache(epoch='arranque2'), state).test_client()
+    response = client.get('/items', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['items'] == [1, 2]
+
+
+def test_sin_version_no_hay_etag():
+    cache = VersionedResponseCache()
+    state = {'version': None, 'items': [], 'builds': 0}
+    client = _app(cache, state).test_client()
+    response = client.get('/items', headers={'If-None-Match': '"items-None"'})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    client.get('/items')
+    assert state['builds'] == 2
@@ -0,0 +1,259 @@
+"""
+Pruebas del gestor de configuración de la máquina (MachineConfigManager)
+"""
+import sys
+import os
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import database
+from database import DatabaseManager
+from machine_config import MachineConfigManager
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Base de datos temporal usada como db_manager global"""
+    manager = DatabaseManager(db_path=str(tmp_path / 'test.db'))
+    manager.migrations.wait_for_backfills(5)
+    monkeypatch.setattr(database, 'db_manager', manager)
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """Configuración temporal con 50 puertas (A1 y B1 con producto de ejemplo)"""
+    doors = {f'{letter}{n}': {'name': f'Puerta {letter}{n}', 'gpio_pin': 2, 'door_open': False}
+             for letter in 'ABCDEFGHIJ' for n in range(1, 6)}
+    path = tmp_path / 'machine_config.json'
+    path.write_text(json.dumps({'doors': doors}), encoding='utf-8')
+    return MachineConfigManager(str(path))
+
+
+def _count_selects(db, fn):
+    """Ejecutar fn contando los SELECT lanzados por las conexiones del pool"""
+    statements = []
+    conn = db.get_connection()
+    conn.set_trace_callback(statements.append)
+    conn.close()
+    try:
+        fn()
+    finally:
+        conn = db.get_connection()
+        conn.set_trace_callback(None)
+        conn.close()
+    return len([sql for sql in statements if sql.lstrip().upper().startswith('SELECT')])
+
+
+def test_vista_de_puertas_con_una_sola_consulta(tmp_path, manager, monkeypatch):
+    """Sin catálogo en memoria, todas las puertas se combinan con un único SELECT"""
+    db = DatabaseManager(db_path=str(tmp_path / 'sin_cache.db'), catalog_cache=False)
+    db.migrations.wait_for_backfills(5)
+    monkeypatch.setattr(database, 'db_manager', db)
+
+    doors = {}
+    assert _count_selects(db, lambda: doors.update(manager.get_all_doors_with_products())) == 1
+    db.close()
+
+    assert len(doors) == 50
+    assert doors['A1']['product']['name'] == 'Ramo Primavera'
+    assert doors['A1']['status'] == 'available'
+    assert doors['J5']['product'] is None
+    assert doors['J5']['status'] == 'no_product'
+
+
+def test_vista_de_puertas_se_reutiliza_hasta_que_cambia(db, manager):
+    """La vista se reutiliza mientras no cambien la configuración ni el catálogo"""
+    first = manager.get_all_doors_with_products()
+    assert manager.get_all_doors_with_products() is first
+
+    db.decrease_stock('A1')
+    after_sale = manager.get_all_doors_with_products()
+    assert after_sale is not first
+    assert after_sale['A1']['status'] == 'out_of_stock'
+
+    manager.update_door_sensor('B1', True)
+    db.flush_logs()
+    after_sensor = manager.get_all_doors_with_products()
+    assert after_sensor is not after_sale
+    assert after_sensor['B1']['status'] == 'door_open'
+
+
+def test_cambios_se_agrupan_en_una_escritura(tmp_path):
+    """Varios cambios seguidos producen una sola escritura atómica del JSON"""
+    path = tmp_path / 'machine_config.json'
+    path.write_text(json.dumps({'doors': {'A1': {'status': 'available'}}}), encoding='utf-8')
+    manager = MachineConfigManager(str(path), flush_ms=60000)
+
+    for status in ('dispensing', 'available', 'blocked'):
+        assert manager.update_door_status('A1', status)
+    assert json.loads(path.read_text(encoding='utf-8'))['doors']['A1']['status'] == 'available'
+
+    assert manager.flush_config()
+    stats = manager.writer.get_stats()
+    assert json.loads(path.read_text(encoding='utf-8'))['doors']['A1']['status'] == 'blocked'
+    assert stats['writes'] == 1
+    assert stats['flushed_generation'] == stats['generation'] == 3
+    assert [p.name for p in tmp_path.iterdir()] == ['machine_config.json']
+
+
+def test_escritura_programada_tras_el_retardo(tmp_path):
+    """Sin flush explícito, los cambios se escriben al vencer el retardo"""
+    path = tmp_path / 'machine_config.json'
+    path.write_text(json.dumps({'doors': {'A1': {'door_open': False}}}), encoding='utf-8')
+    manager = MachineConfigManager(str(path), flush_ms=20)
+
+    manager.config['doors']['A1']['door_open'] = True
+    manager.save_config()
+
+    deadline = time.monotonic() + 2
+    while manager.writer.get_stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert json.loads(path.read_text(encoding='utf-8'))['doors']['A1']['door_open'] is True
+
+
+def test_escritura_fallida_se_reintenta(tmp_path, monkeypatch):
+    """Una escritura que falla se reintenta con el temporizador sin esperar otro cambio"""
+    from utils import config_writer
+    path = tmp_path / 'machine_config.json'
+    path.write_text(json.dumps({'doors': {'A1': {'status': 'available'}}}), encoding='utf-8')
+    manager = MachineConfigManager(str(path), flush_ms=20)
+    monkeypatch.setattr(config_writer, 'RETRY_DELAY', 0.02)
+
+    calls = []
+    original = config_writer.write_text_atomic
+
+    def flaky_write(target, text):
+        calls.append(target)
+        if len(calls) == 1:
+            raise OSError('disco lleno')
+        original(target, text)
+
+    monkeypatch.setattr(config_writer, 'write_text_atomic', flaky_write)
+    manager.update_door_status('A1', 'blocked')
+
+    deadline = time.monotonic() + 2
+    while manager.writer.get_stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats = manager.writer.get_stats()
+    assert stats['failed'] == 1
+    assert stats['writes'] == 1
+    assert json.loads(path.read_text(encoding='utf-8'))['doors']['A1']['status'] == 'blocked'
+
+
+def test_configuracion_compartida_sin_perder_cambios(tmp_path):
+    """Dos gestores del mismo fichero comparten el dict y no se pisan al guardar"""
+    path = tmp_path / 'machine_config.json'
+    path.write_text(json.dumps({'doors': {'A1': {'status': 'available'}, 'B1': {'status': 'available'}}}),
+                    encoding='utf-8')
+    first = MachineConfigManager(str(path), flush_ms=0)
+    second = MachineConfigManager(str(path))
+
+    assert first.store is second.store
+    first.update_door_status('A1', 'blocked')
+    second.update_door_status('B1', 'blocked')
+
+    saved = json.loads(path.read_text(encoding='utf-8'))
+    assert saved['doors']['A1']['status'] == 'blocked'
+    assert saved['doors']['B1']['status'] == 'blocked'
+
+
+def test_recarga_en_caliente_y_avisos(tmp_path):
+    """Un cambio externo del fichero se recarga sobre el mismo dict y se notifica"""
+    path = tmp_path / 'machine_config.json'
+    path.write_text(json.dumps({'doors': {'A1': {'open_time': 3.0}}}), encoding='utf-8')
+    manager = MachineConfigManager(str(path), flush_ms=0)
+    config = manager.config
+    events = []
+    manager.store.subscribe(lambda section, version, key: events.append((section, version)))
+
+    manager.update_door_status('A1', 'available')
+    assert not manager.store.check_for_changes()
+
+    edited = json.loads(path.read_text(encoding='utf-8'))
+    edited['doors']['A1']['open_time'] = 5.0
+    path.write_text(json.dumps(edited), encoding='utf-8')
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+
+    assert manager.store.check_for_changes()
+    assert manager.get_door('A1')['open_time'] == 5.0
+    assert [section for section, _ in events] == ['doors', None]
+    assert manager.config_version == events[-1][1]
+    assert config is manager.config
+
+
+def _edit_externally(path, edit):
+    """Editar el fichero como lo haría una persona, forzando un mtime nuevo"""
+    edited = json.loads(path.read_text(encoding='utf-8'))
+    edit(edited)
+    path.write_text(json.dumps(edited), encoding='utf-8')
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+
+
+def test_edicion_externa_con_cambios_pendientes_se_fusiona(tmp_path):
+    """Una edición del fichero con una escritura pendiente no se pierde al guardar"""
+    path = tmp_path / 'machine_config.json'
+    path.write_text(json.dumps({'doors': {'A1': {'status': 'available', 'open_time': 3.0},
+                                          'B1': {'status': 'available'}}}), encoding='utf-8')
+    manager = MachineConfigManager(str(path), flush_ms=60000)
+    events = []
+    manager.store.subscribe(lambda section, version, key: events.append(section))
+
+    manager.update_door_status('A1', 'blocked')
+    _edit_externally(path, lambda config: config['doors']['A1'].update(open_time=5.0))
+
+    assert manager.store.check_for_changes()
+    assert manager.get_door('A1') == {'status': 'blocked', 'open_time': 5.0}
+    assert events == ['doors', None]
+
+    # Sin pasar por el vigilante: la fusión se hace al escribir; en conflicto gana el fichero
+    manager.update_door_status('B1', 'blocked')
+    _edit_externally(path, lambda config: config['doors'].update(B1={'status': 'maintenance'}, C1={}))
+    assert manager.flush_config()
+
+    saved = json.loads(path.read_text(encoding='utf-8'))
+    assert saved['doors']['A1'] == {'status': 'blocked', 'open_time': 5.0}
+    assert saved['doors']['B1'] == {'status': 'maintenance'}
+    assert saved['doors']['C1'] == {}
+    assert manager.get_door('B1')['status'] == 'maintenance'
+    assert not manager.store.check_for_changes()
+
+
+def test_indice_de_estados_incremental(db, manager, monkeypatch):
+    """Ventas y sensores actualizan el índice sin reconstruirlo"""
+    index = manager.get_status_index()
+    assert index.counts()['available'] == 14
+    assert index.count('no_product') == 36
+
+    rebuilds = []
+    monkeypatch.setattr(index, 'rebuild', lambda *args: rebuilds.append(args))
+
+    db.decrease_stock('A1')
+    manager.update_door_sensor('B1', True)
+    db.flush_logs()
+
+    assert manager.get_door_status('A1') == 'out_of_stock'
+    assert manager.get_door_status('B1') == 'door_open'
+    assert manager.get_status_counts()['available'] == 12
+    assert list(manager.get_doors_needing_restock()) == ['A1']
+    assert 'A1' not in manager.get_available_doors()
+    assert len(manager.get_available_doors()) == 12
+    assert rebuilds == []
+
+
+def test_indice_detecta_cambios_externos_de_stock(db, manager):
+    """Un cambio de stock hecho por otra conexión llega al índice"""
+    assert manager.get_door_status('C1') == 'available'
+
+    conn = db.get_connection()
+    conn.execute("UPDATE products SET stock = 0 WHERE door_id = 'C1'")
+    conn.commit()
+    conn.close()
+
+    # Sin leer antes el producto: el índice consulta la versión del catálogo
+    assert manager.get_door_status('C1') == 'out_of_stock'
+    assert 'C1' in manager.get_doors_needing_restock()
+    assert 'C1' not in manager.get_available_doors()
@@ -0,0 +1,54 @@
+"""
+Pruebas del escalonado de activaciones de relés (RelayBudget)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.relay_budget import RelayBudget
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _budget(fake, **kwargs):
+    return RelayBudget(clock=fake.clock, sleep=fake.sleep, **kwargs)
+
+
+def test_separacion_minima_entre_activaciones():
+    fake = FakeTime()
+    budget = _budget(fake, max_concurrent=10, inrush_ms=100, min_spacing_ms=50)
+    starts = []
+    for _ in range(4):
+        budget.acquire()
+        starts.append(round(fake.now, 3))
+    assert starts == [0.0, 0.05, 0.1, 0.15]
+
+
+def test_maximo_por_ventana_de_inrush():
+    fake = FakeTime()
+    budget = _budget(fake, max_concurrent=2, inrush_ms=100, min_spacing_ms=0)
+    starts = []
+    for _ in range(5):
+        budget.acquire()
+        starts.append(round(fake.now, 3))
+    assert starts == [0.0, 0.0, 0.1, 0.1, 0.2]
+    assert budget.get_stats()['activations'] == 5
+
+
+def test_grupo_ocupa_varias_plazas():
+    fake = FakeTime()
+    budget = _budget(fake, max_concurrent=3, inrush_ms=100, min_spacing_ms=0)
+    budget.acquire(3)
+    assert budget.acquire(1) == 0.1
+    # Un grupo mayor que el máximo se limita a max_concurrent
+    budget.acquire(5)
+    assert round(fake.now, 3) == 0.2
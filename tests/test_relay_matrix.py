@@ -0,0 +1,40 @@
+"""
+Pruebas del driver de la matriz de relés (RelayMatrixDriver)
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from controllers.relay_matrix import RelayMatrixDriver, build_pulse_train
+
+
+def test_tren_de_pulsos_del_protocolo():
+    train = build_pulse_train(3, activate=True)
+    assert [level for level, _ in train[:8]] == [0, 0, 0, 0, 0, 0, 1, 1]
+    assert train[8:] == ((1, 5000), (0, 1000), (1, 0))
+    assert build_pulse_train(3, activate=False)[8:] == ((0, 5000), (1, 1000), (0, 0))
+    assert RelayMatrixDriver.duration_ms(train) == 14.0
+    with pytest.raises(ValueError):
+        build_pulse_train(256)
+
+
+def test_emision_con_plazos_absolutos_y_jitter_medido():
+    outputs = []
+    driver = RelayMatrixDriver(lambda pin, level: outputs.append((pin, level, time.perf_counter())),
+                               use_pigpio=False)
+    assert driver.pulse_train(5) is driver.pulse_train(5)
+    try:
+        assert driver.send(18, 5, activate=True)
+    finally:
+        driver.close()
+
+    assert [level for _, level, _ in outputs] == [level for level, _ in build_pulse_train(5)]
+    elapsed_ms = (outputs[-1][2] - outputs[0][2]) * 1000
+    assert 13.9 <= elapsed_ms < 30.0
+    stats = driver.get_stats()
+    assert stats['backend'] == 'thread'
+    assert stats['trains'] == 1
+    assert stats['bits'] == 11
+    assert stats['jitter_max_us'] >= stats['jitter_mean_us'] >= 0
@@ -0,0 +1,111 @@
+"""
+Pruebas de la exportación de ventas en streaming
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv
+import gzip
+import io
+import json
+import pytest
+from flask import Flask
+from database import DatabaseManager
+from utils.db_archive import MonthlyArchiver
+from controllers.sales_history_controller import SalesHistoryController
+from routes.sales_routes import sales_bp
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Base de datos temporal con ventas en un mes archivado y en la base principal"""
+    manager = DatabaseManager(db_path=str(tmp_path / 'test.db'))
+    manager.migrations.wait_for_backfills(5)
+    archiver = MonthlyArchiver(manager, archive_dir=str(tmp_path / 'archive'), keep_months=0)
+    monkeypatch.setattr('controllers.sales_history_controller.db_manager', manager)
+    monkeypatch.setattr('controllers.sales_history_controller.monthly_archiver', archiver)
+
+    conn = manager.get_connection()
+    conn.executemany('''
+        INSERT INTO sales (door_id, payment_method, amount, status, payment_id, created_at)
+        VALUES (?, 'cash', 35.0, 'completed', ?, ?)
+    ''', [('A1' if i % 2 else 'ZZ', f'PAY_{i}', f'2024-0{3 + i // 1500}-{1 + i % 28:02d} 10:{i % 60:02d}:00')
+          for i in range(3000)])
+    conn.commit()
+    conn.close()
+    archiver.archive_month('2024-03')
+
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(sales_bp)
+    return app.test_client()
+
+
+def test_csv_en_trozos_sin_limite_de_filas(db):
+    """El CSV incluye todas las ventas (archivo + principal) y sale en varios trozos"""
+    chunks = list(SalesHistoryController().iter_sales_csv())
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+
+    assert len(chunks) > 1
+    assert rows[0][0] == 'ID'
+    assert len(rows) == 3001
+    assert rows[1][1:3] == ['2024-03-01', '10:00:00']
+    assert [row[1] for row in rows[1:]] == sorted(row[1] for row in rows[1:])
+    assert {row[4] for row in rows[1:]} == {'Ramo Primavera', 'Producto Puerta ZZ'}
+
+
+def test_exportacion_lee_una_sola_instantanea(db):
+    """Las ventas que entran durante la exportación no aparecen a medias"""
+    rows = SalesHistoryController().iter_sales()
+    first = next(rows)
+
+    conn = db.get_connection()
+    conn.execute('''
+        INSERT INTO sales (door_id, payment_method, amount, status, created_at)
+        VALUES ('A1', 'cash', 35.0, 'completed', '2024-04-28 23:00:00')
+    ''')
+    conn.commit()
+    conn.close()
+
+    assert 1 + sum(1 for _ in rows) == 3000
+    assert first[1].startswith('2024-03-01')
+    assert len(list(SalesHistoryController().iter_sales())) == 3001
+
+
+def test_descarga_csv_gzip_en_streaming(db, client):
+    """La ruta devuelve una respuesta en streaming comprimida con gzip"""
+    response = client.get('/api/sales/export/stream?format=csv&gzip=1&start_date=2024-04-01')
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/gzip'
+    assert '.csv.gz' in response.headers['Content-Disposition']
+    rows = list(csv.reader(io.StringIO(gzip.decompress(response.data).decode('utf-8'))))
+    assert len(rows) == 1501
+
+
+def test_descarga_ndjson(db, client):
+    """NDJSON: un objeto JSON por línea con los campos del historial"""
+    response = client.get('/api/sales/export/stream?format=ndjson&start_date=2024-03-01&end_date=2024-03-31')
+    lines = response.data.decode('utf-8').splitlines()
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(lines) == 1500
+    first = json.loads(lines[0])
+    assert first['timestamp'] == '2024-03-01 10:00:00'
+    assert first['transaction_id'] == 'PAY_0'
+    assert client.get('/api/sales/export/stream?format=xml').status_code == 400
+
+
+def test_fecha_invalida_responde_400_antes_del_adjunto(db, client):
+    """Una fecha mal formada se rechaza antes de empezar a enviar el fichero"""
+    response = client.get('/api/sales/export/stream?format=csv&start_date=2024-13-45')
+    assert response.status_code == 400
+    assert 'Content-Disposition' not in response.headers
+    assert response.get_json()['success'] is False
@@ -0,0 +1,151 @@
+"""
+Pruebas del controlador de hardware sobre el backend simulado (reloj virtual)
+"""
+import sys
+import os
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from controllers.hardware_backend import SimulatedBackend
+from controllers.hardware_controller import HardwareController
+from controllers.relay_matrix import build_pulse_train
+
+
+@pytest.fixture
+def hardware(tmp_path):
+    """Controlador con tres puertas simples (A1 y A2 con sensor) y dos de matriz en el pin 5"""
+    config = {
+        'machine': {'door_settings': {'default_open_time': 3.0, 'min_open_time': 1.0, 'max_open_time': 30.0}},
+        'doors': {
+            'A1': {'gpio_pin': 17, 'sensor_pin': 27},
+            'A2': {'gpio_pin': 18, 'sensor_pin': 28, 'open_time': 5},
+            'A3': {'gpio_pin': 19},
+            'B1': {'gpio_pin': 5, 'relay_matrix': True, 'relay_index': 1},
+            'B2': {'gpio_pin': 5, 'relay_matrix': True, 'relay_index': 2},
+        }
+    }
+    path = tmp_path / 'machine_config.json'
+    path.write_text(json.dumps(config), encoding='utf-8')
+    backend = SimulatedBackend()
+    controller = HardwareController(str(path), backend=backend)
+    yield controller, backend
+    controller.config_store.close()
+
+
+def test_cierre_automatico_en_tiempo_virtual(hardware):
+    controller, backend = hardware
+    assert controller.open_door('A1')
+    backend.advance(2.999)
+    assert backend.timeline.level(17) == 1
+    backend.advance(0.001)
+    assert backend.timeline.transitions(17) == [(0.0, 1), (3.0, 0)]
+    assert controller.get_door_state('A1')['relay_active'] is False
+
+
+def test_miles_de_ciclos_de_puerta(hardware):
+    controller, backend = hardware
+    sensor = backend.sensors['A1']
+    sensor.behave(open_after=0.4, close_after=1.2)
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        assert controller.open_door('A1')
+        backend.advance(2.0)
+    elapsed = time.perf_counter() - started
+
+    # El cierre detectado por el sensor libera el relé antes del cierre automático
+    transitions = backend.timeline.transitions(17)
+    assert len(transitions) == 2000
+    assert all(round(off - on, 6) == 1.6 for (on, _), (off, _) in zip(transitions[::2], transitions[1::2]))
+    assert sensor.cycles == 1000
+    assert controller.door_scheduler.get_stats()['pending'] == 0
+    assert elapsed < 5
+
+
+def test_rebotes_guionizados(hardware):
+    controller, backend = hardware
+    events = []
+    controller.register_door_callback('A2', lambda door_id, is_open: events.append((backend.now(), is_open)))
+    backend.sensors['A2'].script((1.0, True), (1.002, False), (1.004, True), (1.5, False))
+    backend.advance(2.0)
+    assert events == [(1.0, True), (1.5, False)]
+
+
+def test_apertura_en_lote_escalonada_y_matriz(hardware):
+    controller, backend = hardware
+    backend.timeline.clear()  # Descartar los off() de la inicialización
+    results = controller.open_doors(['A1', 'A2', 'A3', 'B1', 'B2'])
+    assert results == {'A1': True, 'A2': True, 'A3': True, 'B1': True, 'B2': True}
+
+    starts = sorted(transitions[0][0] for pin in (17, 18, 19)
+                    for transitions in [backend.timeline.transitions(pin)])
+    spacing = controller.relay_budget.min_spacing
+    assert all(round(b - a, 6) >= spacing for a, b in zip(starts, starts[1:]))
+
+    # Una trama de selección por puerta de matriz, cada una con su turno del
+    # presupuesto, y sin jitter en tiempo virtual
+    history = backend.timeline.history(5)
+    assert len(history) == 22
+    assert round(history[11][0] - history[0][0], 6) >= spacing
+    assert [level for _, level in history] == [level for index in (1, 2)
+                                               for level, _ in build_pulse_train(index, activate=True)]
+    assert controller.relay_matrix_driver.get_stats()['jitter_max_us'] == 0
+
+    # El cierre automático envía la trama de desactivación de cada índice
+    backend.advance(controller.get_door_open_time('B2'))
+    history = backend.timeline.history(5)[22:]
+    assert [level for _, level in history] == [level for index in (1, 2)
+                                               for level, _ in build_pulse_train(index, activate=False)]
+    assert controller.get_door_state('B1')['relay_active'] is False
+    assert controller.get_door_state('B2')['relay_active'] is False
+
+
+def test_prorroga_y_cancelacion_en_el_actor_de_la_puerta(hardware):
+    from controllers.door_actors import DoorActorPool
+    controller, backend = hardware
+    assert controller.open_door('A1')
+
+    # Con actores en hilos, el temporizador solo se toca desde el actor de A1
+    inline_actors, controller.door_actors = controller.door_actors, DoorActorPool(max_workers=2)
+    seen = []
+    extend = controller.door_scheduler.extend
+    controller.door_scheduler.extend = lambda *args: seen.append(controller.door_actors.current_door()) or extend(*args)
+    assert controller.extend_door_open('A1', 2.0)
+    assert seen == ['A1']
+    controller.door_actors.shutdown(wait=True)
+    controller.door_actors = inline_actors
+
+    backend.advance(3.0)
+    assert backend.timeline.level(17) == 1
+    backend.advance(2.0)
+    assert backend.timeline.level(17) == 0
+
+    assert controller.open_door('A2')
+    assert controller.cancel_auto_close('A2')
+    assert 'A2' not in controller.door_timers
+    backend.advance(10.0)
+    assert backend.timeline.level(18) == 1
+
+
+def test_apertura_en_lote_rechaza_ids_no_texto(hardware, monkeypatch):
+    """La ruta de apertura en lote responde 400 si algún door_id no es texto"""
+    from flask import Flask
+    from routes import hardware_routes
+    controller, backend = hardware
+    monkeypatch.setattr(hardware_routes, 'hardware_controller', controller)
+    app = Flask(__name__)
+    app.register_blueprint(hardware_routes.hardware_bp)
+    client = app.test_client()
+    backend.timeline.clear()
+
+    for door_ids in ([['A1']], [{}], ['A1', 3]):
+        response = client.post('/api/hardware/doors/open', json={'door_ids': door_ids})
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+    assert backend.timeline.transitions(17) == []
+
+    response = client.post('/api/hardware/doors/open', json={'door_ids': ['A1', 'A3']})
+    assert response.status_code == 200
+    assert response.get_json()['opened'] == 2
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark del camino de compra: conexión por llamada vs pool de conexiones
+
+Simula el flujo de una compra aprobada (consulta de producto, venta,
+actualización de estado, descuento de stock y log) sobre una base de datos
+temporal, primero abriendo una conexión por llamada con journal clásico y
+después con el pool de conexiones en modo WAL.
+
+Uso:
+    python utils/benchmark_database.py [compras] [hilos]
+"""
+import sys
+import os
+import time
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+
+def purchase(db: DatabaseManager, door_id: str):
+    """Camino de compra tal como lo ejecutan las rutas de pago"""
+    product = db.get_product_by_door(door_id)
+    if not product:
+        return
+    sale_id = db.create_sale(door_id, 'contactless', product['price'],
+                             product_id=product['id'], payment_id=f'BENCH_{door_id}')
+    if sale_id:
+        db.update_sale_status(sale_id, 'completed', dispensed=True)
+    db.decrease_stock(door_id, 1)
+    db.log_system_event('INFO', f'Venta de prueba {sale_id}', 'benchmark', door_id)
+
+
+def purchase_single_transaction(db: DatabaseManager, door_id: str):
+    """Camino de compra usando complete_sale (una transacción por venta)"""
+    sale = db.complete_sale(door_id, None, None, 'contactless')
+    if sale:
+        db.log_system_event('INFO', f"Venta de prueba {sale['sale_id']}", 'benchmark', door_id)
+
+
+def run_scenario(name: str, purchases: int, threads: int, purchase_fn=purchase, **db_options) -> float:
+    """Ejecutar un escenario y devolver compras por segundo"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(db_path=os.path.join(tmp, 'bench.db'), **db_options)
+        door_ids = [p['door_id'] for p in db.get_all_products()]
+        for door_id in door_ids:
+            db.update_product(door_id, stock=purchases)
+
+        per_thread = purchases // threads
+
+        def worker(offset: int):
+            for i in range(per_thread):
+                purchase_fn(db, door_ids[(offset + i) % len(door_ids)])
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        db.close()
+
+    rate = (per_thread * threads) / elapsed
+    print(f"{name:28} {elapsed * 1000:9.1f} ms  {rate:9.1f} compras/s")
+    return rate
+
+
+def main():
+    purchases = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    print(f"=== BENCHMARK CAMINO DE COMPRA ({purchases} compras, {threads} hilos) ===")
+    baseline = run_scenario('Conexión por llamada', purchases, threads,
+                            pool_size=0, journal_mode='DELETE')
+    pooled = run_scenario('Pool + WAL', purchases, threads)
+    single_tx = run_scenario('Pool + WAL + complete_sale', purchases, threads,
+                             purchase_fn=purchase_single_transaction)
+    print(f"Mejora pool: x{pooled / baseline:.2f}")
+    print(f"Mejora pool + complete_sale: x{single_tx / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+Exportación columnar de ventas (NumPy) para análisis rápidos
+
+Cada mes de ventas se guarda como un directorio de ficheros .npy, uno por
+columna, que se pueden abrir con memory-map y agregar sin copiar datos:
+
+    <dir>/<máquina>/YYYY_MM/
+        id.npy          int64   id de la venta
+        ts.npy          int64   created_at en segundos Unix (UTC)
+        door.npy        uint16  índice en meta['doors']
+        amount.npy      int32   importe en céntimos
+        method.npy      uint8   índice en meta['methods']
+        status.npy      uint8   índice en meta['statuses']
+        meta.json       diccionarios y número de filas (se escribe el último)
+
+NumPy es una dependencia opcional: sin ella el módulo se importa pero
+exportar o cargar lanza RuntimeError.
+
+Uso como script:
+    python utils/columnar_sales.py            # exportar todos los meses cerrados
+    python utils/columnar_sales.py 2025-03    # exportar un mes
+"""
+import sys
+import os
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from config import Config
+from database import db_manager
+from utils.db_archive import monthly_archiver, month_bounds, shift_month
+
+logger = logging.getLogger(__name__)
+
+# Columnas: nombre -> tipo NumPy
+COLUMNS = {
+    'id': 'int64',
+    'ts': 'int64',
+    'door': 'uint16',
+    'amount': 'int32',
+    'method': 'uint8',
+    'status': 'uint8',
+}
+
+FETCH_ROWS = 2000
+AGGREGATE_ROWS = 65536  # Filas del memory-map agregadas por bloque
+
+
+def _require_numpy():
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("NumPy no está instalado: la exportación columnar no está disponible")
+
+
+class ColumnarMonth:
+    """Un mes de ventas cargado con memory-map (columnas como arrays de NumPy)"""
+
+    __slots__ = ('path', 'meta', 'columns')
+
+    def __init__(self, path: str, meta: Dict, columns: Dict):
+        self.path = path
+        self.meta = meta
+        self.columns = columns
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getattr__(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def code(self, dictionary: str, value: str) -> Optional[int]:
+        """Código de un valor en un diccionario ('doors', 'methods', 'statuses')"""
+        values = self.meta[dictionary]
+        return values.index(value) if value in values else None
+
+
+class ColumnarSalesStore:
+    """Escribir y leer meses de ventas en formato columnar"""
+
+    def __init__(self, db=None, base_dir: str = None, machine_id: str = None, archiver=None):
+        self.db = db
+        self.base_dir = base_dir or Config.COLUMNAR_EXPORT_DIR
+        self.machine_id = machine_id or Config.MACHINE_ID
+        self.archiver = archiver
+
+    @property
+    def _db(self):
+        return self.db or db_manager
+
+    @property
+    def _archiver(self):
+        return self.archiver or monthly_archiver
+
+    def month_path(self, month: str, machine_id: str = None) -> str:
+        """Directorio de un mes de una máquina"""
+        return os.path.join(self.base_dir, machine_id or self.machine_id, f"{month[:4]}_{month[5:7]}")
+
+    # Exportación
+
+    def export_month(self, month: str) -> Optional[Dict]:
+        """
+        Exportar un mes de ventas (de la base principal o de su archivo mensual)
+
+        Returns:
+            meta del mes exportado, o None si falla
+        """
+        _require_numpy()
+        start, end = month_bounds(month)
+        archived = month in self._archiver.list_archives()
+
+        conn = self._db.get_read_connection()
+        try:
+            with self._archiver.attached(conn, [month] if archived else []) as schemas:
+                schema = schemas[0] if schemas else 'main'
+                where = "WHERE created_at >= ? AND created_at < ?"
+                rows = conn.execute(f"SELECT COUNT(*) FROM {schema}.sales {where}", (start, end)).fetchone()[0]
+
+                arrays = {name: np.empty(rows, dtype=dtype) for name, dtype in COLUMNS.items()}
+                dictionaries = {'doors': {}, 'methods': {}, 'statuses': {}}
+
+                # SQLite convierte fecha e importe; Python solo codifica los textos
+                cursor = conn.execute(f'''
+                    SELECT id, CAST(strftime('%s', created_at) AS INTEGER),
+                           door_id, CAST(ROUND(amount * 100) AS INTEGER), payment_method, status
+                    FROM {schema}.sales {where}
+                    ORDER BY created_at, id
+                ''', (start, end))
+                try:
+                    index = 0
+                    while index < rows:
+                        chunk = cursor.fetchmany(FETCH_ROWS)
+                        if not chunk:
+                            break
+                        self._fill(arrays, dictionaries, index, chunk)
+                        index += len(chunk)
+                finally:
+                    cursor.close()
+        except Exception as e:
+            logger.error(f"Error al exportar ventas columnares de {month}: {e}")
+            return None
+        finally:
+            conn.close()
+
+        meta = {
+            'month': month,
+            'machine_id': self.machine_id,
+            'rows': index,
+            'doors': list(dictionaries['doors']),
+            'methods': list(dictionaries['methods']),
+            'statuses': list(dictionaries['statuses']),
+            'columns': COLUMNS,
+        }
+        self._write(self.month_path(month), {name: arr[:index] for name, arr in arrays.items()}, meta)
+        logger.info(f"Ventas de {month} exportadas en formato columnar ({index} filas)")
+        return meta
+
+    def _fill(self, arrays: Dict, dictionaries: Dict, offset: int, chunk: List[tuple]):
+        """Copiar un bloque de filas en los arrays, codificando los textos"""
+        doors = dictionaries['doors']
+        methods = dictionaries['methods']
+        statuses = dictionaries['statuses']
+        ids, ts, door_codes, amounts, method_codes, status_codes = zip(*chunk)
+        end = offset + len(chunk)
+
+        arrays['id'][offset:end] = ids
+        arrays['ts'][offset:end] = ts
+        arrays['amount'][offset:end] = amounts
+        arrays['door'][offset:end] = [doors.setdefault(v, len(doors)) for v in door_codes]
+        arrays['method'][offset:end] = [methods.setdefault(v, len(methods)) for v in method_codes]
+        arrays['status'][offset:end] = [statuses.setdefault(v, len(statuses)) for v in status_codes]
+
+    def _write(self, path: str, arrays: Dict, meta: Dict):
+        """Escribir columnas y meta.json; meta.json se escribe el último como marca de mes completo"""
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        for name, array in arrays.items():
+            tmp_path = os.path.join(path, f"{name}.tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+        tmp_meta = meta_path + '.tmp'
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_meta, meta_path)
+
+    def export_closed_months(self) -> List[str]:
+        """Exportar todos los meses cerrados que aún no tengan exportación"""
+        _require_numpy()
+        conn = self._db.get_read_connection()
+        try:
+            row = conn.execute("SELECT MIN(created_at) FROM sales").fetchone()
+        finally:
+            conn.close()
+
+        months = set(self._archiver.list_archives())
+        if row and row[0]:
+            month = row[0][:7]
+            current = datetime.now(timezone.utc).strftime('%Y-%m')
+            while month < current:
+                months.add(month)
+                month = shift_month(month, 1)
+
+        exported = []
+        for month in sorted(months):
+            if os.path.exists(os.path.join(self.month_path(month), 'meta.json')):
+                continue
+            if self.export_month(month) is not None:
+                exported.append(month)
+        return exported
+
+    # Lectura
+
+    def load_month(self, path: str) -> ColumnarMonth:
+        """Abrir un mes exportado con memory-map (sin copiar los datos)"""
+        _require_numpy()
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        columns = {}
+        for name in meta['columns']:
+            if meta['rows']:
+                columns[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+            else:
+                # np.memmap no admite ficheros vacíos
+                columns[name] = np.empty(0, dtype=meta['columns'][name])
+        return ColumnarMonth(path, meta, columns)
+
+    def load(self, start_month: str = None, end_month: str = None,
+             machines: List[str] = None) -> List[ColumnarMonth]:
+        """Cargar los meses exportados de un rango ('YYYY-MM', ambos incluidos) y máquinas"""
+        if not os.path.isdir(self.base_dir):
+            return []
+        machines = machines or sorted(os.listdir(self.base_dir))
+
+        months = []
+        for machine in machines:
+            machine_dir = os.path.join(self.base_dir, machine)
+            if not os.path.isdir(machine_dir):
+                continue
+            for name in sorted(os.listdir(machine_dir)):
+                month = name.replace('_', '-')
+                if (start_month and month < start_month) or (end_month and month > end_month):
+                    continue
+                if os.path.exists(os.path.join(machine_dir, name, 'meta.json')):
+                    months.append(self.load_month(os.path.join(machine_dir, name)))
+        return months
+
+
+def aggregate(months: List[ColumnarMonth], by: str = 'door',
+              status: Optional[str] = 'completed') -> Dict[str, Tuple[int, float]]:
+    """
+    Agregar ventas y facturación de varios meses/máquinas
+
+    Cada mes se recorre por bloques de AGGREGATE_ROWS filas del memory-map:
+    el filtro por estado se aplica con np.compress sobre el bloque y se
+    acumula con np.bincount, así que la memoria extra está acotada por el
+    bloque y no por el mes. Solo los totales, del tamaño del diccionario, se
+    combinan en Python.
+
+    Args:
+        by: 'door', 'method' o 'day' (YYYY-MM-DD en UTC)
+        status: Estado a incluir (None para todos)
+
+    Returns:
+        {clave: (número de ventas, importe en euros)}
+    """
+    _require_numpy()
+    totals: Dict[str, List] = {}
+
+    for month in months:
+        rows = len(month)
+        if not rows:
+            continue
+        code = None
+        if status is not None:
+            code = month.code('statuses', status)
+            if code is None:
+                continue
+
+        if by == 'day':
+            first_day = int(month.ts.min()) // 86400
+            days = int(month.ts.max()) // 86400 - first_day + 1
+            labels = [str(np.datetime64(first_day + i, 'D')) for i in range(days)]
+        else:
+            column, dictionary = {'door': ('door', 'doors'), 'method': ('method', 'methods')}[by]
+            labels = month.meta[dictionary]
+
+        counts = np.zeros(len(labels), dtype=np.int64)
+        cents = np.zeros(len(labels), dtype=np.float64)
+        for start in range(0, rows, AGGREGATE_ROWS):
+            end = start + AGGREGATE_ROWS
+            if by == 'day':
+                keys = month.ts[start:end] // 86400 - first_day
+            else:
+                keys = month.columns[column][start:end]
+            amounts = month.amount[start:end]
+            if code is not None:
+                selected = month.status[start:end] == code
+                keys = np.compress(selected, keys)
+                amounts = np.compress(selected, amounts)
+            counts += np.bincount(keys, minlength=len(labels))
+            cents += np.bincount(keys, weights=amounts, minlength=len(labels))
+
+        for label, count, amount in zip(labels, counts, cents):
+            if count:
+                entry = totals.setdefault(label, [0, 0])
+                entry[0] += int(count)
+                entry[1] += int(amount)
+
+    return {key: (count, cents / 100.0) for key, (count, cents) in sorted(totals.items())}
+
+
+columnar_store = ColumnarSalesStore()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1:
+        print(columnar_store.export_month(sys.argv[1]))
+    else:
+        print(columnar_store.export_closed_months())
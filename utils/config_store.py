@@ -0,0 +1,256 @@
+"""
+Almacén compartido de la configuración de la máquina (machine_config.json)
+
+Todos los controladores del proceso (MachineConfigManager, HardwareController
+y RestockController a través del primero) trabajan sobre el mismo dict, así que
+ya no se pisan los cambios al guardar. Cada sección de primer nivel ('doors',
+'machine', ...) tiene su propio lock para las modificaciones; cada cambio
+incrementa `version`, se guarda con ConfigWriter y se notifica a los
+suscriptores con la sección y, si se conoce, la clave cambiada (p. ej. la puerta).
+
+Los cambios hechos a mano en el fichero se detectan comparando mtime y tamaño
+(cada CONFIG_RELOAD_INTERVAL segundos o con check_for_changes()) y se recargan
+en caliente sobre el mismo dict, de modo que precios o tiempos de apertura
+editados se aplican sin reiniciar. Si la edición llega con cambios propios aún
+sin guardar, se fusiona a tres bandas con la última versión conocida del
+fichero antes de escribir, en lugar de pisarla; si ambos cambiaron el mismo
+valor, gana el fichero.
+"""
+import os
+import copy
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from config import Config
+from utils.config_writer import ConfigWriter
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _merge_into(mine: Dict, base: Dict, theirs: Dict, path: str = '') -> List[str]:
+    """
+    Fusión a tres bandas en el sitio: aplicar a `mine` lo que cambió de `base`
+    a `theirs`. Devuelve las rutas en conflicto, donde se queda `theirs`.
+    """
+    conflicts = []
+    for key in list(dict.fromkeys([*mine, *theirs, *base])):
+        b, t, m = base.get(key, _MISSING), theirs.get(key, _MISSING), mine.get(key, _MISSING)
+        if t == b or m == t:
+            continue
+        if m != b and isinstance(m, dict) and isinstance(t, dict):
+            conflicts += _merge_into(m, b if isinstance(b, dict) else {}, t, f"{path}{key}.")
+            continue
+        if m != b:
+            conflicts.append(f"{path}{key}")
+        if t is _MISSING:
+            mine.pop(key, None)
+        else:
+            mine[key] = t
+    return conflicts
+
+
+class ConfigStore:
+    """Configuración JSON compartida con locks por sección, avisos de cambio y recarga en caliente"""
+
+    def __init__(self, path: str, flush_ms: int = None, reload_interval: float = None):
+        self.path = path
+        self.data: Dict[str, Any] = {}
+        self.version = 0
+        self._lock = threading.RLock()
+        self._section_locks: Dict[Optional[str], threading.RLock] = {}
+        self._listeners: List[Callable[[Optional[str], int, Optional[str]], None]] = []
+        self._file_signature = None
+        self._base: Dict[str, Any] = {}  # Último contenido conocido del fichero
+        self.writer = ConfigWriter(
+            path, lambda: self.data,
+            delay_ms=Config.CONFIG_FLUSH_MS if flush_ms is None else flush_ms,
+            on_write=self._remember_written,
+            before_write=self._reconcile
+        )
+        self.load()
+
+        self._stop = threading.Event()
+        self._watcher = None
+        interval = Config.CONFIG_RELOAD_INTERVAL if reload_interval is None else reload_interval
+        if interval > 0:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                             name='config-watcher', daemon=True)
+            self._watcher.start()
+
+    def _signature(self):
+        """(mtime, tamaño) del fichero, o None si no existe"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _remember_written(self, text: str):
+        """Anotar la firma y el contenido del fichero tras una escritura propia"""
+        self._file_signature = self._signature()
+        self._base = json.loads(text)
+
+    def _read(self):
+        """Leer el fichero: (firma, contenido)"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            signature = self._signature()
+            return signature, json.load(f)
+
+    def section_lock(self, section: Optional[str] = None) -> threading.RLock:
+        """Lock de una sección de primer nivel (None = toda la configuración)"""
+        with self._lock:
+            lock = self._section_locks.get(section)
+            if lock is None:
+                lock = self._section_locks[section] = threading.RLock()
+            return lock
+
+    @contextmanager
+    def _all_sections_locked(self):
+        with self._lock:
+            locks = [self._section_locks[key] for key in sorted(self._section_locks, key=str)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    @contextmanager
+    def mutate(self, section: Optional[str] = None, key: Optional[str] = None):
+        """
+        Modificar la configuración bajo el lock de una sección
+
+            with store.mutate('doors', 'A1') as config:
+                config['doors']['A1']['door_open'] = True
+
+        Al salir sin excepción se registra el cambio (versión, guardado y avisos).
+        """
+        with self.section_lock(section):
+            yield self.data
+        self.changed(section, key)
+
+    def changed(self, section: Optional[str] = None, key: Optional[str] = None) -> bool:
+        """Registrar un cambio ya aplicado en memoria: nueva versión, guardado diferido y avisos"""
+        with self._lock:
+            self.version += 1
+            version = self.version
+        saved = self.writer.mark_dirty()
+        self._notify(section, version, key)
+        return saved
+
+    def load(self) -> bool:
+        """Leer el fichero y reemplazar el contenido del dict compartido"""
+        try:
+            signature, data = self._read()
+        except FileNotFoundError:
+            logger.error(f"Archivo de configuración no encontrado: {self.path}")
+            return False
+        except Exception as e:
+            logger.error(f"Error al cargar configuración {self.path}: {e}")
+            return False
+
+        with self._all_sections_locked():
+            # Se conserva el mismo dict: quien guarde una referencia ve los cambios
+            self.data.clear()
+            self.data.update(data)
+            self._base = copy.deepcopy(data)
+            self._file_signature = signature
+            with self._lock:
+                self.version += 1
+                version = self.version
+        self._notify(None, version)
+        return True
+
+    def check_for_changes(self) -> bool:
+        """Recargar si el fichero cambió fuera de este proceso; devuelve True si se recargó"""
+        signature = self._signature()
+        if signature is None or signature == self._file_signature:
+            return False
+        if self.writer.get_stats()['pending']:
+            # Hay cambios propios sin guardar: se fusionan con los del fichero
+            try:
+                return self._merge_external()
+            except Exception as e:
+                logger.error(f"Error al fusionar cambios externos de {self.path}: {e}")
+                return False
+        logger.info(f"{self.path} cambió en disco, recargando configuración")
+        return self.load()
+
+    def _merge_external(self) -> bool:
+        """Incorporar una edición externa del fichero sin perder los cambios pendientes"""
+        signature, disk = self._read()
+        with self._all_sections_locked():
+            conflicts = _merge_into(self.data, self._base, disk)
+            self._base = copy.deepcopy(disk)
+            self._file_signature = signature
+            with self._lock:
+                self.version += 1
+                version = self.version
+        if conflicts:
+            logger.warning(f"{self.path} cambió en disco y en memoria ({', '.join(conflicts)}); "
+                           f"se mantiene el valor del fichero")
+        else:
+            logger.info(f"{self.path} cambió en disco, fusionado con los cambios pendientes")
+        self._notify(None, version)
+        return True
+
+    def _reconcile(self):
+        """Antes de escribir: fusionar una edición externa que el vigilante aún no haya visto"""
+        signature = self._signature()
+        if signature is not None and signature != self._file_signature:
+            self._merge_external()
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                logger.error(f"Error comprobando cambios en {self.path}: {e}")
+
+    def subscribe(self, callback: Callable[[Optional[str], int, Optional[str]], None]):
+        """Registrar callback(sección, versión, clave) para cada cambio o recarga"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Optional[str], int, Optional[str]], None]):
+        """Quitar un callback registrado con subscribe()"""
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _notify(self, section: Optional[str], version: int, key: Optional[str] = None):
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(section, version, key)
+            except Exception as e:
+                logger.error(f"Error en aviso de cambio de configuración: {e}")
+
+    def flush(self) -> bool:
+        """Escribir ya los cambios pendientes"""
+        return self.writer.flush()
+
+    def close(self):
+        """Detener la vigilancia del fichero y guardar lo pendiente"""
+        self._stop.set()
+        self.writer.close()
+
+
+_stores: Dict[str, ConfigStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_config_store(path: str = "machine_config.json", **kwargs) -> ConfigStore:
+    """Obtener el almacén compartido de un fichero (uno por ruta en todo el proceso)"""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ConfigStore(path, **kwargs)
+        return store
@@ -0,0 +1,189 @@
+"""
+Persistencia diferida y atómica de ficheros de configuración JSON
+
+Los cambios en machine_config.json (sensores de puerta, estados, dispensados)
+solo marcan la configuración como sucia; un temporizador la escribe como
+mucho una vez cada `delay_ms`, agrupando todos los cambios intermedios. Cada
+escritura va a un fichero temporal en el mismo directorio, se hace fsync y se
+renombra sobre el original, así que un corte de corriente deja la versión
+anterior o la nueva, nunca un JSON a medias.
+
+Cada cambio incrementa un contador de generación; `flushed_generation` indica
+la última generación que ya está en disco. Si una escritura falla (disco
+lleno, permisos...) se vuelve a intentar con el temporizador cada
+RETRY_DELAY segundos como mínimo, sin esperar a un nuevo cambio.
+"""
+import os
+import json
+import atexit
+import logging
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RETRY_DELAY = 1.0  # Segundos mínimos antes de reintentar una escritura fallida
+
+
+def write_text_atomic(path: str, text: str):
+    """Escribir texto en un temporal, hacer fsync y renombrarlo sobre path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Persistir también la entrada de directorio del rename
+    if hasattr(os, 'O_DIRECTORY'):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+
+class ConfigWriter:
+    """
+    Escritor diferido de un fichero JSON.
+    mark_dirty() es barato y no toca el disco: el primer cambio programa una
+    escritura a `delay_ms` y los siguientes se acumulan en ella. Con
+    delay_ms=0 se escribe en el momento (de forma atómica igualmente).
+    """
+
+    def __init__(self, path: str, snapshot: Callable[[], Any], delay_ms: int = 500,
+                 on_write: Optional[Callable[[str], None]] = None,
+                 before_write: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            snapshot: Devuelve el objeto a serializar
+            on_write: Se llama con el JSON escrito tras cada escritura correcta
+            before_write: Se llama antes de serializar si hay cambios pendientes
+                (p. ej. para incorporar ediciones externas del fichero)
+        """
+        self.path = path
+        self._snapshot = snapshot
+        self._on_write = on_write
+        self._before_write = before_write
+        self.delay = max(0, delay_ms) / 1000.0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+        self.generation = 0
+        self.flushed_generation = 0
+        self._stats = {
+            'marks': 0,
+            'writes': 0,
+            'failed': 0,
+            'last_write_ms': 0.0
+        }
+        atexit.register(self.close)
+
+    def mark_dirty(self) -> bool:
+        """Registrar un cambio; se escribirá en la próxima escritura programada"""
+        with self._lock:
+            self.generation += 1
+            self._stats['marks'] += 1
+            if self.delay and not self._closed:
+                self._schedule(self.delay)
+                return True
+        return self._write()
+
+    def _schedule(self, delay: float):
+        """Programar una escritura si no hay ya una (con self._lock adquirido)"""
+        if self._timer is None and not self._closed:
+            self._timer = threading.Timer(delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self._write()
+
+    def _write(self) -> bool:
+        """Escribir la configuración actual si hay cambios sin guardar"""
+        if self._before_write is not None and self.get_stats()['pending']:
+            # Fuera de _write_lock: el hook puede avisar a suscriptores que a
+            # su vez registren cambios (y escriban con delay_ms=0). Si falla no
+            # se escribe encima y se reintenta como una escritura fallida.
+            try:
+                self._before_write()
+            except Exception as e:
+                logger.error(f"No se guarda {self.path}: {e}")
+                with self._lock:
+                    self._stats['failed'] += 1
+                    self._schedule(max(self.delay, RETRY_DELAY))
+                return False
+        with self._write_lock:
+            with self._lock:
+                generation = self.generation
+            if generation == self.flushed_generation:
+                return True
+
+            started = time.perf_counter()
+            try:
+                # El JSON se serializa antes de abrir el fichero; si otro hilo
+                # añade claves mientras tanto (RuntimeError) se reintenta
+                for attempt in range(3):
+                    try:
+                        text = json.dumps(self._snapshot(), indent=2, ensure_ascii=False)
+                        break
+                    except RuntimeError:
+                        if attempt == 2:
+                            raise
+                write_text_atomic(self.path, text)
+                if self._on_write is not None:
+                    self._on_write(text)
+            except Exception as e:
+                logger.error(f"Error guardando {self.path}: {e}")
+                with self._lock:
+                    self._stats['failed'] += 1
+                    # Los cambios siguen pendientes: reintentar aunque no lleguen más
+                    self._schedule(max(self.delay, RETRY_DELAY))
+                return False
+
+            with self._lock:
+                self.flushed_generation = generation
+                self._stats['writes'] += 1
+                self._stats['last_write_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            return True
+
+    def flush(self) -> bool:
+        """Escribir ya los cambios pendientes (cancelando la escritura programada)"""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        return self._write()
+
+    def close(self):
+        """Escribir lo pendiente y dejar de programar escrituras (hook de apagado)"""
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas del escritor (generaciones, escrituras, fallos)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['generation'] = self.generation
+            stats['flushed_generation'] = self.flushed_generation
+            stats['pending'] = self.generation != self.flushed_generation
+            stats['delay_ms'] = int(self.delay * 1000)
+        return stats
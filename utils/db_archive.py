@@ -0,0 +1,248 @@
+"""
+Archivo mensual de datos antiguos
+
+Los meses cerrados de sales, restocks y system_logs se mueven de la base de
+datos principal a un fichero SQLite por mes (database/archive/vending_YYYY_MM.db)
+con ATTACH + INSERT…SELECT y después DELETE por bloques. La base principal se
+mantiene pequeña (backups, VACUUM y consultas rápidas) y el historial sigue
+siendo consultable adjuntando los archivos que toca cada rango de fechas.
+
+Uso como script:
+    python utils/db_archive.py
+"""
+import sys
+import os
+import re
+import glob
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import db_manager, date_bounds
+
+logger = logging.getLogger(__name__)
+
+# Tablas que se archivan por mes (todas se filtran por created_at)
+ARCHIVED_TABLES = ['sales', 'restocks', 'system_logs']
+
+# SQLite admite por defecto 10 bases de datos adjuntas por conexión
+MAX_ATTACHED = 10
+
+
+def month_bounds(month: str) -> Tuple[str, str]:
+    """Límites semiabiertos [inicio, fin) de un mes 'YYYY-MM'"""
+    year, mon = int(month[:4]), int(month[5:7])
+    next_year, next_mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{year:04d}-{mon:02d}-01", f"{next_year:04d}-{next_mon:02d}-01"
+
+
+def shift_month(month: str, months: int) -> str:
+    """Desplazar un mes 'YYYY-MM' n meses (negativo hacia atrás)"""
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class MonthlyArchiver:
+    """Mover meses cerrados a ficheros de archivo y adjuntarlos al consultar"""
+
+    def __init__(self, db=None, archive_dir: str = None,
+                 keep_months: int = None, chunk_size: int = None):
+        self.db = db
+        self.archive_dir = archive_dir or Config.DB_ARCHIVE_DIR
+        self.keep_months = Config.DB_ARCHIVE_KEEP_MONTHS if keep_months is None else keep_months
+        self.chunk_size = chunk_size or Config.DB_ARCHIVE_CHUNK_SIZE
+
+    @property
+    def _db(self):
+        return self.db or db_manager
+
+    def archive_path(self, month: str) -> str:
+        """Ruta del fichero de archivo de un mes"""
+        return os.path.join(self.archive_dir, f"vending_{month[:4]}_{month[5:7]}.db")
+
+    def list_archives(self) -> List[str]:
+        """Meses archivados ('YYYY-MM'), del más reciente al más antiguo"""
+        months = []
+        for path in glob.glob(os.path.join(self.archive_dir, 'vending_*_*.db')):
+            match = re.search(r'vending_(\d{4})_(\d{2})\.db$', path)
+            if match:
+                months.append(f"{match.group(1)}-{match.group(2)}")
+        return sorted(months, reverse=True)
+
+    def archives_for_range(self, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None) -> List[str]:
+        """Meses archivados que se solapan con un rango de días (ambos incluidos)"""
+        start, end = date_bounds(start_date, end_date)
+        months = []
+        for month in self.list_archives():
+            month_start, month_end = month_bounds(month)
+            if (start and month_end <= start) or (end and month_start >= end):
+                continue
+            months.append(month)
+        return months
+
+    def batches_for_range(self, start_date: Optional[str] = None,
+                          end_date: Optional[str] = None) -> List[List[str]]:
+        """
+        Meses archivados de un rango agrupados en lotes adjuntables a la vez,
+        del más reciente al más antiguo. Siempre hay al menos un lote (vacío
+        si el rango no toca ningún archivo) para la base principal.
+        """
+        months = self.archives_for_range(start_date, end_date)
+        batches = [months[i:i + MAX_ATTACHED] for i in range(0, len(months), MAX_ATTACHED)]
+        return batches or [[]]
+
+    @contextmanager
+    def attached(self, conn, months: List[str]):
+        """Adjuntar los archivos de los meses indicados y devolver sus esquemas"""
+        schemas = []
+        try:
+            for month in months:
+                schema = f"archive_{month[:4]}_{month[5:7]}"
+                conn.execute("ATTACH DATABASE ? AS " + schema, (self.archive_path(month),))
+                schemas.append(schema)
+            yield schemas
+        finally:
+            for schema in schemas:
+                try:
+                    conn.execute("DETACH DATABASE " + schema)
+                except Exception as e:
+                    logger.warning(f"No se pudo desadjuntar {schema}: {e}")
+
+    def months_to_archive(self, now: datetime = None) -> List[str]:
+        """Meses cerrados con datos en la base principal que ya se pueden archivar"""
+        now = now or datetime.now(timezone.utc)
+        cutoff_month = shift_month(now.strftime('%Y-%m'), -self.keep_months)
+        cutoff, _ = month_bounds(cutoff_month)
+
+        conn = self._db.get_connection()
+        try:
+            oldest = None
+            for table in ARCHIVED_TABLES:
+                row = conn.execute(f"SELECT MIN(created_at) FROM {table}").fetchone()
+                if row and row[0] and (oldest is None or row[0] < oldest):
+                    oldest = row[0]
+        finally:
+            conn.close()
+
+        months = []
+        if oldest:
+            month = oldest[:7]
+            while month_bounds(month)[0] < cutoff:
+                months.append(month)
+                month = shift_month(month, 1)
+        return months
+
+    def _ensure_archive_table(self, conn, table: str) -> List[str]:
+        """Crear la tabla en el archivo con el DDL de la principal; devolver sus columnas"""
+        ddl = conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()[0]
+        ddl = re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?["`\[]?\w+["`\]]?',
+                     f'CREATE TABLE IF NOT EXISTS archive.{table}', ddl, count=1)
+        conn.execute(ddl)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_created_at ON {table} (created_at)")
+        conn.commit()
+
+        main_columns = {row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")}
+        return [row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})")
+                if row[1] in main_columns]
+
+    def _move_rows(self, conn, table: str, start: str, end: str, pause: float) -> int:
+        """Mover las filas de un mes por bloques de id"""
+        columns = ', '.join(self._ensure_archive_table(conn, table))
+        moved = 0
+
+        while True:
+            ids = conn.execute(f'''
+                SELECT id FROM main.{table}
+                WHERE created_at >= ? AND created_at < ?
+                ORDER BY id LIMIT ?
+            ''', (start, end, self.chunk_size)).fetchall()
+            if not ids:
+                break
+            low, high = ids[0][0], ids[-1][0]
+            chunk = (start, end, low, high)
+
+            # Primero se confirma la copia y después el borrado: con WAL un
+            # commit que toca dos ficheros no es atómico entre ellos, y así un
+            # corte solo puede dejar duplicados que INSERT OR IGNORE absorbe
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(f'''
+                INSERT OR IGNORE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table}
+                WHERE created_at >= ? AND created_at < ? AND id BETWEEN ? AND ?
+            ''', chunk)
+            conn.commit()
+
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(f'''
+                DELETE FROM main.{table}
+                WHERE created_at >= ? AND created_at < ? AND id BETWEEN ? AND ?
+            ''', chunk)
+            conn.commit()
+
+            moved += len(ids)
+            if pause:
+                time.sleep(pause)
+
+        return moved
+
+    def archive_month(self, month: str, pause: float = 0.0) -> Optional[Dict[str, int]]:
+        """
+        Archivar un mes cerrado
+
+        Returns:
+            Filas movidas por tabla, o None si el mes no se puede archivar
+        """
+        start, end = month_bounds(month)
+        if end > datetime.now(timezone.utc).strftime('%Y-%m-%d'):
+            logger.warning(f"El mes {month} no está cerrado, no se archiva")
+            return None
+
+        # El resumen de ventas sale de sales_daily_rollup: no sacar ventas de
+        # la base principal antes de que el backfill las haya agregado
+        if not self._db.is_rollup_ready():
+            logger.warning("Rollup de ventas incompleto, se pospone el archivado")
+            return None
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        conn = self._db.get_connection()
+        moved = {}
+        try:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path(month),))
+            try:
+                for table in ARCHIVED_TABLES:
+                    moved[table] = self._move_rows(conn, table, start, end, pause)
+            finally:
+                conn.execute("DETACH DATABASE archive")
+        except Exception as e:
+            logger.error(f"Error al archivar el mes {month}: {e}")
+            return None
+        finally:
+            conn.close()
+
+        logger.info(f"Mes {month} archivado: {moved}")
+        return moved
+
+    def archive_closed_months(self, pause: float = 0.05) -> Dict[str, Dict[str, int]]:
+        """Archivar todos los meses cerrados anteriores a los que se mantienen"""
+        results = {}
+        for month in self.months_to_archive():
+            moved = self.archive_month(month, pause)
+            if moved is None:
+                break
+            results[month] = moved
+        return results
+
+
+monthly_archiver = MonthlyArchiver()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(monthly_archiver.archive_closed_months())
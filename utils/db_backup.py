@@ -0,0 +1,328 @@
+"""
+Backups en caliente de la base de datos
+
+Las copias se hacen con la API de backup de SQLite (sqlite3.Connection.backup)
+por bloques de páginas, con una pausa entre bloques para no quitarle el disco
+a las compras en curso. Con WAL los lectores no bloquean a los escritores, así
+que una venta nunca espera al backup. Cada commit de otra conexión reinicia la
+copia por pasos; si se reinicia max_restarts veces (la máquina no deja de
+escribir) se copia en un único paso, que lee una instantánea consistente.
+
+Además de copias completas se pueden guardar instantáneas diferenciales: solo
+las páginas que cambiaron respecto a la última copia completa. Restaurar una
+diferencial es copiar su base y sobrescribir esas páginas.
+
+Cada copia se verifica en un hilo en segundo plano abriéndola (restaurada si
+es diferencial) y ejecutando PRAGMA integrity_check.
+
+Uso como script:
+    python utils/db_backup.py [--diff]
+"""
+import sys
+import os
+import json
+import glob
+import shutil
+import struct
+import sqlite3
+import tempfile
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+FULL_SUFFIX = '.full.db'
+DIFF_SUFFIX = '.diff'
+DIFF_MAGIC = b'VMDIFF1\n'
+PAGE_HEADER = struct.Struct('>I')
+
+
+def _page_size(path: str) -> int:
+    """Tamaño de página de un fichero SQLite (leído de la cabecera)"""
+    with open(path, 'rb') as f:
+        f.seek(16)
+        size = struct.unpack('>H', f.read(2))[0]
+    return 65536 if size == 1 else size
+
+
+class _BackupRestarted(Exception):
+    """La copia por pasos se ha reiniciado demasiadas veces"""
+
+
+class BackupManager:
+    """Copias completas y diferenciales con retención y verificación"""
+
+    def __init__(self, db_path: str = None, backup_dir: str = None,
+                 pages_per_step: int = None, step_pause: float = None,
+                 keep_full: int = None, full_every: int = None, max_restarts: int = None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        self.backup_dir = backup_dir or Config.DB_BACKUP_DIR
+        self.pages_per_step = pages_per_step or Config.DB_BACKUP_PAGES_PER_STEP
+        self.step_pause = Config.DB_BACKUP_STEP_PAUSE_MS / 1000.0 if step_pause is None else step_pause
+        self.keep_full = keep_full or Config.DB_BACKUP_KEEP_FULL
+        self.full_every = Config.DB_BACKUP_FULL_EVERY if full_every is None else full_every
+        self.max_restarts = Config.DB_BACKUP_MAX_RESTARTS if max_restarts is None else max_restarts
+        self._lock = threading.Lock()
+        self._verify_thread = None
+        self.last_backup = None
+        self.last_verification = None
+
+    # Copia con la API de backup
+
+    def backup(self, dest_path: str) -> Dict:
+        """
+        Copiar la base de datos a dest_path con la API de backup
+
+        Returns:
+            Dict con páginas copiadas, pasos, reinicios y duración
+        """
+        steps = 0
+        restarts = 0
+        copied = 0
+
+        def _progress(status, remaining, total):
+            nonlocal steps, restarts, copied
+            steps += 1
+            # Si hay menos páginas copiadas que en el paso anterior, un commit
+            # de otra conexión ha hecho que SQLite empiece de nuevo
+            if total - remaining < copied:
+                restarts += 1
+                if restarts > self.max_restarts:
+                    raise _BackupRestarted()
+            copied = total - remaining
+            # La API solo duerme si la base está bloqueada; esta pausa reparte
+            # la copia en el tiempo aunque no haya contención
+            if remaining and self.step_pause:
+                time.sleep(self.step_pause)
+
+        start = time.perf_counter()
+        single_step = False
+        source = sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT)
+        dest = sqlite3.connect(dest_path)
+        try:
+            try:
+                source.backup(dest, pages=self.pages_per_step, progress=_progress)
+            except _BackupRestarted:
+                logger.warning(f"Backup reiniciado {restarts} veces por escrituras concurrentes, "
+                               f"copiando en un solo paso")
+                single_step = True
+                steps += 1
+                source.backup(dest, pages=-1)
+            page_count = dest.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            dest.close()
+            source.close()
+
+        return {
+            'path': dest_path,
+            'pages': page_count,
+            'steps': steps,
+            'restarts': restarts,
+            'single_step': single_step,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1)
+        }
+
+    # Instantáneas completas y diferenciales
+
+    def _snapshot_name(self) -> str:
+        return os.path.join(self.backup_dir, 'vending_' + datetime.now().strftime('%Y%m%d_%H%M%S_%f'))
+
+    def list_snapshots(self) -> List[str]:
+        """Instantáneas (completas y diferenciales) de la más antigua a la más reciente"""
+        paths = glob.glob(os.path.join(self.backup_dir, 'vending_*' + FULL_SUFFIX))
+        paths += glob.glob(os.path.join(self.backup_dir, 'vending_*' + DIFF_SUFFIX))
+        return sorted(paths, key=os.path.basename)
+
+    def _read_diff_header(self, path: str) -> Dict:
+        with open(path, 'rb') as f:
+            if f.readline() != DIFF_MAGIC:
+                raise ValueError(f"{path} no es una instantánea diferencial")
+            return json.loads(f.readline())
+
+    def _write_diff(self, base_path: str, new_path: str, diff_path: str) -> int:
+        """Guardar las páginas de new_path que difieren de base_path"""
+        page_size = _page_size(new_path)
+        page_count = os.path.getsize(new_path) // page_size
+        header = {
+            'base': os.path.basename(base_path),
+            'page_size': page_size,
+            'page_count': page_count
+        }
+        changed = 0
+        with open(base_path, 'rb') as base, open(new_path, 'rb') as new, open(diff_path, 'wb') as out:
+            out.write(DIFF_MAGIC)
+            out.write(json.dumps(header).encode() + b'\n')
+            for page_no in range(page_count):
+                page = new.read(page_size)
+                if page != base.read(page_size):
+                    out.write(PAGE_HEADER.pack(page_no))
+                    out.write(page)
+                    changed += 1
+        return changed
+
+    def restore_snapshot(self, snapshot_path: str, dest_path: str):
+        """Reconstruir una instantánea (completa o diferencial) en dest_path"""
+        if snapshot_path.endswith(FULL_SUFFIX):
+            shutil.copyfile(snapshot_path, dest_path)
+            return
+
+        header = self._read_diff_header(snapshot_path)
+        page_size = header['page_size']
+        shutil.copyfile(os.path.join(os.path.dirname(snapshot_path), header['base']), dest_path)
+        with open(snapshot_path, 'rb') as diff, open(dest_path, 'r+b') as out:
+            diff.readline()
+            diff.readline()
+            while True:
+                raw = diff.read(PAGE_HEADER.size)
+                if not raw:
+                    break
+                page_no = PAGE_HEADER.unpack(raw)[0]
+                out.seek(page_no * page_size)
+                out.write(diff.read(page_size))
+            out.truncate(header['page_count'] * page_size)
+
+    def create_snapshot(self, differential: bool = False, verify: bool = True) -> Optional[Dict]:
+        """
+        Crear una instantánea: diferencial respecto a la última completa si
+        se pide y hay base válida (y no se han acumulado full_every
+        diferenciales), o completa en otro caso. Después aplica la retención
+        y lanza la verificación en segundo plano.
+
+        Returns:
+            Dict con el resultado, o None si falló
+        """
+        with self._lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            name = self._snapshot_name()
+            tmp_path = name + '.tmp'
+            try:
+                result = self.backup(tmp_path)
+
+                base = self._differential_base() if differential else None
+                if base and _page_size(base) == _page_size(tmp_path):
+                    path = name + DIFF_SUFFIX
+                    result['changed_pages'] = self._write_diff(base, tmp_path, path)
+                    result['base'] = base
+                    os.remove(tmp_path)
+                else:
+                    path = name + FULL_SUFFIX
+                    os.replace(tmp_path, path)
+                result['path'] = path
+                result['type'] = 'differential' if path.endswith(DIFF_SUFFIX) else 'full'
+                result['size'] = os.path.getsize(path)
+            except Exception as e:
+                logger.error(f"Error al crear la instantánea de la base de datos: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return None
+
+            self.apply_retention()
+            self.last_backup = result
+            logger.info(f"Instantánea {result['type']} creada en {path} "
+                        f"({result['pages']} páginas, {result['duration_ms']} ms)")
+
+        if verify:
+            self.verify_async(path)
+        return result
+
+    def _differential_base(self) -> Optional[str]:
+        """Última copia completa, si aún no acumula full_every diferenciales"""
+        diffs = 0
+        for path in reversed(self.list_snapshots()):
+            if path.endswith(FULL_SUFFIX):
+                return path if diffs < self.full_every else None
+            diffs += 1
+        return None
+
+    def apply_retention(self) -> List[str]:
+        """Conservar las keep_full copias completas más recientes y sus diferenciales"""
+        snapshots = self.list_snapshots()
+        fulls = [p for p in snapshots if p.endswith(FULL_SUFFIX)]
+        keep = {os.path.basename(p) for p in fulls[-self.keep_full:]}
+
+        removed = []
+        for path in snapshots:
+            if path.endswith(FULL_SUFFIX):
+                base = os.path.basename(path)
+            else:
+                try:
+                    base = self._read_diff_header(path)['base']
+                except Exception:
+                    base = None
+            if base not in keep:
+                os.remove(path)
+                removed.append(path)
+
+        if removed:
+            logger.info(f"Retención de backups: eliminadas {len(removed)} instantáneas")
+        return removed
+
+    # Verificación
+
+    def verify(self, snapshot_path: str) -> Dict:
+        """Restaurar la instantánea en un temporal y ejecutar PRAGMA integrity_check"""
+        start = time.perf_counter()
+        result = {'path': snapshot_path, 'ok': False, 'errors': []}
+        tmp_dir = tempfile.mkdtemp(prefix='vending_verify_')
+        try:
+            restored = os.path.join(tmp_dir, 'restored.db')
+            self.restore_snapshot(snapshot_path, restored)
+            conn = sqlite3.connect(restored)
+            try:
+                rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+                conn.execute("SELECT COUNT(*) FROM sales").fetchone()
+            finally:
+                conn.close()
+            result['ok'] = rows == ['ok']
+            result['errors'] = [] if result['ok'] else rows
+        except Exception as e:
+            result['errors'] = [str(e)]
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        result['duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        if result['ok']:
+            logger.info(f"Backup verificado: {snapshot_path}")
+        else:
+            logger.error(f"Backup corrupto o ilegible {snapshot_path}: {result['errors']}")
+        self.last_verification = result
+        return result
+
+    def verify_async(self, snapshot_path: str) -> threading.Thread:
+        """Verificar una instantánea en un hilo en segundo plano"""
+        self._verify_thread = threading.Thread(
+            target=self.verify, args=(snapshot_path,), name='backup-verify', daemon=True
+        )
+        self._verify_thread.start()
+        return self._verify_thread
+
+    def wait_for_verification(self, timeout: float = None) -> Optional[Dict]:
+        """Esperar a la verificación en curso y devolver su resultado"""
+        if self._verify_thread is not None:
+            self._verify_thread.join(timeout)
+        return self.last_verification
+
+    def get_stats(self) -> Dict:
+        """Estado de la última copia y de su verificación"""
+        return {
+            'last_backup': self.last_backup,
+            'last_verification': self.last_verification,
+            'snapshots': len(self.list_snapshots())
+        }
+
+
+backup_manager = BackupManager()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    snapshot = backup_manager.create_snapshot(differential='--diff' in sys.argv)
+    if snapshot:
+        print(snapshot)
+        print(backup_manager.wait_for_verification())
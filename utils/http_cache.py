@@ -0,0 +1,126 @@
+"""
+Respuestas JSON con ETag derivado de versiones (GET condicional)
+
+Los endpoints que sondea el kiosco (/api/doors, /api/products,
+/api/machine/config) dependen solo de la versión del catálogo de productos y
+de la versión de la configuración. El ETag se construye con esas versiones,
+así que si el cliente envía If-None-Match con el ETag actual se responde 304
+sin leer productos ni serializar nada. Opcionalmente el cuerpo ya serializado
+se guarda por versión, de modo que una consulta repetida con otro cliente es
+una búsqueda en un diccionario.
+
+Los contadores de versión viven en memoria y vuelven a empezar en cada
+arranque, así que el ETag lleva además una época de arranque del proceso: tras
+un reinicio ningún ETag antiguo coincide y el cliente recibe el cuerpo nuevo.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from flask import Response, current_app, request
+from config import Config
+
+
+# Época de arranque del proceso (distinta en cada reinicio)
+BOOT_EPOCH = format(time.time_ns(), 'x')
+
+
+class VersionedResponseCache:
+    """Caché LRU de cuerpos JSON serializados, indexada por (endpoint, versiones)"""
+
+    def __init__(self, max_entries: int = 32, enabled: bool = True, epoch: str = None):
+        self.max_entries = max(1, max_entries)
+        self.enabled = enabled
+        self.epoch = BOOT_EPOCH if epoch is None else epoch
+        self._entries: 'OrderedDict[Tuple, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'not_modified': 0, 'hits': 0, 'misses': 0}
+
+    def make_etag(self, name: str, versions: Tuple) -> str:
+        """ETag fuerte (sin comillas) a partir del endpoint, la época de arranque y las versiones"""
+        return '-'.join([name, self.epoch] + [str(v) for v in versions])
+
+    def _get(self, key: Tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def _put(self, key: Tuple, body: bytes):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def respond(self, name: str, get_versions: Callable[[], Optional[Tuple]],
+                build: Callable[[], Any]) -> Response:
+        """
+        Responder con el JSON de build() o con 304 si el cliente ya lo tiene
+
+        Args:
+            name: Nombre del endpoint (parte del ETag)
+            get_versions: Versiones de las que depende la respuesta; None si
+                no se pueden conocer (entonces no hay ETag ni caché)
+            build: Construye el payload (solo se llama si hace falta)
+        """
+        versions = get_versions()
+        if versions is None:
+            return self._json_response(build())
+
+        etag = self.make_etag(name, versions)
+        if request.if_none_match.contains(etag):
+            self._count('not_modified')
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        key = (name, versions)
+        body = self._get(key) if self.enabled else None
+        if body is not None:
+            self._count('hits')
+        else:
+            self._count('misses')
+            body = current_app.json.dumps(build()).encode('utf-8')
+            # Si algo cambió mientras se construía, el cuerpo puede ser más nuevo
+            # que su ETag: se sirve, pero sin guardarlo
+            if self.enabled and get_versions() == versions:
+                self._put(key, body)
+
+        response = self._json_response_bytes(body)
+        response.set_etag(etag)
+        # El navegador revalida siempre con If-None-Match en lugar de usar su copia a ciegas
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    @staticmethod
+    def _json_response_bytes(body: bytes) -> Response:
+        return Response(body, mimetype='application/json')
+
+    def _json_response(self, payload: Any) -> Response:
+        return self._json_response_bytes(current_app.json.dumps(payload).encode('utf-8'))
+
+    def clear(self):
+        """Vaciar la caché de cuerpos serializados"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener métricas (304 servidos, aciertos y fallos de la caché)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['enabled'] = self.enabled
+        return stats
+
+
+response_cache = VersionedResponseCache(
+    max_entries=Config.API_RESPONSE_CACHE_ENTRIES,
+    enabled=Config.API_RESPONSE_CACHE
+)
@@ -1,209 +1,499 @@
 """
-Script de migración para actualizar la base de datos
-Migra de la estructura antigua a la nueva con separación de puertas y productos
+Motor de migraciones versionadas de la base de datos
+
+Cada migración tiene un número de versión y se aplica una sola vez; las
+versiones aplicadas quedan registradas en la tabla schema_version. Al
+arrancar se lee la versión una única vez y, si el esquema ya está al día,
+no se ejecuta ningún DDL.
+
+Las migraciones pueden incluir un paso "online" de relleno (backfill) que
+procesa tablas grandes por bloques, cada uno en su propia transacción corta,
+para no retener el bloqueo de escritura durante minutos en máquinas con
+años de ventas.
+
+Uso como script:
+    python utils/migrate_database.py
 """
+import sys
+import os
 import sqlite3
 import logging
-from pathlib import Path
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def migrate_database():
-    """Migrar base de datos a la nueva estructura"""
-    db_path = "vending_machine.db"
-    
-    if not Path(db_path).exists():
-        logger.info("No hay base de datos existente, se creará nueva")
-        return True
-    
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Verificar si ya existe la columna door_id
-        cursor.execute("PRAGMA table_info(products)")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        if 'door_id' in columns:
-            logger.info("La base de datos ya está migrada")
-            conn.close()
-            return True
-        
-        logger.info("Iniciando migración de base de datos...")
-        
-        # 1. Hacer backup de datos existentes
-        cursor.execute("SELECT * FROM products")
-        old_products = cursor.fetchall()
-        
-        logger.info(f"Respaldando {len(old_products)} productos existentes")
-        
-        # 2. Renombrar tabla antigua
-        cursor.execute("ALTER TABLE products RENAME TO products_old")
-        
-        # 3. Crear nueva estructura de tablas
-        cursor.execute('''
-            CREATE TABLE products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                price REAL NOT NULL,
-                stock INTEGER NOT NULL DEFAULT 0,
-                door_id TEXT UNIQUE NOT NULL,
-                image_url TEXT,
-                description TEXT,
-                active BOOLEAN DEFAULT 1,
-                min_stock INTEGER DEFAULT 0,
-                max_stock INTEGER DEFAULT 10,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER,
-                door_id TEXT NOT NULL,
-                payment_method TEXT NOT NULL,
-                amount REAL NOT NULL,
-                status TEXT NOT NULL,
-                payment_id TEXT,
-                quantity INTEGER DEFAULT 1,
-                dispensed BOOLEAN DEFAULT 0,
-                dispensed_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (product_id) REFERENCES products (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS restocks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER,
-                door_id TEXT NOT NULL,
-                quantity_added INTEGER NOT NULL,
-                previous_stock INTEGER,
-                new_stock INTEGER,
-                operator TEXT,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (product_id) REFERENCES products (id)
-            )
-        ''')
-        
+# Índices secundarios: (nombre, tabla, columnas)
+INDEXES = [
+    ('idx_sales_created_at', 'sales', 'created_at'),
+    ('idx_sales_door_created_at', 'sales', 'door_id, created_at'),
+    ('idx_sales_payment_id', 'sales', 'payment_id'),
+    ('idx_restocks_door_created_at', 'restocks', 'door_id, created_at'),
+    ('idx_system_logs_created_at', 'system_logs', 'created_at'),
+    ('idx_door_maintenance_door_created_at', 'door_maintenance', 'door_id, created_at'),
+]
+
+# Versión que crea sales_daily_rollup (su backfill debe terminar antes de usarla)
+SALES_ROLLUP_VERSION = 4
+
+
+class Migration:
+    """
+    Paso de migración
+
+    Args:
+        version: Número de versión (orden de aplicación)
+        description: Descripción legible
+        apply: Función(cursor) con el DDL; se ejecuta en una transacción
+        backfill: Función(cursor, last_key, chunk_size) -> nuevo last_key o None
+                  al terminar; se ejecuta por bloques después de `apply`
+        chunk_size: Filas por bloque del backfill
+    """
+
+    def __init__(self, version: int, description: str,
+                 apply: Callable[[sqlite3.Cursor], None] = None,
+                 backfill: Callable[[sqlite3.Cursor, Optional[str], int], Optional[str]] = None,
+                 chunk_size: int = 500):
+        self.version = version
+        self.description = description
+        self.apply = apply
+        self.backfill = backfill
+        self.chunk_size = chunk_size
+
+
+def _table_columns(cursor: sqlite3.Cursor, table: str) -> List[str]:
+    """Obtener las columnas de una tabla"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [col[1] for col in cursor.fetchall()]
+
+
+def _table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
+    """Verificar si existe una tabla"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+
+# Migraciones
+
+def _create_base_schema(cursor: sqlite3.Cursor):
+    """v1: Tablas base de la máquina expendedora"""
+    # Tabla de productos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            stock INTEGER NOT NULL DEFAULT 0,
+            door_id TEXT UNIQUE NOT NULL,
+            image_url TEXT,
+            description TEXT,
+            active BOOLEAN DEFAULT 1,
+            min_stock INTEGER DEFAULT 0,
+            max_stock INTEGER DEFAULT 10,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla de ventas/transacciones
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            door_id TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            amount REAL NOT NULL,
+            status TEXT NOT NULL,
+            payment_id TEXT,
+            quantity INTEGER DEFAULT 1,
+            dispensed BOOLEAN DEFAULT 0,
+            dispensed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+
+    # Tabla de reposiciones/stock
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS restocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            door_id TEXT NOT NULL,
+            quantity_added INTEGER NOT NULL,
+            previous_stock INTEGER,
+            new_stock INTEGER,
+            operator TEXT,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+
+    # Tabla de mantenimiento de puertas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS door_maintenance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            door_id TEXT NOT NULL,
+            action TEXT NOT NULL,
+            status TEXT,
+            notes TEXT,
+            operator TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla de logs del sistema
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            level TEXT NOT NULL,
+            message TEXT NOT NULL,
+            module TEXT,
+            door_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla de configuración
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            description TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _migrate_legacy_slots(cursor: sqlite3.Cursor):
+    """v2: Migrar la estructura antigua (products.slot y transactions) a puertas y ventas"""
+    if 'door_id' in _table_columns(cursor, 'products'):
+        return
+
+    logger.info("Migrando productos de slots a puertas...")
+
+    # Mapear slots antiguos a door_ids nuevos
+    slot_to_door = {
+        'slot_1': 'A1',
+        'slot_2': 'A2',
+        'slot_3': 'B1',
+        'slot_4': 'B2'
+    }
+
+    cursor.execute("SELECT * FROM products")
+    old_products = cursor.fetchall()
+    logger.info(f"Respaldando {len(old_products)} productos existentes")
+
+    # Reconstruir la tabla (crear nueva, copiar, borrar la vieja y renombrar la
+    # nueva) en lugar de renombrar la vieja: SQLite reescribiría las FK de
+    # sales y restocks, creadas en v1, para que apuntaran a la tabla borrada
+    cursor.execute('''
+        CREATE TABLE products_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            stock INTEGER NOT NULL DEFAULT 0,
+            door_id TEXT UNIQUE NOT NULL,
+            image_url TEXT,
+            description TEXT,
+            active BOOLEAN DEFAULT 1,
+            min_stock INTEGER DEFAULT 0,
+            max_stock INTEGER DEFAULT 10,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    for old_product in old_products:
+        # old_product: (id, name, price, stock, slot, image_url, description, active, created_at, updated_at)
+        door_id = slot_to_door.get(old_product[4], 'A1')  # Default a A1 si no encuentra mapping
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS door_maintenance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                door_id TEXT NOT NULL,
-                action TEXT NOT NULL,
-                status TEXT,
-                notes TEXT,
-                operator TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # 4. Migrar datos existentes
-        # Mapear slots antiguos a door_ids nuevos
-        slot_to_door = {
-            'slot_1': 'A1',
-            'slot_2': 'A2', 
-            'slot_3': 'B1',
-            'slot_4': 'B2'
-        }
-        
-        # Insertar productos migrados
-        for old_product in old_products:
-            # old_product: (id, name, price, stock, slot, image_url, description, active, created_at, updated_at)
-            old_slot = old_product[4]
-            door_id = slot_to_door.get(old_slot, 'A1')  # Default a A1 si no encuentra mapping
-            
-            cursor.execute('''
-                INSERT INTO products (name, price, stock, door_id, image_url, description, active, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                old_product[1],  # name
-                old_product[2],  # price
-                old_product[3],  # stock
-                door_id,         # door_id (nuevo)
-                old_product[5],  # image_url
-                old_product[6],  # description
-                old_product[7],  # active
-                old_product[8],  # created_at
-                old_product[9]   # updated_at
-            ))
-        
-        # 5. Migrar transacciones a sales
+            INSERT OR IGNORE INTO products_new (id, name, price, stock, door_id, image_url, description, active, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (old_product[0], old_product[1], old_product[2], old_product[3], door_id,
+              old_product[5], old_product[6], old_product[7], old_product[8], old_product[9]))
+
+    # Migrar transacciones a sales
+    if _table_exists(cursor, 'transactions'):
         cursor.execute("SELECT * FROM transactions")
         old_transactions = cursor.fetchall()
-        
         logger.info(f"Migrando {len(old_transactions)} transacciones")
-        
+
         for transaction in old_transactions:
             # transaction: (id, product_id, payment_method, amount, status, payment_id, created_at)
-            # Obtener door_id del producto
-            cursor.execute("SELECT door_id FROM products WHERE id = ?", (transaction[1],))
+            cursor.execute("SELECT door_id FROM products_new WHERE id = ?", (transaction[1],))
             door_result = cursor.fetchone()
             door_id = door_result[0] if door_result else 'A1'
-            
+
             cursor.execute('''
                 INSERT INTO sales (product_id, door_id, payment_method, amount, status, payment_id, quantity, dispensed, created_at)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                transaction[1],  # product_id
-                door_id,         # door_id
-                transaction[2],  # payment_method
-                transaction[3],  # amount
-                transaction[4],  # status
-                transaction[5],  # payment_id
-                1,               # quantity (default)
-                transaction[4] == 'completed',  # dispensed
-                transaction[6]   # created_at
-            ))
-        
-        # 6. Añadir productos para las puertas restantes (G1, G2, etc.)
-        new_products = [
-            ('C1', 'Kit Kat', 1.8, 6, '/static/images/kitkat.jpg', 'Barrita de chocolate con galleta'),
-            ('C2', 'Twix', 1.8, 4, '/static/images/twix.jpg', 'Barrita de caramelo y galleta'),
-            ('D1', 'Chocolate', 2.5, 3, '/static/images/chocolate.jpg', 'Tableta de chocolate'),
-            ('D2', 'Chips', 1.5, 0, '/static/images/chips.jpg', 'Patatas fritas'),
-            ('E1', 'Galletas', 1.2, 0, '/static/images/galletas.jpg', 'Paquete de galletas'),
-            ('E2', 'Chicles', 0.5, 10, '/static/images/chicles.jpg', 'Chicles de menta'),
-            ('F1', 'Agua con Gas', 1.0, 5, '/static/images/agua_con_gas.jpg', 'Agua mineral con gas'),
-            ('F2', 'Fanta', 1.5, 0, '/static/images/fanta.jpg', 'Refresco de naranja'),
-            ('G1', 'Red Bull', 2.0, 3, '/static/images/redbull.jpg', 'Bebida energética'),
-            ('G2', 'Sprite', 1.5, 7, '/static/images/sprite.jpg', 'Refresco de lima-limón')
-        ]
-        
-        for door_id, name, price, stock, image, description in new_products:
-            # Verificar si ya existe
-            cursor.execute("SELECT id FROM products WHERE door_id = ?", (door_id,))
-            if not cursor.fetchone():
-                cursor.execute('''
-                    INSERT INTO products (door_id, name, price, stock, image_url, description, active)
-                    VALUES (?, ?, ?, ?, ?, ?, 1)
-                ''', (door_id, name, price, stock, image, description))
-        
-        # 7. Actualizar system_logs para incluir door_id
-        cursor.execute("PRAGMA table_info(system_logs)")
-        log_columns = [col[1] for col in cursor.fetchall()]
-        
-        if 'door_id' not in log_columns:
-            cursor.execute("ALTER TABLE system_logs ADD COLUMN door_id TEXT")
-        
-        # 8. Eliminar tabla antigua
-        cursor.execute("DROP TABLE products_old")
-        cursor.execute("DROP TABLE IF EXISTS transactions")  # Ya migrada a sales
-        
+            ''', (transaction[1], door_id, transaction[2], transaction[3], transaction[4],
+                  transaction[5], 1, transaction[4] == 'completed', transaction[6]))
+
+        cursor.execute("DROP TABLE transactions")
+
+    cursor.execute("DROP TABLE products")
+    cursor.execute("ALTER TABLE products_new RENAME TO products")
+
+    if 'door_id' not in _table_columns(cursor, 'system_logs'):
+        cursor.execute("ALTER TABLE system_logs ADD COLUMN door_id TEXT")
+
+
+def _create_indexes(cursor: sqlite3.Cursor):
+    """v3: Índices secundarios para filtros por fecha, puerta y pago"""
+    for name, table, columns in INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def _create_sales_rollup(cursor: sqlite3.Cursor):
+    """v4: Tabla de agregados diarios de ventas completadas"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily_rollup (
+            day TEXT NOT NULL,
+            door_id TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            sales_count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, door_id, payment_method)
+        ) WITHOUT ROWID
+    ''')
+
+    # Las ventas posteriores a este id las agrega ya el código de ventas;
+    # el backfill solo recorre las anteriores para no contarlas dos veces
+    cursor.execute('''
+        INSERT OR REPLACE INTO settings (key, value, description)
+        SELECT 'rollup_backfill_max_id', COALESCE(MAX(id), 0),
+               'Última venta agregada por el backfill de sales_daily_rollup'
+        FROM sales
+    ''')
+
+
+def _backfill_sales_rollup(cursor: sqlite3.Cursor, last_key: Optional[str], chunk_size: int) -> Optional[str]:
+    """v4 (online): Agregar las ventas históricas por rangos de id"""
+    last_id = int(last_key or 0)
+    cursor.execute("SELECT CAST(value AS INTEGER) FROM settings WHERE key = 'rollup_backfill_max_id'")
+    row = cursor.fetchone()
+    max_id = row[0] if row else 0
+
+    if last_id >= max_id:
+        return None
+
+    upper = min(last_id + chunk_size, max_id)
+    cursor.execute('''
+        INSERT INTO sales_daily_rollup (day, door_id, payment_method, sales_count, revenue)
+        SELECT substr(created_at, 1, 10), door_id, payment_method, COUNT(*), SUM(amount)
+        FROM sales
+        WHERE id > ? AND id <= ? AND status = 'completed'
+        GROUP BY substr(created_at, 1, 10), door_id, payment_method
+        ON CONFLICT (day, door_id, payment_method) DO UPDATE SET
+            sales_count = sales_count + excluded.sales_count,
+            revenue = revenue + excluded.revenue
+    ''', (last_id, upper))
+    return str(upper)
+
+
+MIGRATIONS = [
+    Migration(1, 'Esquema base', _create_base_schema),
+    Migration(2, 'Estructura antigua de slots a puertas', _migrate_legacy_slots),
+    Migration(3, 'Índices secundarios', _create_indexes),
+    Migration(SALES_ROLLUP_VERSION, 'Agregados diarios de ventas', _create_sales_rollup, _backfill_sales_rollup, chunk_size=2000),
+]
+
+
+class MigrationEngine:
+    """Aplicar migraciones versionadas y sus backfills online"""
+
+    def __init__(self, migrations: List[Migration] = None):
+        self.migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+        self._backfill_thread = None
+
+    @property
+    def latest_version(self) -> int:
+        """Versión más reciente conocida por el código"""
+        return self.migrations[-1].version if self.migrations else 0
+
+    def _ensure_version_table(self, cursor: sqlite3.Cursor):
+        """Crear la tabla schema_version si no existe"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                backfill_cursor TEXT,
+                completed BOOLEAN DEFAULT 1
+            )
+        ''')
+
+    def get_state(self, conn) -> Tuple[int, int]:
+        """
+        Leer la versión del esquema y los backfills pendientes en una consulta
+
+        Returns:
+            (versión actual, número de backfills sin completar)
+        """
+        try:
+            row = conn.execute('''
+                SELECT COALESCE(MAX(version), 0), COALESCE(SUM(completed = 0), 0)
+                FROM schema_version
+            ''').fetchone()
+            return row[0], row[1]
+        except sqlite3.OperationalError:
+            # Base de datos sin tabla schema_version
+            return 0, 0
+
+    def is_up_to_date(self, conn) -> bool:
+        """Camino rápido: el esquema está al día y no hay backfills pendientes"""
+        version, pending = self.get_state(conn)
+        return version >= self.latest_version and not pending
+
+    def migrate(self, conn) -> int:
+        """
+        Aplicar las migraciones pendientes, cada una en su propia transacción
+
+        Returns:
+            Versión que tenía la base de datos antes de migrar
+        """
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        self._ensure_version_table(cursor)
         conn.commit()
+
+        from_version, _ = self.get_state(conn)
+
+        for migration in self.migrations:
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # Revisar dentro de la transacción por si otro proceso la aplicó
+                cursor.execute("SELECT 1 FROM schema_version WHERE version = ?", (migration.version,))
+                if cursor.fetchone():
+                    conn.rollback()
+                    continue
+
+                logger.info(f"Aplicando migración v{migration.version}: {migration.description}")
+                if migration.apply:
+                    migration.apply(cursor)
+                cursor.execute('''
+                    INSERT INTO schema_version (version, description, completed)
+                    VALUES (?, ?, ?)
+                ''', (migration.version, migration.description, 0 if migration.backfill else 1))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        return from_version
+
+    def run_backfills(self, connect: Callable, pause: float = 0.0) -> int:
+        """
+        Ejecutar los backfills pendientes por bloques
+
+        Cada bloque es una transacción corta que además guarda el progreso,
+        así que el proceso puede interrumpirse y se reanuda donde quedó.
+
+        Args:
+            connect: Función que devuelve una conexión (p. ej. db_manager.get_connection)
+            pause: Segundos de espera entre bloques para dejar paso a las ventas
+
+        Returns:
+            Número de bloques procesados
+        """
+        by_version = {m.version: m for m in self.migrations}
+        chunks = 0
+
+        conn = connect()
+        try:
+            pending = conn.execute('''
+                SELECT version, backfill_cursor FROM schema_version
+                WHERE completed = 0 ORDER BY version
+            ''').fetchall()
+
+            for version, last_key in pending:
+                migration = by_version.get(version)
+                if migration is None or migration.backfill is None:
+                    conn.execute("UPDATE schema_version SET completed = 1 WHERE version = ?", (version,))
+                    conn.commit()
+                    continue
+
+                logger.info(f"Backfill online de migración v{version}: {migration.description}")
+                while True:
+                    cursor = conn.cursor()
+                    cursor.execute('BEGIN IMMEDIATE')
+                    try:
+                        last_key = migration.backfill(cursor, last_key, migration.chunk_size)
+                        cursor.execute('''
+                            UPDATE schema_version SET backfill_cursor = ?, completed = ?
+                            WHERE version = ?
+                        ''', (last_key, 1 if last_key is None else 0, version))
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    chunks += 1
+                    if last_key is None:
+                        break
+                    if pause:
+                        time.sleep(pause)
+
+                logger.info(f"Backfill de migración v{version} completado")
+        finally:
+            conn.close()
+
+        return chunks
+
+    def wait_for_backfills(self, timeout: float = None) -> bool:
+        """Esperar a que termine el hilo de backfill; True si ya no está en curso"""
+        thread = self._backfill_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def start_backfills(self, connect: Callable, pause: float = 0.05) -> threading.Thread:
+        """Ejecutar los backfills pendientes en un hilo en segundo plano"""
+        if self._backfill_thread is not None and self._backfill_thread.is_alive():
+            return self._backfill_thread
+
+        def _run():
+            try:
+                self.run_backfills(connect, pause)
+            except Exception as e:
+                logger.error(f"Error en backfill de migraciones: {e}")
+
+        self._backfill_thread = threading.Thread(target=_run, name='migration-backfill', daemon=True)
+        self._backfill_thread.start()
+        return self._backfill_thread
+
+
+def migrate_database(db_path: str = None) -> bool:
+    """Migrar la base de datos configurada hasta la última versión"""
+    db_path = db_path or Config.DATABASE_PATH
+    engine = MigrationEngine()
+
+    try:
+        conn = sqlite3.connect(db_path)
+        if engine.is_up_to_date(conn):
+            logger.info("La base de datos ya está migrada")
+            conn.close()
+            return True
+
+        from_version = engine.migrate(conn)
         conn.close()
-        
-        logger.info("✅ Migración completada exitosamente")
+
+        engine.run_backfills(lambda: sqlite3.connect(db_path))
+
+        logger.info(f"✅ Migración completada: v{from_version} -> v{engine.latest_version}")
         return True
-        
+
     except Exception as e:
         logger.error(f"❌ Error durante la migración: {e}")
         return False
 
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     migrate_database()
@@ -3,7 +3,7 @@ Utilidades para mantenimiento y administración del sistema
 """
 import logging
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from database import db_manager
 from config import Config
 
@@ -14,14 +14,20 @@ class MaintenanceUtils:
     
     @staticmethod
     def backup_database(backup_path: str = None) -> bool:
-        """Crear backup de la base de datos"""
+        """
+        Crear backup de la base de datos con la API de backup de SQLite
+        (segura con escritores concurrentes) y verificarlo en segundo plano.
+        Sin backup_path se crea una instantánea en Config.DB_BACKUP_DIR
+        sujeta a la retención configurada.
+        """
+        from utils.db_backup import backup_manager
+        
         if not backup_path:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = f"database/backup_vending_{timestamp}.db"
+            return backup_manager.create_snapshot() is not None
         
         try:
-            import shutil
-            shutil.copy2(Config.DATABASE_PATH, backup_path)
+            backup_manager.backup(backup_path)
+            backup_manager.verify_async(backup_path)
             logger.info(f"Backup creado en: {backup_path}")
             return True
         except Exception as e:
@@ -30,52 +36,51 @@ class MaintenanceUtils:
     
     @staticmethod
     def generate_sales_report(days: int = 7) -> dict:
-        """Generar reporte de ventas"""
+        """Generar reporte de ventas (sobre una instantánea de solo lectura)"""
         try:
-            conn = db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # Fecha de inicio
-            start_date = datetime.now() - timedelta(days=days)
-            
-            # Ventas por día
-            cursor.execute('''
-                SELECT DATE(created_at) as date, COUNT(*) as sales, SUM(amount) as revenue
-                FROM transactions 
-                WHERE status = 'completed' AND created_at >= ?
-                GROUP BY DATE(created_at)
-                ORDER BY date
-            ''', (start_date,))
-            
-            daily_sales = [dict(zip([col[0] for col in cursor.description], row)) 
-                          for row in cursor.fetchall()]
-            
-            # Productos más vendidos
-            cursor.execute('''
-                SELECT p.name, COUNT(*) as quantity, SUM(t.amount) as revenue
-                FROM transactions t
-                JOIN products p ON t.product_id = p.id
-                WHERE t.status = 'completed' AND t.created_at >= ?
-                GROUP BY p.id, p.name
-                ORDER BY quantity DESC
-                LIMIT 10
-            ''', (start_date,))
-            
-            top_products = [dict(zip([col[0] for col in cursor.description], row)) 
-                           for row in cursor.fetchall()]
-            
-            # Métodos de pago
-            cursor.execute('''
-                SELECT payment_method, COUNT(*) as transactions, SUM(amount) as revenue
-                FROM transactions 
-                WHERE status = 'completed' AND created_at >= ?
-                GROUP BY payment_method
-            ''', (start_date,))
+            # Fecha de inicio (created_at se guarda en UTC)
+            start_date = datetime.now(timezone.utc) - timedelta(days=days)
+            start_bound = start_date.strftime('%Y-%m-%d %H:%M:%S')
             
-            payment_methods = [dict(zip([col[0] for col in cursor.description], row)) 
+            with db_manager.read_snapshot() as conn:
+                cursor = conn.cursor()
+                
+                # Ventas por día
+                cursor.execute('''
+                    SELECT DATE(created_at) as date, COUNT(*) as sales, SUM(amount) as revenue
+                    FROM sales 
+                    WHERE status = 'completed' AND created_at >= ?
+                    GROUP BY DATE(created_at)
+                    ORDER BY date
+                ''', (start_bound,))
+                
+                daily_sales = [dict(zip([col[0] for col in cursor.description], row)) 
                               for row in cursor.fetchall()]
-            
-            conn.close()
+                
+                # Productos más vendidos
+                cursor.execute('''
+                    SELECT p.name, COUNT(*) as quantity, SUM(s.amount) as revenue
+                    FROM sales s
+                    JOIN products p ON s.door_id = p.door_id
+                    WHERE s.status = 'completed' AND s.created_at >= ?
+                    GROUP BY p.id, p.name
+                    ORDER BY quantity DESC
+                    LIMIT 10
+                ''', (start_bound,))
+                
+                top_products = [dict(zip([col[0] for col in cursor.description], row)) 
+                               for row in cursor.fetchall()]
+                
+                # Métodos de pago
+                cursor.execute('''
+                    SELECT payment_method, COUNT(*) as transactions, SUM(amount) as revenue
+                    FROM sales 
+                    WHERE status = 'completed' AND created_at >= ?
+                    GROUP BY payment_method
+                ''', (start_bound,))
+                
+                payment_methods = [dict(zip([col[0] for col in cursor.description], row)) 
+                                  for row in cursor.fetchall()]
             
             return {
                 'period': f'{days} días',
@@ -94,11 +99,11 @@ class MaintenanceUtils:
     def check_low_stock(threshold: int = 5) -> list:
         """Verificar productos con stock bajo"""
         try:
-            conn = db_manager.get_connection()
+            conn = db_manager.get_read_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT id, name, stock, slot
+                SELECT id, name, stock, door_id
                 FROM products 
                 WHERE active = 1 AND stock <= ?
                 ORDER BY stock ASC
@@ -204,6 +209,12 @@ class MaintenanceUtils:
             logger.error(f"Error al limpiar logs: {e}")
             return False
 
+    @staticmethod
+    def archive_old_data() -> dict:
+        """Mover los meses cerrados a los ficheros de archivo mensuales"""
+        from utils.db_archive import monthly_archiver
+        return monthly_archiver.archive_closed_months()
+
 
 class AdminAPI:
     """API administrativa para la máquina expendedora"""